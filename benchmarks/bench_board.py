@@ -0,0 +1,64 @@
+# benchmarks/bench_board.py - Đo số nước đi mỗi giây của hai engine bàn cờ
+"""Microbenchmark for make_move + win/draw detection.
+
+Replays the same random games on CaroBoard (list of lists, cell probing) and
+BitboardCaroBoard (per-line int masks, shift-and-AND).
+
+    python benchmarks/bench_board.py [--games 2000] [--size 15] [--win-length 5]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.board import CaroBoard
+from shared.bitboard import BitboardCaroBoard
+
+
+def make_games(count, size, win_length, seed=1):
+    """Danh sách nước đi hợp lệ cho mỗi ván (đánh tới khi thắng hoặc hòa)"""
+    rng = random.Random(seed)
+    games = []
+    for _ in range(count):
+        board = CaroBoard(size, win_length)
+        cells = [(x, y) for y in range(size) for x in range(size)]
+        rng.shuffle(cells)
+        moves = []
+        for x, y in cells:
+            moves.append((x, y))
+            if board.make_move(x, y)[1] != "continue":
+                break
+        games.append(moves)
+    return games
+
+
+def run(name, board_class, games, size, win_length):
+    total = sum(len(g) for g in games)
+    start = time.perf_counter()
+    for moves in games:
+        board = board_class(size, win_length)
+        for x, y in moves:
+            board.make_move(x, y)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<20} {total / elapsed:12.0f} moves/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--games', type=int, default=2000)
+    parser.add_argument('--size', type=int, default=15)
+    parser.add_argument('--win-length', type=int, default=5)
+    args = parser.parse_args()
+
+    games = make_games(args.games, args.size, args.win_length)
+    print(f"{args.games} games, {sum(len(g) for g in games)} moves on "
+          f"{args.size}x{args.size}, {args.win_length} in a row")
+    run("CaroBoard", CaroBoard, games, args.size, args.win_length)
+    run("BitboardCaroBoard", BitboardCaroBoard, games, args.size, args.win_length)
+
+
+if __name__ == "__main__":
+    main()
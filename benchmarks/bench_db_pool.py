@@ -0,0 +1,88 @@
+# benchmarks/bench_db_pool.py - Số lần đăng nhập mỗi giây với nhiều thread (pool kết nối SQLite)
+"""Login queries per second from many threads against CaroDatabase.
+
+Every thread logs in (authenticate_user, the LOGIN read path) in a loop while
+one extra thread keeps committing score updates, like games finishing during
+a login storm. Compares a single shared connection (read_connections=0: every
+query queues on the writer lock) with pooled WAL readers.
+
+    python benchmarks/bench_db_pool.py [--threads 32] [--users 10000] [--seconds 5] [--pools 0,4,8]
+"""
+import argparse
+import contextlib
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.database import CaroDatabase
+
+
+def create_users(db, count):
+    password_hash = db._hash_password('password')
+    with db.writer() as connection:
+        connection.executemany(
+            'INSERT OR IGNORE INTO users (username, password_hash) VALUES (?, ?)',
+            ((f"user{i}", password_hash) for i in range(count)))
+
+
+def run(db_path, read_connections, threads, users, seconds):
+    db = CaroDatabase(db_path, read_connections=read_connections)
+    stop = threading.Event()
+    counts = [0] * threads
+
+    def login(index):
+        rng = random.Random(index)
+        while not stop.is_set():
+            success, _ = db.authenticate_user(f"user{rng.randrange(users)}", 'password', record_login=False)
+            counts[index] += success
+
+    def write():
+        rng = random.Random(-1)
+        while not stop.is_set():
+            db.update_user_score(rng.randrange(1, users), 1)
+            time.sleep(0.001)
+
+    workers = [threading.Thread(target=login, args=(i,)) for i in range(threads)]
+    workers.append(threading.Thread(target=write))
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    time.sleep(seconds)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    db.close()
+    return sum(counts) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--pools', default='0,4,8', help="read pool sizes to compare (0 = shared connection)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, 'bench.db')
+        print(f"{args.threads} threads, {args.users} users, {os.cpu_count()} CPUs")
+        # CaroDatabase in log cho mỗi lần đăng nhập
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            db = CaroDatabase(db_path)
+            create_users(db, args.users)
+            db.close()
+        for pool in [int(p) for p in args.pools.split(',')]:
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                rate = run(db_path, pool, args.threads, args.users, args.seconds)
+            name = "shared connection" if pool == 0 else f"{pool} readers + writer"
+            print(f"{name:<24} {rate:10.0f} logins/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# benchmarks/bench_leaderboard.py - Tốc độ đọc bảng xếp hạng với nhiều user
+"""Leaderboard reads per second for a large users table.
+
+Compares the top-10 page (get_leaderboard) three ways while a score update
+lands between reads: a full sort of users (no index), a walk of the
+idx_users_<key> index, and the in-memory LeaderboardCache.
+
+    python benchmarks/bench_leaderboard.py [--users 100000] [--reads 2000]
+"""
+import argparse
+import contextlib
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.database import CaroDatabase, LEADERBOARD_KEYS
+
+
+def create_users(db, count):
+    rng = random.Random(1)
+    with db.writer() as connection:
+        connection.executemany(
+            'INSERT INTO users (username, password_hash, score, wins, total_games, win_streak) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            ((f"user{i}", 'x', rng.randint(0, 3000), rng.randint(0, 500), rng.randint(0, 1000), rng.randint(0, 20))
+             for i in range(count)))
+
+
+def run(db, reads, users):
+    rng = random.Random(2)
+    start = time.perf_counter()
+    for i in range(reads):
+        db.update_user_score(rng.randint(1, users), rng.randint(-20, 20))
+        db.get_leaderboard(10, LEADERBOARD_KEYS[i % len(LEADERBOARD_KEYS)])
+    return reads / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--reads', type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, 'bench.db')
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            db = CaroDatabase(db_path)
+            create_users(db, args.users)
+            db.close()
+
+        print(f"{args.users} users, top-10 page + one score update per read")
+        for name in ('full sort', 'index', 'cache'):
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                db = CaroDatabase(db_path, leaderboard_size=0 if name != 'cache' else 100)
+                with db.writer() as connection:
+                    for key in LEADERBOARD_KEYS:
+                        if name == 'full sort':
+                            connection.execute(f'DROP INDEX IF EXISTS idx_users_{key}')
+                        else:
+                            connection.execute(f'CREATE INDEX IF NOT EXISTS idx_users_{key} ON users({key} DESC, id)')
+                rate = run(db, max(args.reads // 20, 10) if name == 'full sort' else args.reads, args.users)
+                db.close()
+            print(f"{name:<10} {rate:10.0f} reads/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# benchmarks/bench_matchmaking.py - Mô phỏng hàng đợi tìm trận với người chơi giả
+"""Matchmaking simulator: synthetic players through MatchmakingService.
+
+Players arrive at a fixed rate with ratings drawn from a normal distribution
+and are paired on each tick, all on a simulated clock (no sleeping). Prints
+CPU throughput of the pairing itself, simulated wait-time percentiles and
+match quality (rating gap).
+
+    python benchmarks/bench_matchmaking.py [--players 100000] [--rate 1000] [--tick 0.5]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import deque
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.matchmaking import MatchmakingService
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--players', type=int, default=100000)
+    parser.add_argument('--rate', type=float, default=1000, help="players joining per simulated second")
+    parser.add_argument('--tick', type=float, default=0.5)
+    parser.add_argument('--mean', type=float, default=1000)
+    parser.add_argument('--stddev', type=float, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    clock = [0.0]
+    service = MatchmakingService(tick=args.tick, clock=lambda: clock[0])
+    # Giữ mọi mẫu (không chỉ METRIC_SAMPLES mẫu cuối) để percentile tính trên cả lần chạy
+    service.wait_times, service.rating_gaps = deque(), deque()
+
+    joined, busy, max_queue, tick_end = 0, 0.0, 0, args.tick
+    while joined < args.players or len(service.queue) > 1:
+        start = time.perf_counter()
+        # Người chơi vào đều trong khoảng giữa hai tick
+        while joined < args.players and joined / args.rate < tick_end:
+            clock[0] = joined / args.rate
+            service.enqueue(joined, max(0, rng.gauss(args.mean, args.stddev)))
+            joined += 1
+        clock[0] = tick_end
+        service.tick()
+        busy += time.perf_counter() - start
+        max_queue = max(max_queue, len(service.queue))
+        tick_end += args.tick
+        if tick_end > 3600:
+            break
+
+    stats = service.stats()
+    print(f"{args.players} players, {args.rate:.0f}/s arriving, tick {args.tick}s")
+    print(f"matches            {stats['matches']} in {stats['ticks']} ticks ({clock[0]:.0f}s simulated)")
+    print(f"throughput         {stats['matches'] / busy:12.0f} matches/s of CPU ({busy:.2f}s total)")
+    print(f"queue              max {max_queue}, left {stats['queued']}")
+    print(f"wait (simulated)   p50 {stats['wait_p50']:.1f}s  p90 {stats['wait_p90']:.1f}s  p99 {stats['wait_p99']:.1f}s")
+    print(f"rating gap         avg {stats['rating_gap_avg']:.1f}  p95 {stats['rating_gap_p95']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# benchmarks/bench_memory.py - Bộ nhớ cho phòng / phiên kết nối: dict tự do vs lớp __slots__
+"""Memory of 100k rooms and 100k client sessions.
+
+Compares the old free-form dicts with the Room / ClientSession classes in
+server/models.py. All rooms share one board and all sessions share one
+connection so only the per-record cost is measured (players/spectators
+lists and the per-room RLock are included, like in the server).
+
+    python benchmarks/bench_memory.py [--count 100000]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.models import Room, ClientSession
+from shared.board import CaroBoard
+from shared.protocol import FRAMING_JSON
+
+
+def dict_room(room_id, owner, board):
+    """Bố cục cũ của RoomManager.create_room"""
+    return {
+        'id': room_id, 'players': [owner], 'board': board,
+        'board_size': board.size, 'win_length': board.win_length,
+        'status': 'waiting', 'owner': owner, 'password': None, 'time_limit': 30,
+        'turn_deadline': None, 'spectators': [], 'match_pending': False,
+        'is_frozen': False, 'saved_remaining_time': 0,
+        'lock': threading.RLock(), 'removed': False,
+    }
+
+
+def dict_session(connection):
+    """Bố cục cũ của UserManager.add_client"""
+    return {
+        'connection': connection, 'framing': FRAMING_JSON, 'lobby_deltas': False,
+        'username': None, 'user_id': None, 'room_id': None, 'display_name': None,
+        'avatar_id': 0, 'last_activity': time.time(),
+    }
+
+
+def measure(name, build, count):
+    tracemalloc.start()
+    start = time.perf_counter()
+    objects = [build(i) for i in range(count)]
+    elapsed = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<24} {size / 2**20:8.1f} MiB  {size / count:6.0f} B/obj  {elapsed:6.2f} s")
+    del objects
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=100000)
+    args = parser.parse_args()
+
+    board, connection = CaroBoard(), object()
+    print(f"{args.count} objects each")
+    old = measure("rooms (dict)", lambda i: dict_room(f"room_{i}", i, board), args.count)
+    new = measure("rooms (Room)", lambda i: Room(f"room_{i}", i, board), args.count)
+    print(f"{'':<24} {1 - new / old:8.0%} less")
+    old = measure("sessions (dict)", lambda i: dict_session(connection), args.count)
+    new = measure("sessions (ClientSession)", lambda i: ClientSession(connection), args.count)
+    print(f"{'':<24} {1 - new / old:8.0%} less")
+
+
+if __name__ == "__main__":
+    main()
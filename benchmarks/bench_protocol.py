@@ -0,0 +1,114 @@
+# benchmarks/bench_protocol.py - Đo tốc độ tách message phía server (bytes/giây)
+"""Microbenchmark for the server receive path under batched MOVE/CHAT traffic.
+
+Compares the old ``str`` buffer + brace counting loop from handle_client with
+MessageDecoder fed through ``recv_into``-style writes, for both framings.
+
+    python benchmarks/bench_protocol.py [--messages 20000] [--batch 64]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.protocol import MessageDecoder, encode_message, FRAMING_JSON, FRAMING_LENGTH
+
+RECV_SIZE = 4096
+
+
+def make_traffic(count):
+    messages = []
+    for i in range(count):
+        if i % 4 == 3:
+            messages.append({'type': 'CHAT', 'room_id': 'room_1', 'message': f'Nước đi hay quá {{#{i}}} 👍'})
+        else:
+            messages.append({'type': 'MOVE', 'room_id': 'room_1', 'x': i % 15, 'y': (i * 7) % 15})
+    return messages
+
+
+def legacy_parse(chunks):
+    """Bản sao vòng lặp cũ của handle_client (buffer str + đếm ngoặc từng ký tự)"""
+    count = 0
+    buffer = ""
+    for data in chunks:
+        buffer += data.decode('utf-8', errors='replace')
+        while True:
+            start_index = buffer.find('{')
+            if start_index == -1:
+                buffer = ""
+                break
+            brace_count = 0
+            end_index = -1
+            for i, char in enumerate(buffer[start_index:], start=start_index):
+                if char == '{':
+                    brace_count += 1
+                elif char == '}':
+                    brace_count -= 1
+                    if brace_count == 0:
+                        end_index = i
+                        break
+            if end_index == -1:
+                break
+            json_str = buffer[start_index:end_index + 1]
+            buffer = buffer[end_index + 1:]
+            try:
+                json.loads(json_str)
+                count += 1
+            except json.JSONDecodeError:
+                pass
+    return count
+
+
+def decoder_parse(chunks):
+    """Đường nhận mới: ghi vào buffer cấp phát sẵn rồi tách message"""
+    count = 0
+    decoder = MessageDecoder()
+    for data in chunks:
+        size = len(data)
+        decoder.get_buffer(size)[:size] = data  # Giống recv_into
+        decoder.buffer_updated(size)
+        for _ in decoder:
+            count += 1
+    return count
+
+
+def make_chunks(messages, framing, batch):
+    """Gom `batch` message vào một lần gửi rồi cắt theo kích thước recv"""
+    chunks = []
+    for i in range(0, len(messages), batch):
+        burst = b''.join(encode_message(m, framing) for m in messages[i:i + batch])
+        chunks.extend(burst[j:j + RECV_SIZE] for j in range(0, len(burst), RECV_SIZE))
+    return chunks
+
+
+def run(name, parser, chunks, expected):
+    total_bytes = sum(len(c) for c in chunks)
+    start = time.perf_counter()
+    count = parser(chunks)
+    elapsed = time.perf_counter() - start
+    # The old parser loses messages whose chat text contains braces
+    note = "" if count == expected else f"  (chỉ tách đúng {count}/{expected})"
+    print(f"{name:<28} {total_bytes / elapsed / 1e6:8.2f} MB/s  {count / elapsed:10.0f} msg/s{note}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--batch', type=int, default=64, help="messages per burst")
+    args = parser.parse_args()
+
+    messages = make_traffic(args.messages)
+    json_chunks = make_chunks(messages, FRAMING_JSON, args.batch)
+    length_chunks = make_chunks(messages, FRAMING_LENGTH, args.batch)
+
+    print(f"{args.messages} messages, {args.batch} per burst, recv size {RECV_SIZE}")
+    run("legacy str buffer", legacy_parse, json_chunks, len(messages))
+    run("decoder, json framing", decoder_parse, json_chunks, len(messages))
+    run("decoder, length framing", decoder_parse, length_chunks, len(messages))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# benchmarks/bench_rank.py - Tra thứ hạng của user với 1 triệu user (RankIndex)
+"""Rank lookups per second with a million users.
+
+Compares CaroDatabase.rank_of (RankIndex: score buckets + Fenwick tree) with
+counting the better users in SQL over idx_users_score, and measures
+users_around and rank_of interleaved with committed score updates.
+
+    python benchmarks/bench_rank.py [--users 1000000] [--lookups 20000]
+"""
+import argparse
+import contextlib
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.database import CaroDatabase
+
+SQL_RANK = 'SELECT COUNT(*) + 1 FROM users WHERE score > ? OR (score = ? AND id < ?)'
+
+
+def create_users(db, count):
+    rng = random.Random(1)
+    with db.writer() as connection:
+        connection.executemany(
+            'INSERT INTO users (username, password_hash, score) VALUES (?, ?, ?)',
+            ((f"user{i}", 'x', max(0, int(rng.gauss(1000, 300)))) for i in range(count)))
+
+
+def rate(count, action):
+    start = time.perf_counter()
+    for _ in range(count):
+        action()
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000000)
+    parser.add_argument('--lookups', type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, 'bench.db')
+        # CaroDatabase in log khi khởi tạo
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            db = CaroDatabase(db_path)
+            create_users(db, args.users)
+        user_count = db.connection.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+        rng = random.Random(2)
+
+        def random_user():
+            return rng.randint(1, user_count)
+
+        start = time.perf_counter()
+        db.rank_of(1)
+        print(f"{user_count} users, rank index loaded in {time.perf_counter() - start:.2f}s")
+
+        def sql_rank():
+            user = db.get_user_info(random_user())
+            with db.reader() as connection:
+                connection.execute(SQL_RANK, (user['score'], user['score'], user['id'])).fetchone()
+
+        def update_and_rank():
+            user_id = random_user()
+            db.update_user_score(user_id, rng.randint(-20, 20))
+            db.rank_of(user_id)
+
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            results = [
+                ("SQL COUNT", rate(max(args.lookups // 200, 10), sql_rank)),
+                ("rank_of", rate(args.lookups, lambda: db.rank_of(random_user()))),
+                ("users_around(k=5)", rate(args.lookups // 10, lambda: db.users_around(random_user(), 5))),
+                ("update + rank_of", rate(args.lookups // 10, update_and_rank)),
+            ]
+            db.close()
+        for name, value in results:
+            print(f"{name:<20} {value:10.0f} /s")
+
+
+if __name__ == "__main__":
+    main()
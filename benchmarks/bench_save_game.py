@@ -0,0 +1,103 @@
+# benchmarks/bench_save_game.py - Số ván lưu được mỗi giây (CaroDatabase.save_game)
+"""Finished games saved per second by CaroDatabase for long games.
+
+Every game has --moves moves (default 120, a long Caro game). Three paths:
+  per-row       one INSERT per move and one UPDATE per stat, commit per game
+                (how save_game worked before)
+  save_game     CaroDatabase.save_game: executemany for the moves, one transaction
+  write-behind  WriteBehindQueue.save_game: games from many rooms share a transaction
+
+    python benchmarks/bench_save_game.py [--games 2000] [--moves 120]
+"""
+import argparse
+import contextlib
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.database import CaroDatabase, INSERT_GAME_SQL, INSERT_MOVE_SQL, sql_timestamp
+from database.write_behind import WriteBehindQueue
+
+
+def make_game(index, moves, player1_id, player2_id):
+    started = 1700000000 + index * 3600
+    winner_id = (player1_id, player2_id, None)[index % 3]
+    moves_data = [{'player_id': (player1_id, player2_id)[i % 2], 'x': i % 50, 'y': i // 50,
+                   'time': started + 2 * i} for i in range(moves)]
+    return {'player1_id': player1_id, 'player2_id': player2_id, 'moves_data': moves_data,
+            'winner_id': winner_id, 'board_size': 50, 'started_at': started, 'ended_at': started + 2 * moves}
+
+
+def save_per_row(db, game):
+    """save_game trước đây: từng câu lệnh riêng cho mỗi nước / mỗi chỉ số"""
+    with db.writer() as connection:
+        cursor = connection.cursor()
+        moves_data, ended_at = game['moves_data'], game['ended_at']
+        cursor.execute(INSERT_GAME_SQL, (game['player1_id'], game['player2_id'], game['winner_id'], game['board_size'],
+                                         len(moves_data), ended_at - game['started_at'],
+                                         sql_timestamp(game['started_at']), sql_timestamp(ended_at)))
+        game_id = cursor.lastrowid
+        for move_number, move in enumerate(moves_data, 1):
+            cursor.execute(INSERT_MOVE_SQL, (game_id, move_number, move['player_id'], move['x'], move['y'],
+                                             sql_timestamp(move['time'])))
+        for player_id in (game['player1_id'], game['player2_id']):
+            cursor.execute('UPDATE users SET total_games = total_games + 1 WHERE id = ?', (player_id,))
+        if game['winner_id']:
+            loser_id = game['player2_id'] if game['winner_id'] == game['player1_id'] else game['player1_id']
+            cursor.execute('UPDATE users SET wins = wins + 1, win_streak = win_streak + 1, '
+                           'best_win_streak = MAX(best_win_streak, win_streak + 1), score = score + 20 '
+                           'WHERE id = ?', (game['winner_id'],))
+            cursor.execute('UPDATE users SET losses = losses + 1, win_streak = 0, score = MAX(score - 20, 0) '
+                           'WHERE id = ?', (loser_id,))
+        else:
+            for player_id in (game['player1_id'], game['player2_id']):
+                cursor.execute('UPDATE users SET draws = draws + 1, score = score + 5 WHERE id = ?', (player_id,))
+
+
+def run(mode, db_path, games):
+    db = CaroDatabase(db_path)
+    start = time.perf_counter()
+    if mode == 'per-row':
+        for game in games:
+            save_per_row(db, game)
+    elif mode == 'save_game':
+        for game in games:
+            db.save_game(**game)
+    else:
+        writer = WriteBehindQueue(db)
+        for game in games:
+            writer.save_game(**game)
+        writer.close(timeout=None)
+    elapsed = time.perf_counter() - start
+    db.close()
+    return len(games) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--games', type=int, default=2000)
+    parser.add_argument('--moves', type=int, default=120)
+    args = parser.parse_args()
+
+    print(f"{args.games} games x {args.moves} moves")
+    baseline = None
+    for mode in ('per-row', 'save_game', 'write-behind'):
+        with tempfile.TemporaryDirectory() as directory:
+            db_path = os.path.join(directory, 'bench.db')
+            # CaroDatabase in log cho mỗi ván
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                db = CaroDatabase(db_path)
+                player1_id = db.get_user_by_username('player1')['id']
+                player2_id = db.get_user_by_username('player2')['id']
+                db.close()
+                games = [make_game(i, args.moves, player1_id, player2_id) for i in range(args.games)]
+                rate = run(mode, db_path, games)
+        baseline = baseline or rate
+        print(f"{mode:<14} {rate:10.0f} games/s  x{rate / baseline:4.2f}")
+
+
+if __name__ == "__main__":
+    main()
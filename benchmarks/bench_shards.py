@@ -0,0 +1,147 @@
+# benchmarks/bench_shards.py - Số nước đi mỗi giây theo số worker (server/sharding.py)
+"""Moves per second through ShardedCaroServer for 1..N worker processes.
+
+Each pair of bot clients creates a room on a 50x50 board and plays until the
+time is up, starting a new room whenever the board is full. Stones never
+touch (X on even/even cells, O on odd/odd) so games never end early and every
+message is a full MOVE: room lock, board update, win check, OPPONENT_MOVE to
+the other player. Guests often sit on another shard than the room, so
+migrations are included. Throughput should grow with the
+number of workers until the front or the bots run out of cores.
+
+    python benchmarks/bench_shards.py [--workers 1,2,4] [--pairs 64] [--seconds 10]
+"""
+import argparse
+import json
+import os
+import socket
+import ssl
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.sharding import ShardedCaroServer
+from shared.protocol import MessageDecoder
+
+CERT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "certs", "server.crt")
+BOARD_SIZE = 50
+
+
+def open_client(port):
+    raw_socket = socket.create_connection(('127.0.0.1', port), timeout=30)
+    if os.path.exists(CERT_PATH):
+        context = ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
+        context.load_verify_locations(CERT_PATH)
+        context.check_hostname = False
+        raw_socket = context.wrap_socket(raw_socket, server_hostname='127.0.0.1')
+    raw_socket.decoder = MessageDecoder()
+    return raw_socket
+
+
+def send(sock, message):
+    sock.sendall(json.dumps(message).encode('utf-8'))
+
+
+def read_until(sock, msg_type):
+    while True:
+        for message in sock.decoder:
+            if message.get('type') == msg_type:
+                return message
+        data = sock.recv(65536)
+        if not data:
+            raise ConnectionError("server closed the connection")
+        sock.decoder.feed(data)
+
+
+def stones(parity):
+    """Các ô không kề nhau của một bên: không bao giờ có 5 quân liền"""
+    return [(x, y) for x in range(parity, BOARD_SIZE, 2) for y in range(parity, BOARD_SIZE, 2)]
+
+
+def play_pair(port, ready, stop, counts, index):
+    owner, guest = open_client(port), open_client(port)
+    try:
+        ready.wait()
+        while not stop.is_set():
+            # Một ván mới mỗi khi hết ô (1250 nước trên bàn 50x50)
+            send(owner, {'type': 'CREATE_ROOM', 'board_size': BOARD_SIZE, 'win_length': 5, 'time_limit': 600})
+            room_id = read_until(owner, 'ROOM_CREATED')['room_id']
+            send(guest, {'type': 'JOIN_ROOM', 'room_id': room_id})
+            read_until(guest, 'ROOM_JOINED')
+            for (x1, y1), (x2, y2) in zip(stones(0), stones(1)):
+                if stop.is_set():
+                    break
+                send(owner, {'type': 'MOVE', 'x': x1, 'y': y1})
+                read_until(guest, 'OPPONENT_MOVE')
+                send(guest, {'type': 'MOVE', 'x': x2, 'y': y2})
+                read_until(owner, 'OPPONENT_MOVE')
+                counts[index] += 2
+            send(guest, {'type': 'LEAVE_ROOM'})
+            send(owner, {'type': 'LEAVE_ROOM'})
+    finally:
+        owner.close()
+        guest.close()
+
+
+def run(workers, pairs, seconds):
+    # Server in log cho từng message: bỏ stdout (kể cả của worker) trong lúc chạy
+    saved_stdout = os.dup(1)
+    with open(os.devnull, 'w') as devnull:
+        os.dup2(devnull.fileno(), 1)
+    try:
+        return measure(workers, pairs, seconds)
+    finally:
+        sys.stdout.flush()
+        os.dup2(saved_stdout, 1)
+        os.close(saved_stdout)
+
+
+def measure(workers, pairs, seconds):
+    temp_db = tempfile.NamedTemporaryFile(delete=False, suffix='.db')
+    temp_db.close()
+    server = ShardedCaroServer(port=0, db_path=temp_db.name, workers=workers, matchmaking_tick=None)
+    server_thread = threading.Thread(target=server.start, daemon=True)
+    server_thread.start()
+    server.started.wait(60)
+
+    ready, stop = threading.Barrier(pairs + 1), threading.Event()
+    counts = [0] * pairs
+    threads = [threading.Thread(target=play_pair, args=(server.port, ready, stop, counts, i), daemon=True)
+               for i in range(pairs)]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    start = time.perf_counter()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join(30)
+    elapsed = time.perf_counter() - start
+    migrations = server.migrations
+
+    server.stop()
+    server_thread.join(30)
+    os.unlink(temp_db.name)
+    return sum(counts) / elapsed, migrations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', default='1,2,4', help="comma-separated worker counts")
+    parser.add_argument('--pairs', type=int, default=64)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs, {args.pairs} games, {args.seconds:.0f}s each run")
+    baseline = None
+    for workers in [int(w) for w in args.workers.split(',')]:
+        rate, migrations = run(workers, args.pairs, args.seconds)
+        baseline = baseline or rate
+        print(f"{workers:2d} workers  {rate:10.0f} moves/s  x{rate / baseline:4.2f}  ({migrations} migrations)")
+
+
+if __name__ == "__main__":
+    main()
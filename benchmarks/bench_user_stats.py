@@ -0,0 +1,99 @@
+# benchmarks/bench_user_stats.py - Tốc độ get_user_stats khi user đã chơi rất nhiều ván
+"""get_user_stats calls per second for a player with many saved games.
+
+The old query LEFT JOINed games ON player1_id = ? OR player2_id = ? (and
+friends) to average the durations, then fetched recent games with the same
+OR; both scan every game of the player. The current one reads the
+game_seconds aggregate and walks idx_games_player1_end / idx_games_player2_end.
+
+    python benchmarks/bench_user_stats.py [--games 100000] [--calls 2000]
+"""
+import argparse
+import contextlib
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.database import CaroDatabase
+
+OLD_STATS_SQL = '''
+SELECT u.username, u.total_games, u.wins, u.losses, u.draws, u.score, u.win_streak, u.best_win_streak,
+       u.created_at, u.last_login,
+       COALESCE(AVG(g.game_duration), 0) as avg_game_duration,
+       COUNT(DISTINCT f.user_id2) as friends_count
+FROM users u
+LEFT JOIN games g ON (u.id = g.player1_id OR u.id = g.player2_id)
+LEFT JOIN friends f ON (u.id = f.user_id1 AND f.status = 'accepted')
+WHERE u.id = ?
+GROUP BY u.id
+'''
+OLD_RECENT_SQL = '''
+SELECT g.id,
+       CASE WHEN g.player1_id = ? THEN u2.username ELSE u1.username END as opponent,
+       CASE WHEN g.winner_id = ? THEN 'Win' WHEN g.winner_id IS NULL THEN 'Draw' ELSE 'Loss' END as result,
+       g.total_moves, g.game_duration, g.end_time
+FROM games g
+JOIN users u1 ON g.player1_id = u1.id
+JOIN users u2 ON g.player2_id = u2.id
+WHERE g.player1_id = ? OR g.player2_id = ?
+ORDER BY g.end_time DESC
+LIMIT 5
+'''
+
+
+def old_user_stats(db, user_id):
+    with db.reader() as connection:
+        connection.execute(OLD_STATS_SQL, (user_id,)).fetchone()
+        connection.execute(OLD_RECENT_SQL, (user_id,) * 4).fetchall()
+
+
+def create_games(db, count, user_id, opponents):
+    rng = random.Random(1)
+    games = []
+    for i in range(count):
+        opponent = rng.choice(opponents)
+        first, second = (user_id, opponent) if i % 2 else (opponent, user_id)
+        started = 1600000000 + 600 * i
+        games.append(('game', {'player1_id': first, 'player2_id': second, 'moves_data': [],
+                               'winner_id': rng.choice((first, second, None)),
+                               'started_at': started, 'ended_at': started + rng.randint(60, 1800)}))
+    for start in range(0, count, 5000):
+        db.apply_writes(games[start:start + 5000])
+
+
+def rate(calls, action):
+    start = time.perf_counter()
+    for _ in range(calls):
+        action()
+    return calls / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--games', type=int, default=100000)
+    parser.add_argument('--calls', type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # CaroDatabase in log cho mỗi ván
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            db = CaroDatabase(os.path.join(directory, 'bench.db'))
+            user_id = db.get_user_by_username('player1')['id']
+            opponents = [db.get_user_by_username(name)['id'] for name in ('player2', 'alice', 'bob', 'charlie')]
+            create_games(db, args.games, user_id, opponents)
+            results = [
+                ("OR join (old)", rate(max(args.calls // 100, 5), lambda: old_user_stats(db, user_id))),
+                ("get_user_stats", rate(args.calls, lambda: db.get_user_stats(user_id))),
+            ]
+            db.close()
+        print(f"{args.games} games for one player")
+        for name, value in results:
+            print(f"{name:<16} {value:10.1f} calls/s")
+
+
+if __name__ == "__main__":
+    main()
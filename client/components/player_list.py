@@ -28,11 +28,28 @@ class PlayerList(tk.Frame):
             self.tree.delete(item)
             
         for player in players:
-            # Lấy tên hiển thị
-            display_name = player.get('display_name', player.get('username', 'Unknown'))
-            # Thêm icon xanh (dùng emoji) biểu thị online
-            text = f" 🟢  {display_name}"
-            self.tree.insert('', tk.END, values=(text,))
+            self.upsert_player(player)
+            
+    def apply_event(self, event):
+        """Áp dụng một delta PLAYER_JOINED / PLAYER_UPDATED / PLAYER_LEFT"""
+        if event['type'] == 'PLAYER_LEFT':
+            iid = str(event['user_id'])
+            if self.tree.exists(iid):
+                self.tree.delete(iid)
+        else:
+            self.upsert_player(event['player'])
+            
+    def upsert_player(self, player):
+        # Lấy tên hiển thị
+        display_name = player.get('display_name', player.get('username', 'Unknown'))
+        # Thêm icon xanh (dùng emoji) biểu thị online
+        text = f" 🟢  {display_name}"
+        # Dùng user_id làm iid để sửa/xóa đúng dòng khi nhận delta
+        iid = str(player.get('user_id'))
+        if self.tree.exists(iid):
+            self.tree.item(iid, values=(text,))
+        else:
+            self.tree.insert('', tk.END, iid=iid, values=(text,))
             
     def pack(self, **kwargs):
         super().pack(**kwargs)
\ No newline at end of file
@@ -55,29 +55,46 @@ class RoomList(tk.Frame):
             
         # 2. Thêm dữ liệu mới từ Server
         for room in rooms:
-            raw_id = room['id']
-            # Logic làm đẹp tên phòng
-            try:
-                room_num = raw_id.split('_')[1]
-                display_id = f"Phòng #{int(room_num):02d}"
-            except:
-                display_id = raw_id
+            self.upsert_room(room)
 
-            if room.get('has_password'):
-                display_id = "🔒 " + display_id
+    def apply_event(self, event):
+        """Áp dụng một delta ROOM_ADDED / ROOM_CHANGED / ROOM_REMOVED"""
+        if event['type'] == 'ROOM_REMOVED':
+            if self.tree.exists(event['id']):
+                self.tree.delete(event['id'])
+        else:
+            self.upsert_room(event['room'])
 
-            status_text = f"{room['count']}/2"
-            if room['status'] == 'playing':
-                status_text += " (Đang chơi)"
-            
-            # Chèn vào bảng (Lưu ý thứ tự values khớp với columns khai báo ở trên)
-            self.tree.insert('', tk.END, values=(
-                display_id,           # Cột 1: Tên đẹp
-                room['match_text'],   # Cột 2: Cặp đấu
-                status_text,          # Cột 3: Trạng thái
-                raw_id,               # Cột 4 (Ẩn): ID gốc để xử lý logic
-                room.get('has_password', False) # Cột 5 (Ẩn): Có pass không
-            ))
+    def upsert_room(self, room):
+        raw_id = room['id']
+        # Logic làm đẹp tên phòng
+        try:
+            room_num = raw_id.split('_')[1]
+            display_id = f"Phòng #{int(room_num):02d}"
+        except:
+            display_id = raw_id
+
+        if room.get('has_password'):
+            display_id = "🔒 " + display_id
+
+        status_text = f"{room['count']}/2"
+        if room['status'] == 'playing':
+            status_text += " (Đang chơi)"
+        
+        # Lưu ý thứ tự values khớp với columns khai báo ở trên
+        values = (
+            display_id,           # Cột 1: Tên đẹp
+            room['match_text'],   # Cột 2: Cặp đấu
+            status_text,          # Cột 3: Trạng thái
+            raw_id,               # Cột 4 (Ẩn): ID gốc để xử lý logic
+            room.get('has_password', False) # Cột 5 (Ẩn): Có pass không
+        )
+        
+        # Dùng room id làm iid để delta sửa đúng dòng (giữ nguyên lựa chọn của người dùng)
+        if self.tree.exists(raw_id):
+            self.tree.item(raw_id, values=values)
+        else:
+            self.tree.insert('', tk.END, iid=raw_id, values=values)
 
     def get_selected_room(self):
         selected = self.tree.selection()
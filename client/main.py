@@ -29,6 +29,7 @@ class CaroClient:
         self.current_turn = 'X'
         self.game_active = False
         self.board_size = 15
+        self.win_length = 5
         self.cell_size = 30
         self.current_room = None
         
@@ -156,7 +157,7 @@ class CaroClient:
                     # Server chờ user accept. Nếu user không làm gì server tự timeout. an toàn.
                     pass
 
-            elif msg_type in ['ROOM_LIST', 'ONLINE_PLAYERS']:
+            elif msg_type in ['ROOM_LIST', 'ONLINE_PLAYERS', 'LOBBY_SNAPSHOT', 'LOBBY_DELTA']:
                 if 'lobby' in self.views: self.views['lobby'].handle_message(message)
 
             elif msg_type == 'VIEW_MATCH_INFO':
@@ -307,12 +308,14 @@ class CaroClient:
         if redirect_to_login:
             self.show_view('login')
 
-    def create_room(self, password=None, time_limit=30):
+    def create_room(self, password=None, time_limit=30, board_size=15, win_length=5):
         self.pending_action = 'create'
         self.network.send({
             'type': 'CREATE_ROOM',
             'password': password,
-            'time_limit': time_limit
+            'time_limit': time_limit,
+            'board_size': board_size,
+            'win_length': win_length
         })
 
     def find_match(self):
@@ -338,6 +341,10 @@ class CaroClient:
         self.network.send({'type': 'SURRENDER', 'room_id': self.current_room})
 
     def refresh_all_data(self):
+        if self.network.has_feature('lobby_deltas'):
+            # Server chỉ gửi snapshot khi version của mình đã cũ
+            self.network.send({'type': 'GET_LOBBY_SNAPSHOT', 'version': self.views['lobby'].lobby_version})
+            return
         self.refresh_rooms()
         self.refresh_online_players()
 
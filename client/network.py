@@ -1,9 +1,15 @@
 import socket
 import threading
-import json
 import time
 import ssl
 import os
+import sys
+
+# Cho phép import module dùng chung (shared/) từ thư mục gốc dự án
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.protocol import (MessageDecoder, ProtocolError, InvalidMessage, encode_message,
+                             FRAMING_JSON, FRAMING_LENGTH, SUPPORTED_FEATURES)
 
 class NetworkClient:
     def __init__(self, host='127.0.0.1', port=5555):
@@ -15,6 +21,8 @@ class NetworkClient:
         self.reconnect_enabled = True # Control flag for auto-reconnect
         self.is_reconnecting = False
         self.msg_handler = None 
+        self.framing = FRAMING_JSON # Chỉ đổi sang 'length' khi server trả HELLO_ACK
+        self.features = set() # Tính năng server chấp nhận trong HELLO_ACK (vd: lobby_deltas)
 
     def start_connection(self):
         """Starts the connection process in a new thread."""
@@ -54,6 +62,11 @@ class NetworkClient:
             self.connected = True
             print(f"✅ Connected to server at {self.host}:{self.port}")
             
+            # Đề nghị framing có độ dài (server cũ sẽ bỏ qua, ta tiếp tục dùng JSON thường)
+            self.framing = FRAMING_JSON
+            self.features = set()
+            self.send({'type': 'HELLO', 'framing': FRAMING_LENGTH, 'features': list(SUPPORTED_FEATURES)})
+            
             if self.msg_handler and not self.is_reconnecting:
                 self.msg_handler({'type': 'CONNECTION_SUCCESS'})
             
@@ -83,83 +96,49 @@ class NetworkClient:
             return
 
         try:
-            json_data = json.dumps(data)
-            # print(f"📤 Sending: {json_data}") # Debug log
-            self.client.sendall(json_data.encode('utf-8')) # Use sendall for reliability
+            # print(f"📤 Sending: {data}") # Debug log
+            self.client.sendall(encode_message(data, self.framing)) # Use sendall for reliability
         except socket.error as e:
             print(f"❌ Send error: {e}")
             self.disconnect()
 
+    def has_feature(self, feature):
+        return feature in self.features
+
     def receive_messages(self):
-        import codecs
-        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
-        buffer = ""
+        # Decoder nhận cả JSON thường lẫn frame có độ dài, chỉ decode UTF-8 khi đủ một message
+        decoder = MessageDecoder()
         while self.connected:
             try:
-                # Use raw bytes recv then decode incrementally
                 chunk = self.client.recv(4096)
                 if not chunk:
                     print("Disconnected from server (no data)")
                     self.disconnect()
                     break
                 
-                # Decode chunk safely
-                data = decoder.decode(chunk, final=False)
-                buffer += data
-                
-                # Logic tách JSON an toàn hơn (đếm ngoặc nhọn)
+                decoder.feed(chunk)
                 while True:
                     try:
-                        # Tìm vị trí start object
-                        start = buffer.find('{')
-                        if start == -1:
-                            buffer = "" # Không có JSON -> Xóa rác
-                            break
-                            
-                        # Tìm vị trí end object (đơn giản, giả sử không có lồng phức tạp hoặc string chứa })
-                        # Cách tốt hơn: Đếm ngoặc (Stack-based)
-                        brace_count = 0
-                        json_end = -1
-                        in_string = False
-                        escape = False
-                        
-                        for i, char in enumerate(buffer[start:], start):
-                            if char == '"' and not escape:
-                                in_string = not in_string
-                            elif char == '\\' and in_string:
-                                escape = not escape
-                            elif not escape:
-                                if not in_string:
-                                    if char == '{': brace_count += 1
-                                    elif char == '}': 
-                                        brace_count -= 1
-                                        if brace_count == 0:
-                                            json_end = i
-                                            break
-                            else:
-                                escape = False  # Reset escape for next char
-                                
-                        if json_end != -1:
-                            json_str = buffer[start:json_end+1]
-                            buffer = buffer[json_end+1:]
-                            
-                            try:
-                                message = json.loads(json_str)
-                                if isinstance(message, dict):
-                                    if self.msg_handler:
-                                        self.msg_handler(message)
-                                else:
-                                    print(f"⚠️ Ignored non-dict message: {message}")
-                            except json.JSONDecodeError:
-                                print(f"⚠️ Invalid JSON ignored: {json_str[:50]}...")
-                        else:
-                            # Chưa nhận đủ packet -> Đợi loop sau
-                            break
-                            
-                    except Exception as e:
-                        print(f"Error parsing packet: {e}")
-                        break 
+                        message = decoder.next_message()
+                    except InvalidMessage as e:
+                        print(f"⚠️ Invalid JSON ignored: {e}")
+                        continue
+                    
+                    if message is None:
+                        break # Chưa nhận đủ packet -> Đợi loop sau
+                    
+                    if message.get('type') == 'HELLO_ACK':
+                        self.framing = message.get('framing', FRAMING_JSON)
+                        self.features = set(message.get('features', []))
+                        continue
+                    
+                    if self.msg_handler:
+                        self.msg_handler(message)
             
+            except ProtocolError as e:
+                print(f"❌ Protocol error: {e}")
+                self.disconnect()
+                break
             except Exception as e:
                 print(f"❌ Receive error: {e}")
                 self.disconnect()
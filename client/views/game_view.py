@@ -505,9 +505,21 @@ class GameView:
         else:
             self.timer_label.config(fg=self.colors['text_dark'])
 
+    def apply_board_config(self, message):
+        """Đổi kích thước bàn cờ theo phòng (15, 19, bàn lớn 30-50...)"""
+        board_size = message.get('board_size', 15)
+        self.controller.board_size = board_size
+        self.controller.win_length = message.get('win_length', 5)
+        # Giữ canvas khoảng 450px: bàn càng lớn ô càng nhỏ
+        self.controller.cell_size = max(10, min(30, 450 // board_size))
+        px = board_size * self.controller.cell_size
+        self.canvas.config(width=px, height=px)
+
     # --- XỬ LÝ MESSAGE ---
     def handle_message(self, message):
         msg_type = message.get('type')
+        if msg_type in ('ROOM_CREATED', 'ROOM_JOINED', 'VIEW_MATCH_INFO', 'RESUME_GAME'):
+            self.apply_board_config(message)
         
         if msg_type == 'ROOM_CREATED':
             room_id = message.get('room_id')
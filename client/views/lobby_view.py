@@ -31,6 +31,9 @@ class LobbyView:
         self.lbl_avatar = None
         self.avatar_image = None
         
+        # Version sảnh chờ đã áp dụng (-1 = chưa có snapshot)
+        self.lobby_version = -1
+        
         self.create_widgets()
 
     def create_widgets(self):
@@ -179,10 +182,34 @@ class LobbyView:
         type = message.get('type')
         if type == 'ROOM_LIST': self.room_list.update(message.get('rooms', []))
         elif type == 'ONLINE_PLAYERS': self.player_list.update(message.get('players', []))
+        elif type == 'LOBBY_SNAPSHOT': self.apply_lobby_snapshot(message)
+        elif type == 'LOBBY_DELTA': self.apply_lobby_delta(message)
         elif type == 'VIEW_MATCH_INFO':
             info = f"Phòng: {message.get('room_id')}\nTrạng thái: {message.get('status')}\nNgười chơi: {', '.join(message.get('players', []))}"
             messagebox.showinfo("Chi tiết", info)
 
+    def apply_lobby_snapshot(self, message):
+        self.room_list.update(message.get('rooms', []))
+        self.player_list.update(message.get('players', []))
+        self.lobby_version = message.get('version', -1)
+        
+    def apply_lobby_delta(self, message):
+        version = message.get('version', -1)
+        if version <= self.lobby_version:
+            return # Đã có (vd: delta tới sau snapshot)
+            
+        if message.get('base_version') != self.lobby_version:
+            # Bị lỡ delta -> xin lại toàn bộ
+            self.controller.network.send({'type': 'GET_LOBBY_SNAPSHOT', 'version': self.lobby_version})
+            return
+            
+        for event in message.get('events', []):
+            if event['type'].startswith('PLAYER_'):
+                self.player_list.apply_event(event)
+            else:
+                self.room_list.apply_event(event)
+        self.lobby_version = version
+
     # Button Commands
     def quick_match(self):
         # Ẩn danh sách phòng/người chơi
@@ -224,6 +251,9 @@ class LobbyView:
         # Nút Hủy
         def cancel_search():
             self.controller.pending_action = None # Reset cờ hành động
+            try:
+                self.controller.network.send({'type': 'CANCEL_MATCH'}) # Rời hàng tìm trận
+            except: pass
             self.search_frame.destroy()
             self.lists_container.pack(fill=tk.BOTH, expand=True)
             
@@ -401,7 +431,7 @@ class LobbyView:
         # Tạo dialog tùy chỉnh
         dialog = tk.Toplevel(self.frame)
         dialog.title("Tạo phòng mới")
-        dialog.geometry("300x250")
+        dialog.geometry("300x370")
         dialog.config(bg='white')
         
         # Center dialog
@@ -422,6 +452,17 @@ class LobbyView:
         time_entry.insert(0, "30")
         time_entry.pack(fill=tk.X, padx=20, pady=5)
         
+        # Board size / win length
+        tk.Label(dialog, text="Kích thước bàn cờ (5-50):", bg='white').pack(anchor='w', padx=20)
+        size_entry = tk.Entry(dialog)
+        size_entry.insert(0, "15")
+        size_entry.pack(fill=tk.X, padx=20, pady=5)
+        
+        tk.Label(dialog, text="Số quân liên tiếp để thắng:", bg='white').pack(anchor='w', padx=20)
+        win_entry = tk.Entry(dialog)
+        win_entry.insert(0, "5")
+        win_entry.pack(fill=tk.X, padx=20, pady=5)
+        
         def on_create():
             pwd = pass_entry.get().strip()
             try:
@@ -431,7 +472,14 @@ class LobbyView:
             except:
                 limit = 30
                 
-            self.controller.create_room(password=pwd if pwd else None, time_limit=limit)
+            try:
+                size = min(max(int(size_entry.get()), 5), 50)
+                win_length = min(max(int(win_entry.get()), 3), size)
+            except:
+                size, win_length = 15, 5
+                
+            self.controller.create_room(password=pwd if pwd else None, time_limit=limit,
+                                        board_size=size, win_length=win_length)
             dialog.destroy()
             
         tk.Button(dialog, text="Tạo phòng", command=on_create, 
@@ -1,21 +1,263 @@
 # database/database.py (HOÀN CHỈNH)
 import sqlite3
+import calendar
 import hashlib
 import json
+import queue
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
+from itertools import groupby
+
+from database.leaderboard import LeaderboardCache, RankIndex, LEADERBOARD_KEYS, DEFAULT_LEADERBOARD_SIZE
+
+DEFAULT_READ_CONNECTIONS = 4  # Read pool size (the writer is one extra connection)
+STATEMENT_CACHE_SIZE = 256    # Prepared statements kept per connection (keyed by SQL text)
+BUSY_TIMEOUT = 5.0            # Seconds to wait for the write lock of another process
+CONNECTION_PRAGMAS = (
+    'PRAGMA synchronous=NORMAL',  # With WAL: fsync at checkpoints only, still safe on crash
+    'PRAGMA cache_size=-16000',   # 16 MiB page cache per connection
+    'PRAGMA temp_store=MEMORY',
+)
+
+# Deferred writes (see database/write_behind.py), applied with executemany
+SCORE_UPDATE_SQL = 'UPDATE users SET score = MAX(score + ?, 0) WHERE id = ?'
+LAST_LOGIN_SQL = 'UPDATE users SET last_login = ? WHERE id = ?'
+
+# Finished games (save_game)
+INSERT_GAME_SQL = '''
+INSERT INTO games (player1_id, player2_id, winner_id, board_size, total_moves, game_duration, start_time, end_time)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+INSERT_MOVE_SQL = '''
+INSERT INTO moves (game_id, move_number, player_id, x_position, y_position, timestamp)
+VALUES (?, ?, ?, ?, ?, ?)
+'''
+RECORD_WIN_SQL = '''
+UPDATE users
+SET total_games = total_games + 1,
+    wins = wins + 1,
+    win_streak = win_streak + 1,
+    best_win_streak = MAX(best_win_streak, win_streak + 1),
+    game_seconds = game_seconds + ?,
+    score = score + ?
+WHERE id = ?
+'''
+RECORD_LOSS_SQL = '''
+UPDATE users
+SET total_games = total_games + 1,
+    losses = losses + 1,
+    win_streak = 0,
+    game_seconds = game_seconds + ?,
+    score = MAX(score - ?, 0)
+WHERE id = ?
+'''
+RECORD_DRAW_SQL = '''
+UPDATE users
+SET total_games = total_games + 1,
+    draws = draws + 1,
+    game_seconds = game_seconds + ?,
+    score = score + ?
+WHERE id = ?
+'''
+
+
+INSERT_PACKED_GAME_SQL = '''
+INSERT INTO games (player1_id, player2_id, winner_id, board_size, total_moves, game_duration, start_time, end_time,
+                   move_data)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Packed move list (games.move_data), see encode_moves
+MOVE_FORMAT_VERSION = 1
+MOVE_TIME_UNIT = 0.1   # Seconds per tick of the delta-encoded move clock
+PLAYER2_FLAG = 0x80    # High bit of the x byte: move by player2 (coordinates < 128)
+
+
+# get_user_stats: one users row (aggregates kept by save_game) + accepted friends by primary key
+USER_STATS_SQL = '''
+SELECT
+    u.username,
+    u.total_games,
+    u.wins,
+    u.losses,
+    u.draws,
+    u.score,
+    u.win_streak,
+    u.best_win_streak,
+    u.created_at,
+    u.last_login,
+    CASE
+        WHEN u.total_games > 0 THEN u.game_seconds * 1.0 / u.total_games
+        ELSE 0
+    END as avg_game_duration,
+    (SELECT COUNT(*) FROM friends f WHERE f.user_id1 = u.id AND f.status = 'accepted') as friends_count
+FROM users u
+WHERE u.id = ?
+'''
+# Newest games of a player: the newest `limit` of each side (index walks), then merged
+RECENT_GAMES_SQL = '''
+SELECT
+    g.id,
+    CASE
+        WHEN g.player1_id = :user_id THEN u2.username
+        ELSE u1.username
+    END as opponent,
+    CASE
+        WHEN g.winner_id = :user_id THEN 'Win'
+        WHEN g.winner_id IS NULL THEN 'Draw'
+        ELSE 'Loss'
+    END as result,
+    g.total_moves,
+    g.game_duration,
+    g.end_time
+FROM (
+    SELECT id FROM (SELECT id FROM games WHERE player1_id = :user_id ORDER BY end_time DESC, id DESC LIMIT :limit)
+    UNION
+    SELECT id FROM (SELECT id FROM games WHERE player2_id = :user_id ORDER BY end_time DESC, id DESC LIMIT :limit)
+) mine
+JOIN games g ON g.id = mine.id
+JOIN users u1 ON g.player1_id = u1.id
+JOIN users u2 ON g.player2_id = u2.id
+ORDER BY g.end_time DESC, g.id DESC
+LIMIT :limit
+'''
+
+# Leaderboard rows (get_leaderboard, LeaderboardCache); ordered by one of LEADERBOARD_KEYS
+LEADERBOARD_SELECT = '''
+SELECT
+    id,
+    username,
+    score,
+    total_games,
+    wins,
+    losses,
+    draws,
+    win_streak,
+    best_win_streak,
+    CASE
+        WHEN total_games > 0 THEN ROUND(wins * 100.0 / total_games, 2)
+        ELSE 0
+    END as win_rate
+FROM users
+'''
+
+
+def sql_timestamp(unix_time):
+    """Unix time -> 'YYYY-MM-DD HH:MM:SS' UTC (the format of CURRENT_TIMESTAMP)"""
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(unix_time))
+
+
+def parse_timestamp(text):
+    """'YYYY-MM-DD HH:MM:SS' UTC -> Unix time (inverse of sql_timestamp)"""
+    return calendar.timegm(time.strptime(text, '%Y-%m-%d %H:%M:%S'))
+
+
+def _write_varint(out, value):
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def encode_moves(moves_data, player1_id, player2_id, started_at):
+    """Pack a move list into one BLOB (games.move_data).
+
+    Layout: version byte, varint move count, then 2 bytes per move (x | PLAYER2_FLAG
+    for player2's stones, y), then one varint per move: ticks of MOVE_TIME_UNIT since
+    the previous move (the first since int(started_at), the stored start_time).
+    A 60-move game with moves a few seconds apart is about 180 bytes.
+
+    Raises ValueError if a move cannot be packed (coordinate >= 128, unknown player).
+    """
+    out = bytearray([MOVE_FORMAT_VERSION])
+    _write_varint(out, len(moves_data))
+    for move in moves_data:
+        x, y, player_id = move['x'], move['y'], move['player_id']
+        if not (0 <= x < PLAYER2_FLAG and 0 <= y < 256):
+            raise ValueError(f"Move ({x}, {y}) cannot be packed")
+        if player_id == player1_id:
+            out.append(x)
+        elif player_id == player2_id:
+            out.append(x | PLAYER2_FLAG)
+        else:
+            raise ValueError(f"Move by user {player_id} who is not in the game")
+        out.append(y)
+    base = int(started_at)
+    previous = 0
+    for move in moves_data:
+        tick = max(round((move.get('time', base) - base) / MOVE_TIME_UNIT), previous)  # Clock never goes back
+        _write_varint(out, tick - previous)
+        previous = tick
+    return bytes(out)
+
+
+def decode_moves(data, player1_id, player2_id, started_at):
+    """Inverse of encode_moves: [{'player_id', 'x', 'y', 'time'}] in play order"""
+    if data[0] != MOVE_FORMAT_VERSION:
+        raise ValueError(f"Unknown move format {data[0]}")
+    count, pos = _read_varint(data, 1)
+    moves = []
+    for i in range(pos, pos + 2 * count, 2):
+        x, y = data[i], data[i + 1]
+        player_id = player2_id if x & PLAYER2_FLAG else player1_id
+        moves.append({'player_id': player_id, 'x': x & ~PLAYER2_FLAG, 'y': y})
+    pos += 2 * count
+    base = int(started_at)
+    tick = 0
+    for move in moves:
+        delta, pos = _read_varint(data, pos)
+        tick += delta
+        move['time'] = round(base + tick * MOVE_TIME_UNIT, 1)
+    return moves
 
 class CaroDatabase:
-    def __init__(self, db_path="caro.db"):
-        """Initialize database connection"""
+    """SQLite storage shared by every server thread.
+
+    One writer connection (self.connection) behind a lock runs one transaction at
+    a time; reads borrow a connection from a small pool. In WAL mode readers never
+    wait for the writer and see the last committed state. ':memory:' databases
+    cannot be shared between connections, so there reads use the writer too.
+    """
+    def __init__(self, db_path="caro.db", read_connections=DEFAULT_READ_CONNECTIONS, packed_moves=True,
+                 leaderboard_size=DEFAULT_LEADERBOARD_SIZE):
+        """Initialize database connection
+
+        packed_moves: store the moves of new games as one BLOB in games.move_data
+        (encode_moves) instead of one row per stone in the moves table.
+        leaderboard_size: rows per sort key kept in memory by get_leaderboard
+        (LeaderboardCache); 0 always queries the database.
+        """
         self.db_path = db_path
+        self.packed_moves = packed_moves
+        self.leaderboard = LeaderboardCache(leaderboard_size)
+        self.ranks = RankIndex()  # Loaded on the first rank_of / users_around
+        self.changed_users = set()  # Users whose stats the open write transaction changed
         self.connection = None
+        self.write_lock = threading.RLock()
+        self.read_connections = read_connections if db_path != ':memory:' else 0
+        self.readers = queue.LifoQueue()  # Idle read connections (most recently used first)
+        self.readers_open = 0
+        self.pool_lock = threading.Lock()
         self.setup_database()
     
     def setup_database(self):
         """Setup database with required tables"""
         try:
-            self.connection = sqlite3.connect(self.db_path, check_same_thread=False)
-            self.connection.row_factory = sqlite3.Row  # Return rows as dictionaries
+            self.connection = self.open_connection()
+            self.connection.execute('PRAGMA journal_mode=WAL')  # Persistent, stored in the file
             self.create_tables()
             self._migrate_db() # Check for new columns
             self.add_default_data()
@@ -24,6 +266,72 @@ class CaroDatabase:
             print(f"❌ Database initialization failed: {e}")
             raise
     
+    def open_connection(self, read_only=False):
+        """Open a connection to the database file with the pool's pragmas"""
+        connection = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT, check_same_thread=False,
+                                     cached_statements=STATEMENT_CACHE_SIZE)
+        connection.row_factory = sqlite3.Row  # Return rows as dictionaries
+        for pragma in CONNECTION_PRAGMAS:
+            connection.execute(pragma)
+        if read_only:
+            connection.execute('PRAGMA query_only=ON')
+        return connection
+
+    @contextmanager
+    def reader(self):
+        """Borrow a read connection; opened lazily up to read_connections"""
+        if not self.read_connections:
+            with self.write_lock:
+                yield self.connection
+            return
+        try:
+            connection = self.readers.get_nowait()
+        except queue.Empty:
+            with self.pool_lock:
+                grow = self.readers_open < self.read_connections
+                if grow:
+                    self.readers_open += 1
+            if not grow:
+                connection = self.readers.get()
+            else:
+                try:
+                    connection = self.open_connection(read_only=True)
+                except BaseException:
+                    with self.pool_lock:
+                        self.readers_open -= 1  # Slot free again: later readers must not wait for it
+                    raise
+        try:
+            yield connection
+        finally:
+            self.readers.put(connection)
+
+    @contextmanager
+    def writer(self):
+        """The single write connection: commit on success, rollback on error"""
+        with self.write_lock:
+            try:
+                yield self.connection
+                self.connection.commit()
+            except BaseException:
+                self.connection.rollback()
+                self.changed_users.clear()
+                raise
+            if self.changed_users:
+                self._refresh_leaderboard()
+
+    def _refresh_leaderboard(self):
+        """Push the committed rows of changed users into the leaderboard cache and rank index (under write_lock)"""
+        user_ids = list(self.changed_users)
+        self.changed_users.clear()
+        if not self.leaderboard.size and not self.ranks.loaded:
+            return
+        placeholders = ', '.join('?' * len(user_ids))
+        rows = [dict(row) for row in self.connection.execute(
+            f"{LEADERBOARD_SELECT} WHERE id IN ({placeholders})", user_ids)]
+        self.leaderboard.update(rows)
+        for row in rows:
+            self.ranks.update(row['id'], row['score'])
+
     def _migrate_db(self):
         """Add new columns to existing tables if missing"""
         try:
@@ -36,6 +344,23 @@ class CaroDatabase:
                 cursor.execute("ALTER TABLE users ADD COLUMN avatar_id INTEGER DEFAULT 0")
                 self.connection.commit()
                 print("✅ Migration successful")
+            if 'game_seconds' not in columns:
+                print("⚠️ Migrating: Adding game_seconds to users table...")
+                cursor.execute("ALTER TABLE users ADD COLUMN game_seconds INTEGER DEFAULT 0")
+                cursor.execute('''
+                UPDATE users SET game_seconds =
+                    (SELECT COALESCE(SUM(game_duration), 0) FROM games WHERE player1_id = users.id) +
+                    (SELECT COALESCE(SUM(game_duration), 0) FROM games WHERE player2_id = users.id)
+                ''')
+                self.connection.commit()
+                print("✅ Migration successful")
+            cursor.execute("PRAGMA table_info(games)")
+            columns = [info[1] for info in cursor.fetchall()]
+            if 'move_data' not in columns:
+                print("⚠️ Migrating: Adding move_data to games table...")
+                cursor.execute("ALTER TABLE games ADD COLUMN move_data BLOB")
+                self.connection.commit()
+                print("✅ Migration successful")
         except Exception as e:
             print(f"❌ Migration failed: {e}")
 
@@ -60,7 +385,8 @@ class CaroDatabase:
             draws INTEGER DEFAULT 0,
             score INTEGER DEFAULT 1000,  -- ELO-like score
             win_streak INTEGER DEFAULT 0,
-            best_win_streak INTEGER DEFAULT 0
+            best_win_streak INTEGER DEFAULT 0,
+            game_seconds INTEGER DEFAULT 0  -- Sum of game_duration (average = game_seconds / total_games)
         )
         ''')
         
@@ -81,6 +407,7 @@ class CaroDatabase:
             start_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             end_time TIMESTAMP,
             status TEXT DEFAULT 'completed',  -- completed, abandoned
+            move_data BLOB,  -- Packed moves (encode_moves); NULL -> rows in the moves table
             FOREIGN KEY (player1_id) REFERENCES users (id),
             FOREIGN KEY (player2_id) REFERENCES users (id),
             FOREIGN KEY (winner_id) REFERENCES users (id)
@@ -132,9 +459,15 @@ class CaroDatabase:
         
         # Create indexes for performance
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_username ON users(username)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_games_player1 ON games(player1_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_games_player2 ON games(player2_id)')
+        # Games of a player, newest first (one index per side, see RECENT_GAMES_SQL)
+        cursor.execute('DROP INDEX IF EXISTS idx_games_player1')  # Prefixes of the two below
+        cursor.execute('DROP INDEX IF EXISTS idx_games_player2')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_games_player1_end ON games(player1_id, end_time)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_games_player2_end ON games(player2_id, end_time)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_moves_game ON moves(game_id)')
+        # Leaderboard: one index per sort key, in ORDER BY key DESC, id order (LIMIT reads only the top)
+        for key in LEADERBOARD_KEYS:
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_users_{key} ON users({key} DESC, id)')
         
         self.connection.commit()
         print("✅ Database tables created with indexes")
@@ -173,23 +506,24 @@ class CaroDatabase:
     def register_user(self, username, password, email=None):
         """Register a new user"""
         try:
-            cursor = self.connection.cursor()
+            with self.writer() as connection:
+                cursor = connection.cursor()
             
-            # Check if username exists
-            cursor.execute("SELECT id FROM users WHERE username = ?", (username,))
-            if cursor.fetchone():
-                return False, "Username already exists"
+                # Check if username exists
+                cursor.execute("SELECT id FROM users WHERE username = ?", (username,))
+                if cursor.fetchone():
+                    return False, "Username already exists"
             
-            # Hash password and insert user
-            password_hash = self._hash_password(password)
+                # Hash password and insert user
+                password_hash = self._hash_password(password)
             
-            cursor.execute('''
-            INSERT INTO users (username, password_hash, email)
-            VALUES (?, ?, ?)
-            ''', (username, password_hash, email))
+                cursor.execute('''
+                INSERT INTO users (username, password_hash, email)
+                VALUES (?, ?, ?)
+                ''', (username, password_hash, email))
             
-            user_id = cursor.lastrowid
-            self.connection.commit()
+                user_id = cursor.lastrowid
+                self.changed_users.add(user_id)
             
             print(f"✅ User registered: {username} (ID: {user_id})")
             return True, {"user_id": user_id, "username": username}
@@ -197,26 +531,29 @@ class CaroDatabase:
         except Exception as e:
             return False, f"Registration failed: {str(e)}"
     
-    def authenticate_user(self, username, password):
-        """Authenticate user login"""
+    def authenticate_user(self, username, password, record_login=True):
+        """Authenticate user login.
+
+        record_login=False skips the inline last_login commit; the caller records
+        it later (WriteBehindQueue.record_login).
+        """
         try:
-            cursor = self.connection.cursor()
             password_hash = self._hash_password(password)
             
-            cursor.execute('''
-            SELECT id, username, email, display_name, avatar_id, total_games, wins, losses, draws, score
-            FROM users 
-            WHERE username = ? AND password_hash = ?
-            ''', (username, password_hash))
-            
-            user_data = cursor.fetchone()
+            with self.reader() as connection:
+                user_data = connection.execute('''
+                SELECT id, username, email, display_name, avatar_id, total_games, wins, losses, draws, score
+                FROM users 
+                WHERE username = ? AND password_hash = ?
+                ''', (username, password_hash)).fetchone()
             
             if user_data:
-                # Update last login time
-                cursor.execute('''
-                UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = ?
-                ''', (user_data['id'],))
-                self.connection.commit()
+                if record_login:
+                    # Update last login time
+                    with self.writer() as connection:
+                        connection.execute('''
+                        UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = ?
+                        ''', (user_data['id'],))
                 
                 # Convert Row to dict
                 user_dict = dict(user_data)
@@ -235,17 +572,18 @@ class CaroDatabase:
     def get_user_info(self, user_id):
         """Get basic user info"""
         try:
-            cursor = self.connection.cursor()
-            cursor.execute('''
-            SELECT id, username, display_name, avatar_id, score, total_games, wins, losses, draws
-            FROM users 
-            WHERE id = ?
-            ''', (user_id,))
+            with self.reader() as connection:
+                cursor = connection.cursor()
+                cursor.execute('''
+                SELECT id, username, display_name, avatar_id, score, total_games, wins, losses, draws
+                FROM users 
+                WHERE id = ?
+                ''', (user_id,))
             
-            user_data = cursor.fetchone()
-            if user_data:
-                return dict(user_data)
-            return None
+                user_data = cursor.fetchone()
+                if user_data:
+                    return dict(user_data)
+                return None
         except Exception as e:
             print(f"❌ Failed to get user info: {e}")
             return None
@@ -253,40 +591,40 @@ class CaroDatabase:
     def update_user_profile(self, user_id, display_name=None, new_password=None, avatar_id=None):
         """Update user profile"""
         try:
-            cursor = self.connection.cursor()
+            with self.writer() as connection:
+                cursor = connection.cursor()
             
-            updates = []
-            params = []
+                updates = []
+                params = []
             
-            if display_name:
-                updates.append("display_name = ?")
-                params.append(display_name)
+                if display_name:
+                    updates.append("display_name = ?")
+                    params.append(display_name)
             
-            if new_password:
-                password_hash = self._hash_password(new_password)
-                updates.append("password_hash = ?")
-                params.append(password_hash)
+                if new_password:
+                    password_hash = self._hash_password(new_password)
+                    updates.append("password_hash = ?")
+                    params.append(password_hash)
                 
-            if avatar_id is not None:
-                updates.append("avatar_id = ?")
-                params.append(avatar_id)
+                if avatar_id is not None:
+                    updates.append("avatar_id = ?")
+                    params.append(avatar_id)
             
-            if not updates:
-                return False
+                if not updates:
+                    return False
                 
-            params.append(user_id)
+                params.append(user_id)
             
-            query = f'''
-            UPDATE users 
-            SET {', '.join(updates)}
-            WHERE id = ?
-            '''
+                query = f'''
+                UPDATE users 
+                SET {', '.join(updates)}
+                WHERE id = ?
+                '''
             
-            cursor.execute(query, params)
-            self.connection.commit()
+                cursor.execute(query, params)
             
-            print(f"✅ Updated profile for user ID: {user_id}")
-            return True
+                print(f"✅ Updated profile for user ID: {user_id}")
+                return True
             
         except Exception as e:
             print(f"❌ Failed to update profile: {e}")
@@ -295,16 +633,13 @@ class CaroDatabase:
     def update_user_score(self, user_id, score_change):
         """Update user score"""
         try:
-            cursor = self.connection.cursor()
+            with self.writer() as connection:
+                cursor = connection.cursor()
             
-            cursor.execute('''
-            UPDATE users 
-            SET score = MAX(score + ?, 0)
-            WHERE id = ?
-            ''', (score_change, user_id))
+                cursor.execute(SCORE_UPDATE_SQL, (score_change, user_id))
+                self.changed_users.add(user_id)
             
-            self.connection.commit()
-            return True
+                return True
             
         except Exception as e:
             print(f"❌ Failed to update score: {e}")
@@ -313,218 +648,285 @@ class CaroDatabase:
     def get_user_by_username(self, username):
         """Get user by username"""
         try:
-            cursor = self.connection.cursor()
-            cursor.execute('''
-            SELECT id, username, display_name, score, total_games, wins, losses, draws
-            FROM users 
-            WHERE username = ?
-            ''', (username,))
+            with self.reader() as connection:
+                cursor = connection.cursor()
+                cursor.execute('''
+                SELECT id, username, display_name, score, total_games, wins, losses, draws
+                FROM users 
+                WHERE username = ?
+                ''', (username,))
             
-            user_data = cursor.fetchone()
-            if user_data:
-                return dict(user_data)
-            return None
+                user_data = cursor.fetchone()
+                if user_data:
+                    return dict(user_data)
+                return None
         except Exception as e:
             print(f"❌ Failed to get user by username: {e}")
             return None
     
-    def save_game(self, player1_id, player2_id, moves_data, winner_id=None, board_size=15):
-        """Save a completed game to database"""
+    def save_game(self, player1_id, player2_id, moves_data, winner_id=None, board_size=15,
+                  started_at=None, ended_at=None, win_points=20, loss_points=20, draw_points=5):
+        """Save a completed game to database.
+
+        moves_data: [{'player_id', 'x', 'y', 'time'?}] in play order ('time' is a Unix
+        timestamp). started_at / ended_at are Unix timestamps of the game clock; the
+        duration is their difference. Scores change by the given points (loss is
+        subtracted, never below 0). Game, moves and player stats are one transaction.
+        """
         try:
-            cursor = self.connection.cursor()
-            
-            # Calculate game duration (simulate 10-30 minutes)
-            import random
-            game_duration = random.randint(600, 1800)  # 10-30 minutes in seconds
-            
-            # Insert game record
-            cursor.execute('''
-            INSERT INTO games (player1_id, player2_id, winner_id, board_size, total_moves, game_duration, end_time)
-            VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-            ''', (player1_id, player2_id, winner_id, board_size, len(moves_data), game_duration))
-            
-            game_id = cursor.lastrowid
-            
-            # Save all moves
-            for move_number, move in enumerate(moves_data, 1):
-                cursor.execute('''
-                INSERT INTO moves (game_id, move_number, player_id, x_position, y_position)
-                VALUES (?, ?, ?, ?, ?)
-                ''', (game_id, move_number, move['player_id'], move['x'], move['y']))
-            
-            # Update player statistics
-            players = [player1_id, player2_id]
-            for player_id in players:
-                cursor.execute('''
-                UPDATE users SET total_games = total_games + 1 
-                WHERE id = ?
-                ''', (player_id,))
-            
-            if winner_id:
-                # Update winner stats
-                cursor.execute('''
-                UPDATE users 
-                SET wins = wins + 1,
-                    win_streak = win_streak + 1,
-                    best_win_streak = MAX(best_win_streak, win_streak + 1),
-                    score = score + 20  -- Win gives +20 points
-                WHERE id = ?
-                ''', (winner_id,))
-                
-                # Update loser stats
-                loser_id = player2_id if winner_id == player1_id else player1_id
-                cursor.execute('''
-                UPDATE users 
-                SET losses = losses + 1,
-                    win_streak = 0,
-                    score = MAX(score - 20, 0)  -- Lose gives -20 points, minimum 0
-                WHERE id = ?
-                ''', (loser_id,))
-            else:
-                # Draw - update both players
-                for player_id in players:
-                    cursor.execute('''
-                    UPDATE users 
-                    SET draws = draws + 1,
-                        score = score + 5  -- Draw gives +5 points
-                    WHERE id = ?
-                    ''', (player_id,))
-            
-            self.connection.commit()
+            with self.writer() as connection:
+                game_id = self._record_game(connection.cursor(), player1_id, player2_id, moves_data, winner_id,
+                                            board_size, started_at, ended_at, win_points, loss_points, draw_points)
             print(f"✅ Game saved: ID {game_id}, {len(moves_data)} moves")
             return game_id
             
         except Exception as e:
             print(f"❌ Failed to save game: {e}")
             return None
+
+    def _record_game(self, cursor, player1_id, player2_id, moves_data, winner_id=None, board_size=15,
+                     started_at=None, ended_at=None, win_points=20, loss_points=20, draw_points=5):
+        """Insert a game, its moves and the player stats without committing"""
+        if ended_at is None:
+            ended_at = time.time()
+        if started_at is None:
+            started_at = moves_data[0].get('time', ended_at) if moves_data else ended_at
+        game_duration = max(0, round(ended_at - started_at))
+        game = (player1_id, player2_id, winner_id, board_size, len(moves_data),
+                game_duration, sql_timestamp(started_at), sql_timestamp(ended_at))
+        
+        move_data = None
+        if self.packed_moves:
+            try:
+                move_data = encode_moves(moves_data, player1_id, player2_id, started_at)
+            except ValueError as e:
+                print(f"⚠️ Moves stored as rows: {e}")
+        
+        if move_data is not None:
+            # Whole move list in the game row
+            cursor.execute(INSERT_PACKED_GAME_SQL, game + (move_data,))
+            game_id = cursor.lastrowid
+        else:
+            cursor.execute(INSERT_GAME_SQL, game)
+            game_id = cursor.lastrowid
+            # Save all moves (one prepared statement for the whole list)
+            cursor.executemany(INSERT_MOVE_SQL, [
+                (game_id, move_number, move['player_id'], move['x'], move['y'],
+                 sql_timestamp(move.get('time', ended_at)))
+                for move_number, move in enumerate(moves_data, 1)
+            ])
+        
+        # Update player statistics
+        self.changed_users.update((player1_id, player2_id))
+        if winner_id:
+            loser_id = player2_id if winner_id == player1_id else player1_id
+            cursor.execute(RECORD_WIN_SQL, (game_duration, win_points, winner_id))
+            cursor.execute(RECORD_LOSS_SQL, (game_duration, loss_points, loser_id))
+        else:
+            # Draw - update both players
+            cursor.executemany(RECORD_DRAW_SQL, [(game_duration, draw_points, player1_id),
+                                                 (game_duration, draw_points, player2_id)])
+        
+        return game_id
+
+    def apply_writes(self, operations):
+        """Apply deferred writes in order, in one transaction on the writer connection.
+
+        operations: list of (kind, args) with kind 'score' -> (delta, user_id),
+        'login' -> (timestamp, user_id) or 'game' -> save_game keyword arguments.
+        Consecutive updates of the same kind share one executemany.
+        """
+        with self.writer() as connection:
+            cursor = connection.cursor()
+            for kind, group in groupby(operations, key=lambda op: op[0]):
+                args = [op[1] for op in group]
+                if kind == 'score':
+                    cursor.executemany(SCORE_UPDATE_SQL, args)
+                    self.changed_users.update(user_id for _, user_id in args)
+                elif kind == 'login':
+                    cursor.executemany(LAST_LOGIN_SQL, args)
+                elif kind == 'game':
+                    for game in args:
+                        self._record_game(cursor, **game)
+                else:
+                    raise ValueError(f"Unknown write: {kind}")
+
+    def get_game_moves(self, game_id):
+        """Moves of a saved game [{'player_id', 'x', 'y', 'time'}], whichever format they are stored in"""
+        with self.reader() as connection:
+            game = connection.execute(
+                'SELECT player1_id, player2_id, start_time, move_data FROM games WHERE id = ?', (game_id,)).fetchone()
+            if game is None:
+                return []
+            if game['move_data'] is not None:
+                return decode_moves(game['move_data'], game['player1_id'], game['player2_id'],
+                                    parse_timestamp(game['start_time']))
+            rows = connection.execute('''
+            SELECT player_id, x_position, y_position, timestamp FROM moves
+            WHERE game_id = ? ORDER BY move_number
+            ''', (game_id,)).fetchall()
+        return [{'player_id': row['player_id'], 'x': row['x_position'], 'y': row['y_position'],
+                 'time': parse_timestamp(row['timestamp'])} for row in rows]
+
+    def pack_moves(self, batch_size=500):
+        """Move games stored as rows in the moves table into games.move_data.
+
+        One transaction per batch_size games (the server can keep running). Games
+        whose moves cannot be packed stay as rows. Returns (packed, skipped).
+        """
+        packed = skipped = 0
+        last_id = 0
+        while True:
+            with self.reader() as connection:
+                games = connection.execute('''
+                SELECT id, player1_id, player2_id, start_time FROM games
+                WHERE move_data IS NULL AND id > ? ORDER BY id LIMIT ?
+                ''', (last_id, batch_size)).fetchall()
+            if not games:
+                return packed, skipped
+            last_id = games[-1]['id']
+            with self.writer() as connection:
+                cursor = connection.cursor()
+                updates = []
+                for game in games:
+                    rows = cursor.execute('''
+                    SELECT player_id, x_position, y_position, timestamp FROM moves
+                    WHERE game_id = ? ORDER BY move_number
+                    ''', (game['id'],)).fetchall()
+                    try:
+                        started_at = parse_timestamp(game['start_time'])
+                        moves = [{'player_id': row['player_id'], 'x': row['x_position'], 'y': row['y_position'],
+                                  'time': parse_timestamp(row['timestamp'])} for row in rows]
+                        updates.append((encode_moves(moves, game['player1_id'], game['player2_id'], started_at),
+                                        game['id']))
+                    except (TypeError, ValueError) as e:
+                        skipped += 1
+                        print(f"⚠️ Game {game['id']} left as rows: {e}")
+                cursor.executemany('UPDATE games SET move_data = ? WHERE id = ?', updates)
+                cursor.executemany('DELETE FROM moves WHERE game_id = ?', [(game_id,) for _, game_id in updates])
+                packed += len(updates)
     
-    def get_user_stats(self, user_id):
-        """Get detailed statistics for a user"""
+    def get_user_stats(self, user_id, recent_games=5):
+        """Get detailed statistics for a user.
+
+        Reads one users row (average duration from the game_seconds aggregate),
+        the friends primary key and two index walks for the recent games, so the
+        cost does not grow with the number of games played.
+        """
         try:
-            cursor = self.connection.cursor()
+            with self.reader() as connection:
+                cursor = connection.cursor()
             
-            cursor.execute('''
-            SELECT 
-                u.username,
-                u.total_games,
-                u.wins,
-                u.losses,
-                u.draws,
-                u.score,
-                u.win_streak,
-                u.best_win_streak,
-                u.created_at,
-                u.last_login,
-                COALESCE(AVG(g.game_duration), 0) as avg_game_duration,
-                COUNT(DISTINCT f.user_id2) as friends_count
-            FROM users u
-            LEFT JOIN games g ON (u.id = g.player1_id OR u.id = g.player2_id)
-            LEFT JOIN friends f ON (u.id = f.user_id1 AND f.status = 'accepted')
-            WHERE u.id = ?
-            GROUP BY u.id
-            ''', (user_id,))
-            
-            row = cursor.fetchone()
-            if row:
-                stats = dict(row)
+                cursor.execute(USER_STATS_SQL, (user_id,))
+            
+                row = cursor.fetchone()
+                if row:
+                    stats = dict(row)
                 
-                # Calculate additional stats
-                total_games = stats['total_games']
-                if total_games > 0:
-                    stats['win_rate'] = round((stats['wins'] / total_games) * 100, 2)
-                    stats['loss_rate'] = round((stats['losses'] / total_games) * 100, 2)
-                    stats['draw_rate'] = round((stats['draws'] / total_games) * 100, 2)
-                else:
-                    stats['win_rate'] = stats['loss_rate'] = stats['draw_rate'] = 0
+                    # Calculate additional stats
+                    total_games = stats['total_games']
+                    if total_games > 0:
+                        stats['win_rate'] = round((stats['wins'] / total_games) * 100, 2)
+                        stats['loss_rate'] = round((stats['losses'] / total_games) * 100, 2)
+                        stats['draw_rate'] = round((stats['draws'] / total_games) * 100, 2)
+                    else:
+                        stats['win_rate'] = stats['loss_rate'] = stats['draw_rate'] = 0
                 
-                # Get recent games
-                cursor.execute('''
-                SELECT 
-                    g.id,
-                    CASE 
-                        WHEN g.player1_id = ? THEN u2.username
-                        ELSE u1.username
-                    END as opponent,
-                    CASE 
-                        WHEN g.winner_id = ? THEN 'Win'
-                        WHEN g.winner_id IS NULL THEN 'Draw'
-                        ELSE 'Loss'
-                    END as result,
-                    g.total_moves,
-                    g.game_duration,
-                    g.end_time
-                FROM games g
-                JOIN users u1 ON g.player1_id = u1.id
-                JOIN users u2 ON g.player2_id = u2.id
-                WHERE g.player1_id = ? OR g.player2_id = ?
-                ORDER BY g.end_time DESC
-                LIMIT 5
-                ''', (user_id, user_id, user_id, user_id))
+                    # Get recent games
+                    cursor.execute(RECENT_GAMES_SQL, {'user_id': user_id, 'limit': recent_games})
                 
-                stats['recent_games'] = [dict(game) for game in cursor.fetchall()]
+                    stats['recent_games'] = [dict(game) for game in cursor.fetchall()]
                 
-                return stats
-            return None
+                    return stats
+                return None
             
         except Exception as e:
             print(f"❌ Failed to get user stats: {e}")
             return None
     
     def get_leaderboard(self, limit=10, order_by='score'):
-        """Get leaderboard sorted by specified column"""
-        try:
-            cursor = self.connection.cursor()
+        """Get leaderboard sorted by specified column (ties: older account first).
 
-            valid_columns = ['score', 'wins', 'win_streak', 'total_games']
-            if order_by not in valid_columns:
+        Pages up to leaderboard_size rows come from the in-memory LeaderboardCache;
+        larger ones (or a cold cache) walk the index of the sort key.
+        """
+        try:
+            if order_by not in LEADERBOARD_KEYS:
                 order_by = 'score'
 
-            # SỬA: Bỏ điều kiện total_games > 0 để hiển thị cả users mới
-            query = f'''
-            SELECT
-                username,
-                score,
-                total_games,
-                wins,
-                losses,
-                draws,
-                win_streak,
-                best_win_streak,
-                CASE
-                    WHEN total_games > 0 THEN ROUND(wins * 100.0 / total_games, 2)
-                    ELSE 0
-                END as win_rate
-            FROM users
-            ORDER BY {order_by} DESC
-            LIMIT ?
-            '''
-
-            cursor.execute(query, (limit,))
-
-            leaderboard = []
-            for row in cursor.fetchall():
-                leaderboard.append(dict(row))
-
-            return leaderboard
+            if limit <= self.leaderboard.size:
+                leaderboard = self.leaderboard.top(order_by, limit)
+                if leaderboard is None:
+                    # Refill under the write lock: no score change can slip in between
+                    with self.write_lock:
+                        rows = self._leaderboard_query(self.connection, order_by, self.leaderboard.size)
+                        self.leaderboard.fill(order_by, rows)
+                        leaderboard = self.leaderboard.top(order_by, limit)
+                return leaderboard
+
+            with self.reader() as connection:
+                rows = self._leaderboard_query(connection, order_by, limit)
+            for row in rows:
+                del row['id']
+            return rows
 
         except Exception as e:
             print(f"❌ Failed to get leaderboard: {e}")
             return []
+
+    def rank_of(self, user_id):
+        """Global rank by score (1 = best, same order as get_leaderboard), None if unknown"""
+        self._load_ranks()
+        return self.ranks.rank_of(user_id)
+
+    def users_around(self, user_id, k=5):
+        """Leaderboard rows (with 'rank') from k places above user_id to k below it"""
+        self._load_ranks()
+        ranked = self.ranks.around(user_id, k)
+        if not ranked:
+            return []
+        placeholders = ', '.join('?' * len(ranked))
+        with self.reader() as connection:
+            rows = {row['id']: dict(row) for row in connection.execute(
+                f"{LEADERBOARD_SELECT} WHERE id IN ({placeholders})", [uid for _, uid in ranked])}
+        around = []
+        for rank, uid in ranked:
+            row = rows.get(uid)
+            if row:
+                del row['id']
+                row['rank'] = rank
+                around.append(row)
+        return around
+
+    def _load_ranks(self):
+        if self.ranks.loaded:
+            return
+        # Under the write lock: no score change between the scan and the first update()
+        with self.write_lock:
+            if not self.ranks.loaded:
+                self.ranks.load(self.connection.execute('SELECT id, score FROM users'))
+
+    @staticmethod
+    def _leaderboard_query(connection, order_by, limit):
+        # SỬA: Bỏ điều kiện total_games > 0 để hiển thị cả users mới
+        cursor = connection.execute(f"{LEADERBOARD_SELECT} ORDER BY {order_by} DESC, id LIMIT ?", (limit,))
+        return [dict(row) for row in cursor.fetchall()]
     
     def search_users(self, search_term, limit=20):
         """Search for users by username"""
         try:
-            cursor = self.connection.cursor()
+            with self.reader() as connection:
+                cursor = connection.cursor()
             
-            cursor.execute('''
-            SELECT id, username, total_games, wins, score
-            FROM users
-            WHERE username LIKE ?
-            ORDER BY username
-            LIMIT ?
-            ''', (f'%{search_term}%', limit))
+                cursor.execute('''
+                SELECT id, username, total_games, wins, score
+                FROM users
+                WHERE username LIKE ?
+                ORDER BY username
+                LIMIT ?
+                ''', (f'%{search_term}%', limit))
             
-            return [dict(row) for row in cursor.fetchall()]
+                return [dict(row) for row in cursor.fetchall()]
             
         except Exception as e:
             print(f"❌ Failed to search users: {e}")
@@ -533,32 +935,32 @@ class CaroDatabase:
     def add_friend_request(self, from_user_id, to_user_id):
         """Send friend request"""
         try:
-            cursor = self.connection.cursor()
+            with self.writer() as connection:
+                cursor = connection.cursor()
+            
+                # Check if friendship already exists
+                cursor.execute('''
+                SELECT status FROM friends 
+                WHERE (user_id1 = ? AND user_id2 = ?) OR (user_id1 = ? AND user_id2 = ?)
+                ''', (from_user_id, to_user_id, to_user_id, from_user_id))
+            
+                existing = cursor.fetchone()
+                if existing:
+                    status = existing['status']
+                    if status == 'accepted':
+                        return False, "Already friends"
+                    elif status == 'pending':
+                        return False, "Friend request already pending"
+                    elif status == 'blocked':
+                        return False, "Cannot send request (blocked)"
             
-            # Check if friendship already exists
-            cursor.execute('''
-            SELECT status FROM friends 
-            WHERE (user_id1 = ? AND user_id2 = ?) OR (user_id1 = ? AND user_id2 = ?)
-            ''', (from_user_id, to_user_id, to_user_id, from_user_id))
-            
-            existing = cursor.fetchone()
-            if existing:
-                status = existing['status']
-                if status == 'accepted':
-                    return False, "Already friends"
-                elif status == 'pending':
-                    return False, "Friend request already pending"
-                elif status == 'blocked':
-                    return False, "Cannot send request (blocked)"
-            
-            # Add friend request
-            cursor.execute('''
-            INSERT INTO friends (user_id1, user_id2, status)
-            VALUES (?, ?, 'pending')
-            ''', (from_user_id, to_user_id))
-            
-            self.connection.commit()
-            return True, "Friend request sent"
+                # Add friend request
+                cursor.execute('''
+                INSERT INTO friends (user_id1, user_id2, status)
+                VALUES (?, ?, 'pending')
+                ''', (from_user_id, to_user_id))
+            
+                return True, "Friend request sent"
             
         except Exception as e:
             return False, f"Failed to send friend request: {str(e)}"
@@ -566,8 +968,13 @@ class CaroDatabase:
     def backup_database(self, backup_path):
         """Create backup of database"""
         try:
-            import shutil
-            shutil.copy2(self.db_path, backup_path)
+            # Online backup: includes pages still in the WAL file, safe while the server runs
+            target = sqlite3.connect(backup_path)
+            try:
+                with self.write_lock:
+                    self.connection.backup(target)
+            finally:
+                target.close()
             print(f"✅ Database backed up to: {backup_path}")
             return True
         except Exception as e:
@@ -577,13 +984,16 @@ class CaroDatabase:
     def restore_database(self, backup_path):
         """Restore database from backup"""
         try:
-            import shutil
-            shutil.copy2(backup_path, self.db_path)
-            
-            # Reconnect to restored database
-            self.connection.close()
-            self.connection = sqlite3.connect(self.db_path)
-            self.connection.row_factory = sqlite3.Row
+            # Copy the backup into the live database through the writer; pooled
+            # readers see the restored pages on their next query
+            source = sqlite3.connect(backup_path)
+            try:
+                with self.write_lock:
+                    source.backup(self.connection)
+                    self.leaderboard.clear()
+                    self.ranks.clear()
+            finally:
+                source.close()
             
             print(f"✅ Database restored from: {backup_path}")
             return True
@@ -593,6 +1003,11 @@ class CaroDatabase:
     
     def close(self):
         """Close database connection"""
+        while True:
+            try:
+                self.readers.get_nowait().close()
+            except queue.Empty:
+                break
         if self.connection:
             self.connection.close()
             print("✅ Database connection closed")
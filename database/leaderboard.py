@@ -0,0 +1,388 @@
+# database/leaderboard.py - Bảng xếp hạng trong bộ nhớ (top-N + thứ hạng của từng user)
+import threading
+from array import array
+from bisect import bisect_left, insort
+
+LEADERBOARD_KEYS = ('score', 'wins', 'win_streak', 'total_games')
+DEFAULT_LEADERBOARD_SIZE = 100  # Rows kept per sort key (largest page served from memory)
+RANK_BLOCK = 1024               # Ids per block once a score bucket outgrows one sorted array
+
+
+class LeaderboardCache:
+    """Top-N users for each leaderboard sort key, kept up to date incrementally.
+
+    For every key the cache holds the first rows of ``ORDER BY key DESC, id``:
+    always a correct prefix of the full order, at most ``size`` long. update()
+    is called with the fresh rows of users whose stats just changed. A user who
+    beats the last cached row is inserted (and the tail trimmed); a cached user
+    who falls below it is dropped, so the prefix gets one shorter. When a read
+    asks for more rows than the prefix holds, top() returns None and the caller
+    refills the key from the database (fill()), a LIMIT size walk of its index.
+
+    ``complete`` marks a key whose prefix is the whole table (fewer users than
+    size), so every update is inserted.
+
+    Only writes made through the owning CaroDatabase are seen; another process
+    writing the same file leaves the cache stale.
+    """
+    def __init__(self, size=DEFAULT_LEADERBOARD_SIZE):
+        self.size = size
+        self.lock = threading.Lock()
+        self.orders = {}    # key -> sorted [(-value, user_id)]
+        self.complete = {}  # key -> prefix covers every user
+        self.rows = {}      # user_id -> leaderboard row (dict), for users in any prefix
+
+        # --- METRICS ---
+        self.hits = 0
+        self.misses = 0
+
+    def top(self, key, limit):
+        """First limit rows for key, or None if the cache cannot answer"""
+        with self.lock:
+            order = self.orders.get(key)
+            if order is None or (len(order) < limit and not self.complete[key]):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return [dict(self.rows[user_id]) for _, user_id in order[:limit]]
+
+    def fill(self, key, rows):
+        """Replace the prefix of key with rows from ``ORDER BY key DESC, id LIMIT size``"""
+        with self.lock:
+            self.orders[key] = [(-row[key], row['id']) for row in rows]
+            self.complete[key] = len(rows) < self.size
+            for row in rows:
+                self.rows[row['id']] = self._strip(row)
+            used = {user_id for order in self.orders.values() for _, user_id in order}
+            for user_id in list(self.rows):
+                if user_id not in used:
+                    del self.rows[user_id]
+
+    def update(self, rows):
+        """Fresh leaderboard rows (with 'id') of users whose stats changed"""
+        with self.lock:
+            for row in rows:
+                user_id = row['id']
+                cached = False
+                for key, order in self.orders.items():
+                    cached |= self._move(key, order, user_id, (-row[key], user_id))
+                if cached:
+                    self.rows[user_id] = self._strip(row)
+                else:
+                    self.rows.pop(user_id, None)
+
+    def _move(self, key, order, user_id, entry):
+        """Re-position user_id in the prefix of key. True if it is (still) in it."""
+        tail = order[-1] if order else None
+        old = self._position(key, order, user_id)
+        if old is not None:
+            del order[old]
+        # Ngang hoặc trên hàng cuối cũ -> vẫn thuộc top; dưới đó -> ra khỏi phần đã cache
+        if self.complete[key] or (tail is not None and entry <= tail):
+            insort(order, entry)
+            if len(order) > self.size:
+                _, dropped_id = order.pop()
+                self.complete[key] = False
+                if dropped_id == user_id:
+                    return False
+                if not any(self._position(k, o, dropped_id) is not None for k, o in self.orders.items()):
+                    del self.rows[dropped_id]
+            return True
+        return False
+
+    def _position(self, key, order, user_id):
+        """Index of user_id in order (found by its cached row), None if it is not there"""
+        row = self.rows.get(user_id)
+        if row is None:
+            return None
+        index = bisect_left(order, (-row[key], user_id))
+        if index < len(order) and order[index][1] == user_id:
+            return index
+        return None
+
+    @staticmethod
+    def _strip(row):
+        row = dict(row)
+        del row['id']
+        return row
+
+    def clear(self):
+        """Forget everything (e.g. after restoring a backup)"""
+        with self.lock:
+            self.orders.clear()
+            self.complete.clear()
+            self.rows.clear()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'keys': len(self.orders),
+                'rows': len(self.rows),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+def _fenwick_build(counts):
+    """Fenwick tree (1-based list) over counts, O(len(counts))"""
+    tree = [0] + list(counts)
+    size = len(counts)
+    for i in range(1, size + 1):
+        parent = i + (i & -i)
+        if parent <= size:
+            tree[parent] += tree[i]
+    return tree
+
+
+def _fenwick_add(tree, index, delta):
+    i = index + 1
+    while i < len(tree):
+        tree[i] += delta
+        i += i & -i
+
+
+def _fenwick_prefix(tree, index):
+    """Sum of counts[0:index]"""
+    total, i = 0, index
+    while i > 0:
+        total += tree[i]
+        i -= i & -i
+    return total
+
+
+def _fenwick_find(tree, rank):
+    """(index, offset in it) of the rank-th (1-based) counted item"""
+    size = len(tree) - 1
+    pos, remaining = 0, rank
+    step = 1 << (size.bit_length() - 1) if size else 0
+    while step:
+        if pos + step <= size and tree[pos + step] < remaining:
+            pos += step
+            remaining -= tree[pos]
+        step >>= 1
+    return pos, remaining - 1
+
+
+class ScoreBucket:
+    """User ids (ascending) sharing one score.
+
+    A small bucket is one sorted array. Past RANK_BLOCK ids (most users sit on
+    the default score) it switches to fixed id ranges: block ``id // RANK_BLOCK``
+    is a sorted array of at most RANK_BLOCK ids and a Fenwick tree counts the
+    ids per block. add / remove / index / at then cost O(log(max_id / RANK_BLOCK))
+    plus a bounded shift inside one block, not a shift of the whole bucket.
+    Below RANK_BLOCK // 4 ids it goes back to one array.
+    """
+    __slots__ = ('ids', 'blocks', 'tree', 'size')
+
+    def __init__(self, ids=()):
+        self.ids = array('i', ids)  # Sorted; None while blocked
+        self.blocks = None          # block number -> array('i'), sorted
+        self.tree = None
+        self.size = len(self.ids)
+        if self.size > RANK_BLOCK:
+            self._split()
+
+    def __len__(self):
+        return self.size
+
+    def add(self, user_id):
+        self.size += 1
+        if self.blocks is None:
+            insort(self.ids, user_id)
+            if self.size > RANK_BLOCK:
+                self._split()
+            return
+        number = user_id // RANK_BLOCK
+        insort(self.blocks.setdefault(number, array('i')), user_id)
+        if number < len(self.tree) - 1:
+            _fenwick_add(self.tree, number, 1)
+        else:
+            self._build_tree(max(number + 1, 2 * (len(self.tree) - 1)))
+
+    def remove(self, user_id):
+        self.size -= 1
+        if self.blocks is None:
+            del self.ids[bisect_left(self.ids, user_id)]
+            return
+        number = user_id // RANK_BLOCK
+        block = self.blocks[number]
+        del block[bisect_left(block, user_id)]
+        if not block:
+            del self.blocks[number]
+        _fenwick_add(self.tree, number, -1)
+        if self.size < RANK_BLOCK // 4:
+            self._merge()
+
+    def index(self, user_id):
+        """Ids in the bucket smaller than user_id"""
+        if self.blocks is None:
+            return bisect_left(self.ids, user_id)
+        number = user_id // RANK_BLOCK
+        if number >= len(self.tree) - 1:
+            return self.size
+        block = self.blocks.get(number)
+        return _fenwick_prefix(self.tree, number) + (bisect_left(block, user_id) if block else 0)
+
+    def at(self, offset):
+        """Id at 0-based offset"""
+        if self.blocks is None:
+            return self.ids[offset]
+        number, rest = _fenwick_find(self.tree, offset + 1)
+        return self.blocks[number][rest]
+
+    def _split(self):
+        blocks = {}
+        for user_id in self.ids:
+            blocks.setdefault(user_id // RANK_BLOCK, array('i')).append(user_id)
+        self.blocks, self.ids = blocks, None
+        self._build_tree(max(blocks) + 1)
+
+    def _merge(self):
+        ids = array('i')
+        for number in sorted(self.blocks):
+            ids.extend(self.blocks[number])
+        self.ids, self.blocks, self.tree = ids, None, None
+
+    def _build_tree(self, capacity):
+        counts = [0] * capacity
+        for number, block in self.blocks.items():
+            counts[number] = len(block)
+        self.tree = _fenwick_build(counts)
+
+
+class RankIndex:
+    """Global rank of every user by score, for rank_of / users_around.
+
+    Ranks follow get_leaderboard(order_by='score'): score DESC, then lower id
+    first. Users are kept in score buckets (ScoreBucket: the ids with that
+    score) and a Fenwick tree counts users per bucket, highest score in slot 0.
+    The rank of a user is the users in higher buckets (one prefix sum, O(log S)
+    for S possible scores) plus its position in its bucket (O(log n) even when
+    most users share a score); the user at a given rank is found by descending
+    the tree. Memory is about 4 bytes per user for the id plus 4 for its score
+    (array('i')).
+
+    Loaded once from the users table (load()); afterwards update() is called
+    with every committed score change (CaroDatabase does this together with
+    LeaderboardCache). Scores are never negative (MAX(score + ?, 0)).
+    """
+    MIN_CAPACITY = 4096  # Score slots; doubled when a score goes past them
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._reset()
+
+    def clear(self):
+        """Forget everything; the next rank query loads again"""
+        with self.lock:
+            self._reset()
+
+    def _reset(self):
+        self.loaded = False
+        self.scores = array('i')  # user_id -> score (-1: no such user)
+        self.buckets = {}         # score -> ScoreBucket
+        self.capacity = 0
+        self.tree = [0]
+        self.total = 0
+
+    def load(self, rows):
+        """Build from (user_id, score) pairs (the whole users table)"""
+        with self.lock:
+            self._reset()
+            grouped = {}
+            for user_id, score in rows:
+                self._set_score(user_id, score)
+                grouped.setdefault(score, []).append(user_id)
+            self.buckets = {score: ScoreBucket(sorted(ids)) for score, ids in grouped.items()}
+            self.total = sum(len(ids) for ids in grouped.values())
+            self._rebuild(max(grouped, default=0))
+            self.loaded = True
+
+    def update(self, user_id, score):
+        """User user_id now has score (new users included)"""
+        with self.lock:
+            if not self.loaded:
+                return
+            old = self.scores[user_id] if user_id < len(self.scores) else -1
+            if old == score:
+                return
+            if old >= 0:
+                bucket = self.buckets[old]
+                bucket.remove(user_id)
+                if not bucket:
+                    del self.buckets[old]
+                self._add(self._slot(old), -1)
+                self.total -= 1
+            if score >= self.capacity:
+                self._rebuild(score)
+            bucket = self.buckets.get(score)
+            if bucket is None:
+                bucket = self.buckets[score] = ScoreBucket()
+            bucket.add(user_id)
+            self._add(self._slot(score), 1)
+            self.total += 1
+            self._set_score(user_id, score)
+
+    def rank_of(self, user_id):
+        """1-based rank, None for an unknown user"""
+        with self.lock:
+            return self._rank(user_id)
+
+    def around(self, user_id, k):
+        """[(rank, user_id)] from k places above user_id to k below it ([] if unknown)"""
+        with self.lock:
+            rank = self._rank(user_id)
+            if rank is None:
+                return []
+            first, last = max(1, rank - k), min(self.total, rank + k)
+            slot, offset = self._find(first)
+            result = []
+            for rank in range(first, last + 1):
+                bucket = self.buckets[self.capacity - 1 - slot]
+                result.append((rank, bucket.at(offset)))
+                offset += 1
+                if offset == len(bucket) and rank < last:
+                    slot, offset = self._find(rank + 1)  # Next non-empty bucket
+            return result
+
+    def _rank(self, user_id):
+        score = self.scores[user_id] if 0 <= user_id < len(self.scores) else -1
+        if score < 0:
+            return None
+        return self._prefix(self._slot(score)) + self.buckets[score].index(user_id) + 1
+
+    def _set_score(self, user_id, score):
+        if user_id >= len(self.scores):
+            self.scores.extend([-1] * (user_id + 1 - len(self.scores)))
+        self.scores[user_id] = score
+
+    def _slot(self, score):
+        return self.capacity - 1 - score
+
+    def _rebuild(self, max_score):
+        """Fenwick tree with room for max_score (O(capacity))"""
+        capacity = max(self.capacity, self.MIN_CAPACITY)
+        while capacity <= max_score:
+            capacity *= 2
+        self.capacity = capacity
+        counts = [0] * capacity
+        for score, bucket in self.buckets.items():
+            counts[capacity - 1 - score] = len(bucket)
+        self.tree = _fenwick_build(counts)
+
+    def _add(self, slot, delta):
+        _fenwick_add(self.tree, slot, delta)
+
+    def _prefix(self, slot):
+        """Users in slots before slot (= users with a higher score)"""
+        return _fenwick_prefix(self.tree, slot)
+
+    def _find(self, rank):
+        """(slot, index in its bucket) of the user at rank"""
+        return _fenwick_find(self.tree, rank)
+
+    def stats(self):
+        with self.lock:
+            return {'loaded': self.loaded, 'users': self.total, 'scores': len(self.buckets),
+                    'capacity': self.capacity}
@@ -0,0 +1,67 @@
+# database/migrate_moves.py - Chuyển nước đi từ bảng moves sang games.move_data (dạng nén)
+"""Pack the moves of archived games into games.move_data and shrink the database file.
+
+Games saved before packed moves existed keep one row per stone in the moves
+table. This rewrites them as one BLOB per game (CaroDatabase.pack_moves, one
+transaction per batch, safe while the server runs), then VACUUMs so the freed
+pages are returned to the file system.
+
+    python database/migrate_moves.py [db_path] [--batch 500] [--no-vacuum]
+
+db_path defaults to database/caro.db next to this file, the server's database,
+whatever the working directory.
+"""
+import argparse
+import os
+import sys
+
+if __name__ == "__main__":
+    # Chạy như script: sys.path[0] là database/, nơi database.py che mất package database
+    sys.path.remove(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.database import CaroDatabase
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "caro.db")  # Như server/main.py
+
+
+def database_size(db_path):
+    """Main file + WAL, in bytes"""
+    return sum(os.path.getsize(path) for path in (db_path, db_path + '-wal') if os.path.exists(path))
+
+
+def migrate(db_path, batch_size=500, vacuum=True):
+    """Pack every game still stored as rows. Returns (packed, skipped, size_before, size_after)."""
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(db_path)  # CaroDatabase would create an empty one
+    db = CaroDatabase(db_path, read_connections=1)
+    try:
+        db.connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        size_before = database_size(db_path)
+        packed, skipped = db.pack_moves(batch_size)
+        if vacuum:
+            with db.write_lock:
+                db.connection.execute('VACUUM')
+                db.connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        size_after = database_size(db_path)
+    finally:
+        db.close()
+    return packed, skipped, size_before, size_after
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('db_path', nargs='?', default=DEFAULT_DB_PATH)
+    parser.add_argument('--batch', type=int, default=500, help="games per transaction")
+    parser.add_argument('--no-vacuum', action='store_true', help="skip VACUUM (file keeps its size)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db_path):
+        parser.error(f"{args.db_path} does not exist")
+    packed, skipped, size_before, size_after = migrate(args.db_path, args.batch, not args.no_vacuum)
+    print(f"✅ Packed {packed} games ({skipped} left as rows)")
+    print(f"   {size_before / 1024:.0f} KiB -> {size_after / 1024:.0f} KiB")
+
+
+if __name__ == "__main__":
+    main()
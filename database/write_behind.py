@@ -0,0 +1,169 @@
+# database/write_behind.py - Ghi database phía sau (không chặn luồng xử lý nước đi)
+import threading
+import time
+from collections import deque
+
+from database.database import sql_timestamp
+
+DEFAULT_MAX_PENDING = 10000  # Writes waiting before the queue sheds login timestamps
+DEFAULT_MAX_BATCH = 500      # Writes per transaction
+
+# Results of games: queued even past max_pending, never dropped
+ESSENTIAL_WRITES = ('game', 'score')
+
+
+class WriteBehindQueue:
+    """Deferred database writes applied by one writer thread in grouped transactions.
+
+    Score changes, last_login timestamps and finished games are queued by the game
+    and login paths and return immediately; the writer drains whatever is pending
+    into one transaction (CaroDatabase.apply_writes on the writer connection), so
+    one commit covers the whole batch and disk latency never runs under a room lock.
+
+    Writes are applied in the order they were queued. Readers may see a value a
+    few milliseconds old until the batch commits. Producers never wait: callers
+    hold room locks (handle_game_over) or run on the event loop, so a stalled
+    disk must not stall them. Past max_pending waiting writes, game records and
+    score changes still spill into the queue (they are results and must not be
+    lost) while last_login timestamps are dropped (the next login rewrites
+    them). stats() reports the deepest backlog, spilled and dropped writes.
+
+    flush() waits for everything queued so far; close() flushes and stops the
+    writer. Only close the CaroDatabase if close() returned True: otherwise the
+    writer is still committing on it.
+    """
+    def __init__(self, db, max_pending=DEFAULT_MAX_PENDING, max_batch=DEFAULT_MAX_BATCH):
+        self.db = db
+        self.max_pending = max_pending
+        self.max_batch = max_batch
+        self.pending = deque()
+        self.cond = threading.Condition()
+        self.closed = False
+
+        # --- METRICS ---
+        self.enqueued = 0
+        self.written = 0       # Writes committed (or given up on after an error)
+        self.failed = 0
+        self.batches = 0
+        self.max_depth = 0
+        self.spilled = 0       # Essential writes queued past max_pending
+        self.dropped = 0       # Login timestamps shed with a full queue
+        self.last_batch_seconds = 0.0
+        self.max_batch_seconds = 0.0
+
+        self.writer = threading.Thread(target=self._writer_loop, daemon=True, name="db-writer")
+        self.writer.start()
+
+    def update_score(self, user_id, score_change):
+        """Deferred CaroDatabase.update_user_score"""
+        return self._put(('score', (score_change, user_id)))
+
+    def record_login(self, user_id, when=None):
+        """Deferred last_login update; when defaults to now (UTC, like CURRENT_TIMESTAMP)"""
+        if when is None:
+            when = sql_timestamp(time.time())
+        return self._put(('login', (when, user_id)))
+
+    def save_game(self, **game):
+        """Deferred CaroDatabase.save_game (same keyword arguments)"""
+        return self._put(('game', game))
+
+    def _put(self, operation):
+        with self.cond:
+            if self.closed:
+                print(f"⚠️ Write after shutdown dropped: {operation[0]}")
+                return False
+            if len(self.pending) >= self.max_pending:
+                if operation[0] not in ESSENTIAL_WRITES:
+                    self.dropped += 1
+                    if self.dropped == 1 or self.dropped % 1000 == 0:
+                        print(f"⚠️ Write queue backlogged ({len(self.pending)} pending), "
+                              f"{self.dropped} {operation[0]} writes dropped so far")
+                    return False
+                self.spilled += 1
+            self.pending.append(operation)
+            self.enqueued += 1
+            self.max_depth = max(self.max_depth, len(self.pending))
+            self.cond.notify_all()
+        return True
+
+    def _writer_loop(self):
+        while True:
+            with self.cond:
+                while not self.pending and not self.closed:
+                    self.cond.wait()
+                if not self.pending:
+                    return  # Closed and drained
+                batch = [self.pending.popleft() for _ in range(min(self.max_batch, len(self.pending)))]
+
+            start = time.perf_counter()
+            failed = self._apply(batch)
+            elapsed = time.perf_counter() - start
+
+            with self.cond:
+                self.written += len(batch)
+                self.failed += failed
+                self.batches += 1
+                self.last_batch_seconds = elapsed
+                self.max_batch_seconds = max(self.max_batch_seconds, elapsed)
+                self.cond.notify_all()  # Wake flush()
+
+    def _apply(self, batch):
+        """Apply a batch; if the transaction fails, retry each write alone. Returns writes lost."""
+        try:
+            self.db.apply_writes(batch)
+            return 0
+        except Exception as e:
+            print(f"❌ Batch of {len(batch)} writes failed ({e}), retrying one by one")
+        failed = 0
+        for operation in batch:
+            try:
+                self.db.apply_writes([operation])
+            except Exception as e:
+                failed += 1
+                print(f"❌ Failed to write {operation[0]}: {e}")
+        return failed
+
+    def flush(self, timeout=None):
+        """Wait until every write queued before this call is committed. False on timeout."""
+        with self.cond:
+            target = self.enqueued
+            return self.cond.wait_for(lambda: self.written >= target, timeout)
+
+    def close(self, timeout=10):
+        """Flush pending writes and stop the writer thread.
+
+        True once the writer has finished; False if it is still writing after
+        timeout (the database must stay open, see shutdown()).
+        """
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.writer.join(timeout)
+        if self.writer.is_alive():
+            print(f"⚠️ Database writer still busy after {timeout}s ({len(self.pending)} writes pending)")
+            return False
+        return True
+
+    def shutdown(self, timeout=10):
+        """close(), then close the database unless the writer is still using it"""
+        if self.close(timeout):
+            self.db.close()
+            return True
+        return False
+
+    def stats(self):
+        with self.cond:
+            return {
+                'pending': len(self.pending),
+                'max_depth': self.max_depth,
+                'enqueued': self.enqueued,
+                'written': self.written,
+                'failed': self.failed,
+                'batches': self.batches,
+                'avg_batch': self.written / self.batches if self.batches else 0,
+                'spilled': self.spilled,
+                'dropped': self.dropped,
+                'last_batch_ms': self.last_batch_seconds * 1000,
+                'max_batch_ms': self.max_batch_seconds * 1000,
+            }
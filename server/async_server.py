@@ -0,0 +1,150 @@
+import asyncio
+import threading
+import sys
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Thêm đường dẫn để import được module từ thư mục cha
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.main import CaroServer
+from server.connection import AsyncConnection
+from shared.protocol import MessageDecoder
+
+# Message gọi sqlite đồng bộ (+ băm mật khẩu): chạy trên thread pool, không trên event loop
+DATABASE_MESSAGES = ('LOGIN', 'REGISTER', 'EDIT_PROFILE')
+DEFAULT_DATABASE_THREADS = 4
+
+
+class CaroClientProtocol(asyncio.BufferedProtocol):
+    """Một kết nối client trong chế độ asyncio (không tốn thread/task riêng).
+    
+    BufferedProtocol cho phép event loop ghi thẳng vào buffer của MessageDecoder.
+    """
+    def __init__(self, server):
+        self.server = server
+        self.client_id = None
+        self.transport = None
+        self.decoder = MessageDecoder()
+        self.database_task = None  # Message đụng database đang chạy trên thread pool
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.client_id = self.server.client_counter
+        self.server.client_counter += 1
+        print(f"🔗 New connection: {transport.get_extra_info('peername')}")
+        connection = AsyncConnection(transport, self.server.loop, **self.server.connection_options)
+        self.server.user_manager.add_client(self.client_id, connection)
+        self.server.watch_heartbeat(self.client_id)
+
+    def get_buffer(self, sizehint):
+        return self.decoder.get_buffer(sizehint)
+
+    def buffer_updated(self, nbytes):
+        self.decoder.buffer_updated(nbytes)
+        try:
+            self.server.user_manager.update_activity(self.client_id)
+        except: pass
+
+        self.process_pending()
+
+    def process_pending(self):
+        """Xử lý theo thứ tự các message đã đủ trong decoder.
+
+        Message đụng database chạy trên thread pool; trong lúc đó các message sau của
+        client này nằm chờ trong decoder, nên thứ tự của từng client vẫn giữ nguyên
+        còn event loop tiếp tục phục vụ những client khác.
+        """
+        try:
+            while self.database_task is None:
+                message = self.server.next_message(self.client_id, self.decoder)
+                if message is None:
+                    return
+                if message.get('type') in DATABASE_MESSAGES:
+                    self.database_task = self.server.loop.run_in_executor(
+                        self.server.database_executor, self.server.dispatch, self.client_id, message)
+                    self.database_task.add_done_callback(self.database_done)
+                else:
+                    self.server.dispatch(self.client_id, message)
+        except Exception as e:
+            print(f"Error client {self.client_id}: {e}")
+            import traceback
+            traceback.print_exc()
+            self.transport.close()
+
+    def database_done(self, future):
+        self.database_task = None
+        if not self.transport.is_closing():
+            self.process_pending()
+
+    def connection_lost(self, exc):
+        self.server.disconnect_client(self.client_id)
+
+
+class AsyncCaroServer(CaroServer):
+    """Chế độ server dùng một event loop asyncio thay cho mỗi kết nối một thread.
+
+    Giao thức và luồng xử lý message (process_message) giữ nguyên như CaroServer,
+    chỉ khác phần nhận/gửi dữ liệu trên socket. Đăng nhập / đăng ký / sửa hồ sơ đọc
+    sqlite đồng bộ nên chạy trên database_executor (DATABASE_MESSAGES).
+    """
+    def __init__(self, host='127.0.0.1', port=5555, db_path=None, backlog=1024,
+                 database_threads=DEFAULT_DATABASE_THREADS, **kwargs):
+        super().__init__(host, port, db_path, **kwargs)
+        self.backlog = backlog
+        self.database_executor = ThreadPoolExecutor(database_threads, thread_name_prefix="db-handler")
+        self.loop = None
+        self.aio_server = None
+        self.started = threading.Event()  # Báo hiệu đã listen xong (dùng cho test)
+
+    def start(self):
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            print("\n🛑 Server stopped by user.")
+        except Exception as e:
+            print(f"❌ Server error: {e}")
+        finally:
+            print("Cleaning up...")
+            self.running = False
+            self.scheduler.stop()
+            self.lobby_broadcaster.stop()
+            self.database_executor.shutdown(wait=True)
+            self.db_writer.shutdown()  # Ghi nốt hàng đợi rồi mới đóng database
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        context = self.create_ssl_context()
+
+        self.aio_server = await self.loop.create_server(
+            lambda: CaroClientProtocol(self),
+            self.host, self.port,
+            ssl=context,
+            reuse_address=True,
+            backlog=self.backlog
+        )
+        # Lấy port thật (khi truyền port=0)
+        self.port = self.aio_server.sockets[0].getsockname()[1]
+        self.running = True
+
+        print(f"🚀 Caro Server (asyncio) running on {self.host}:{self.port}")
+        print("💾 Database connected successfully")
+
+        self.started.set()
+
+        async with self.aio_server:
+            try:
+                await self.aio_server.serve_forever()
+            except asyncio.CancelledError:
+                pass
+
+    def stop(self):
+        """Dừng server từ một thread khác"""
+        self.running = False
+        if self.loop and self.aio_server:
+            self.loop.call_soon_threadsafe(self.aio_server.close)
+
+
+if __name__ == "__main__":
+    server = AsyncCaroServer()
+    server.start()
@@ -0,0 +1,223 @@
+import queue
+import socket
+import threading
+from abc import ABC, abstractmethod
+
+# Giới hạn dữ liệu chờ gửi cho mỗi client (bytes) và chính sách khi vượt
+DEFAULT_MAX_QUEUE_BYTES = 512 * 1024
+OVERFLOW_DROP = 'drop'              # Bỏ message mới, giữ kết nối
+OVERFLOW_DISCONNECT = 'disconnect'  # Ngắt client chậm, để luồng nhận dọn dẹp như bình thường
+OVERFLOW_POLICIES = (OVERFLOW_DROP, OVERFLOW_DISCONNECT)
+
+_COALESCE_BYTES = 64 * 1024  # Gộp các message đang chờ thành một lần sendall
+
+
+class OutboundConnection(ABC):
+    """Hàng đợi gửi có giới hạn cho một client.
+
+    send() không bao giờ block: dữ liệu được xếp hàng và một writer riêng ghi ra socket,
+    nên một client chậm không làm treo vòng broadcast của người khác.
+    Lớp con quyết định writer là gì: _enqueue / close / abort.
+    """
+    def __init__(self, max_queue_bytes=DEFAULT_MAX_QUEUE_BYTES, overflow_policy=OVERFLOW_DISCONNECT):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+        self.max_queue_bytes = max_queue_bytes
+        self.overflow_policy = overflow_policy
+        self.closed = False
+        self.lock = threading.Lock()
+
+        # --- METRICS ---
+        self.queued_bytes = 0
+        self.max_queued_bytes = 0
+        self.messages_sent = 0
+        self.bytes_sent = 0
+        self.messages_dropped = 0
+        self.overflows = 0
+
+    def send(self, data):
+        """Xếp hàng dữ liệu đã encode. Trả về False nếu bị bỏ (đóng kết nối hoặc tràn)."""
+        if self.closed:
+            return False
+
+        with self.lock:
+            depth = self.queue_depth()
+            overflow = depth + len(data) > self.max_queue_bytes
+            if overflow:
+                self.overflows += 1
+                self.messages_dropped += 1
+            else:
+                self.queued_bytes += len(data)
+                self.max_queued_bytes = max(self.max_queued_bytes, depth + len(data))
+
+        if overflow:
+            if self.overflow_policy == OVERFLOW_DISCONNECT:
+                print(f"🐢 Outbound queue full ({depth} bytes). Disconnecting slow client.")
+                self.abort()
+            return False
+
+        self._enqueue(data)
+        return True
+
+    # Giữ tương thích với code cũ gọi thẳng socket.sendall
+    sendall = send
+
+    def queue_depth(self):
+        """Số bytes đang chờ gửi"""
+        return self.queued_bytes
+
+    def _mark_sent(self, nbytes, count):
+        with self.lock:
+            self.queued_bytes -= nbytes
+            self.bytes_sent += nbytes
+            self.messages_sent += count
+
+    def stats(self):
+        with self.lock:
+            return {
+                'queued_bytes': self.queue_depth(),
+                'max_queued_bytes': self.max_queued_bytes,
+                'messages_sent': self.messages_sent,
+                'bytes_sent': self.bytes_sent,
+                'messages_dropped': self.messages_dropped,
+                'overflows': self.overflows,
+            }
+
+    @abstractmethod
+    def _enqueue(self, data):
+        """Đưa data (đã tính vào queued_bytes) cho writer; gọi _mark_sent khi đã ghi"""
+
+    @abstractmethod
+    def close(self):
+        """Đóng kết nối, bỏ dữ liệu còn chờ"""
+
+    @abstractmethod
+    def abort(self):
+        """Ngắt client (tràn hàng đợi); luồng nhận dọn dẹp như khi peer tự ngắt"""
+
+
+class ThreadedConnection(OutboundConnection):
+    """Writer là một thread riêng cho mỗi socket (chế độ thread-per-connection)
+
+    Mỗi client tốn hai thread: handle_client đọc, _writer_loop ghi. sendall block được
+    nên writer không chia sẻ giữa các socket; muốn ít thread hơn thì dùng chế độ
+    asyncio (AsyncConnection, không thread nào riêng cho client).
+    """
+    _STOP = object()
+
+    def __init__(self, sock, **kwargs):
+        super().__init__(**kwargs)
+        self.sock = sock
+        self.queue = queue.Queue()
+        self.writer = threading.Thread(target=self._writer_loop, daemon=True)
+        self.writer.start()
+
+    def _enqueue(self, data):
+        self.queue.put(data)
+
+    def _writer_loop(self):
+        while True:
+            item = self.queue.get()
+            if item is self._STOP:
+                return
+
+            # Gộp những gì đang chờ để giảm số lần gọi sendall
+            chunks = [item]
+            size = len(item)
+            stop = False
+            while size < _COALESCE_BYTES:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stop = True
+                    break
+                chunks.append(item)
+                size += len(item)
+
+            try:
+                self.sock.sendall(b''.join(chunks))
+            except Exception as e:
+                if not self.closed:
+                    print(f"❌ Writer error: {e}")
+                # Don't auto-disconnect here, let recv loop handle it
+                self.closed = True
+                return
+            self._mark_sent(size, len(chunks))
+
+            if stop:
+                return
+
+    def close(self):
+        """Đóng kết nối; dữ liệu còn chờ gửi bị bỏ (peer đã đi hoặc bị kick)"""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(self._STOP)
+        self._shutdown()
+        try:
+            self.sock.close()
+        except: pass
+
+    def abort(self):
+        # Chỉ shutdown: recv trong handle_client trả về rỗng -> disconnect_client như thường
+        self.closed = True
+        self.queue.put(self._STOP)
+        self._shutdown()
+
+    def _shutdown(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except: pass
+
+
+class AsyncConnection(OutboundConnection):
+    """Bọc transport của asyncio: hàng đợi = buffer ghi của transport + phần chưa tới loop.
+
+    Các luồng khác (timeout loop, cleanup...) vẫn gọi send_to_client, nên mọi thao tác
+    từ ngoài event loop phải chuyển vào loop bằng call_soon_threadsafe. Dữ liệu nằm chờ
+    callback đó vẫn được tính trong queued_bytes (giảm khi _write chạy), nên một loạt
+    send từ thread khác không vượt được max_queue_bytes.
+    """
+    def __init__(self, transport, loop, **kwargs):
+        super().__init__(**kwargs)
+        self.transport = transport
+        self.loop = loop
+        self.loop_thread_id = threading.get_ident()
+
+    def _in_loop(self):
+        return threading.get_ident() == self.loop_thread_id
+
+    def _enqueue(self, data):
+        # transport.write không block: dữ liệu được đệm lại và ghi dần bởi event loop
+        if self._in_loop():
+            self._write(data)
+        else:
+            self.loop.call_soon_threadsafe(self._write, data)
+
+    def queue_depth(self):
+        # queued_bytes: chưa tới event loop; buffer của transport: kernel chưa nhận
+        return self.queued_bytes + self.transport.get_write_buffer_size()
+
+    def _write(self, data):
+        if self.transport.is_closing():
+            with self.lock:
+                self.queued_bytes -= len(data)  # Bỏ, không tính là đã gửi
+            return
+        self.transport.write(data)
+        self._mark_sent(len(data), 1)
+
+    def close(self):
+        self.closed = True
+        if self._in_loop():
+            self.transport.close()
+        else:
+            self.loop.call_soon_threadsafe(self.transport.close)
+
+    def abort(self):
+        self.closed = True
+        if self._in_loop():
+            self.transport.abort()
+        else:
+            self.loop.call_soon_threadsafe(self.transport.abort)
@@ -2,6 +2,8 @@
 import json
 import time
 
+from server.pubsub import room_topic
+
 class GameLogic:
     @staticmethod
     def handle_message(client_id, message, server):
@@ -22,75 +24,68 @@ class GameLogic:
         if not client:
             return
             
-        room_id = client.get('room_id')
-        if not room_id or room_id not in server.room_manager.rooms:
-            return
-            
-        room = server.room_manager.rooms[room_id]
-        board = room['board']
-        
-        try:
-            p_idx = room['players'].index(client_id)
-            player_num = p_idx + 1
-        except:
-            return
-            
-        # Check Timer
-        if room['turn_deadline'] and time.time() > room['turn_deadline']:
-            print(f"⏳ Time expired for {client['username']}")
-            # Auto lose logic
-            GameLogic.handle_game_over(room, room['players'][1 - p_idx], server) # Opponent wins
-            return
-            
-        # Check Freeze (Pause)
-        if room.get('is_frozen'):
-            server.send_error(client_id, "Game đang tạm dừng chờ đối thủ kết nối lại.")
-            return
-            
-        # Check if it's the player's turn
-        # p_idx is 0 for player 1 (X), 1 for player 2 (O)
-        # board.current_player is 1 for X, 2 for O
-        if p_idx != (0 if room['board'].current_player == 1 else 1):
-            print(f"⚠️ Move rejected: Not player's turn. Client: {client_id}, Board Turn: {room['board'].current_player}")
-            return
+        # Giữ lock của phòng suốt nước đi: không đua với hết giờ / đầu hàng / rời phòng
+        with server.room_manager.locked_room(client.room_id) as room:
+            if room is None:
+                return
             
-        x, y = message.get('x'), message.get('y')
-        success, result = board.make_move(x, y, player_num)
+            board = room.board
         
-        if success:
-            print(f"✅ Move valid: {x},{y} by {client_id}. Result: {result}")
-            opponent_id = room['players'][1 - p_idx]
-            player_name = client.get('display_name', client['username'])
-            symbol = 'X' if player_num == 1 else 'O'
-            
             try:
-                server.send_to_client(opponent_id, {
-                    'type': 'OPPONENT_MOVE',
-                    'x': x, 'y': y,
-                    'player': client['username'],
-                    'symbol': symbol
-                })
-                print(f"📡 Sent OPPONENT_MOVE to {opponent_id}")
-            except Exception as e:
-                print(f"❌ Failed to send move to opponent {opponent_id}: {e}")
-            
-            # Broadcast to Spectators
-            for spec_id in room.get('spectators', []):
-                server.send_to_client(spec_id, {
-                    'type': 'OPPONENT_MOVE',
-                    'x': x, 'y': y,
-                    'player': client['username'], # Or display_name if needed
-                    'symbol': symbol
-                })
-            
-            # Reset Timer
-            room['turn_deadline'] = time.time() + room['time_limit']
-            
-            
-            if result == 'win':
-                GameLogic.handle_game_over(room, client_id, server)
-            elif result == 'draw':
-                GameLogic.handle_game_over(room, None, server)
+                p_idx = room.players.index(client_id)
+                player_num = p_idx + 1
+            except:
+                return
+            
+            # Check Timer
+            if room.turn_deadline and time.time() > room.turn_deadline:
+                print(f"⏳ Time expired for {client.username}")
+                # Auto lose logic
+                GameLogic.handle_game_over(room, room.players[1 - p_idx], server) # Opponent wins
+                return
+            
+            # Check Freeze (Pause)
+            if room.is_frozen:
+                server.send_error(client_id, "Game đang tạm dừng chờ đối thủ kết nối lại.")
+                return
+            
+            # Check if it's the player's turn
+            # p_idx is 0 for player 1 (X), 1 for player 2 (O)
+            # board.current_player is 1 for X, 2 for O
+            if p_idx != (0 if room.board.current_player == 1 else 1):
+                print(f"⚠️ Move rejected: Not player's turn. Client: {client_id}, Board Turn: {room.board.current_player}")
+                return
+            
+            x, y = message.get('x'), message.get('y')
+            success, result = board.make_move(x, y, player_num)
+        
+            if success:
+                room.move_times.append(time.time())
+                print(f"✅ Move valid: {x},{y} by {client_id}. Result: {result}")
+                opponent_id = room.players[1 - p_idx]
+                player_name = client.name
+                symbol = 'X' if player_num == 1 else 'O'
+            
+                # Đối thủ + khán giả: một lần publish lên topic của phòng (encode một lần)
+                try:
+                    server.bus.publish(room_topic(room.id), {
+                        'type': 'OPPONENT_MOVE',
+                        'x': x, 'y': y,
+                        'player': client.username,
+                        'symbol': symbol
+                    }, exclude=(client_id,))
+                    print(f"📡 Sent OPPONENT_MOVE to {opponent_id}")
+                except Exception as e:
+                    print(f"❌ Failed to send move to opponent {opponent_id}: {e}")
+            
+                # Reset Timer
+                server.room_manager.set_turn_deadline(room, time.time() + room.time_limit)
+            
+            
+                if result == 'win':
+                    GameLogic.handle_game_over(room, client_id, server)
+                elif result == 'draw':
+                    GameLogic.handle_game_over(room, None, server)
                 
     @staticmethod
     def handle_surrender(client_id, server):
@@ -98,74 +93,108 @@ class GameLogic:
         if not client:
             return
             
-        room_id = client.get('room_id')
-        if not room_id or room_id not in server.room_manager.rooms:
-            return
-            
-        room = server.room_manager.rooms[room_id]
+        room_id = client.room_id
+        with server.room_manager.locked_room(room_id) as room:
+            if room is None:
+                return
         
-        # Người đầu hàng = Người thua -> Người kia thắng
-        opponent_id = None
-        for pid in room['players']:
-            if pid != client_id:
-                opponent_id = pid
-                break
+            # Người đầu hàng = Người thua -> Người kia thắng
+            opponent_id = None
+            for pid in room.players:
+                if pid != client_id:
+                    opponent_id = pid
+                    break
         
-        if opponent_id:
-            print(f"🏳️ {client['username']} surrendered!")
-            GameLogic.handle_game_over(room, opponent_id, server)
+            if opponent_id:
+                print(f"🏳️ {client.username} surrendered!")
+                GameLogic.handle_game_over(room, opponent_id, server)
             
     @staticmethod
     def handle_play_again(client_id, server):
         client = server.user_manager.get_client(client_id)
         if not client: return
             
-        room_id = client.get('room_id')
-        if not room_id or room_id not in server.room_manager.rooms: return
-            
-        room = server.room_manager.rooms[room_id]
-        
-        # 1. Reset trạng thái phòng
-        from shared.board import CaroBoard
-        room['board'] = CaroBoard()
-        room['status'] = 'playing'
-        
-        # 2. Hoán đổi vị trí (Người thắng ván trước đi sau, hoặc đổi lượt)
-        if len(room['players']) < 2:
-            print(f"⚠️ Cannot restart room {room.get('id')}: Not enough players.")
-            server.send_error(client_id, "Đối thủ đã rời phòng. Không thể chơi lại.")
-            return
+        room_id = client.room_id
+        with server.room_manager.locked_room(room_id) as room:
+            if room is None:
+                return
+        
+            # 1. Reset trạng thái phòng
+            from shared.bitboard import BitboardCaroBoard as CaroBoard
+            from server.room_manager import board_config, player_user_ids
+            room.board = CaroBoard(room.board_size, room.win_length)
+            room.status = 'playing'
+        
+            # 2. Hoán đổi vị trí (Người thắng ván trước đi sau, hoặc đổi lượt)
+            if len(room.players) < 2:
+                print(f"⚠️ Cannot restart room {room.id}: Not enough players.")
+                server.send_error(client_id, "Đối thủ đã rời phòng. Không thể chơi lại.")
+                return
 
-        room['players'].reverse() 
-        
-        # 3. Lấy tên hiển thị chuẩn để gửi về Client
-        p1_id = room['players'][0]
-        p2_id = room['players'][1]
-        c1 = server.user_manager.get_client(p1_id)
-        c2 = server.user_manager.get_client(p2_id)
-        
-        p1_name = c1.get('display_name', c1['username'])
-        p2_name = c2.get('display_name', c2['username'])
-        
-        # 4. Gửi thông báo start game cho TỪNG người với Symbol cụ thể
-        # Người đầu tiên trong list luôn là X, người thứ 2 là O
-        for i, pid in enumerate(room['players']):
-            symbol = 'X' if i == 0 else 'O'
-            server.send_to_client(pid, {
-                'type': 'ROOM_JOINED', 
-                'room_id': room_id,
-                'players': [p1_name, p2_name],
-                'player_symbol': symbol # <--- QUAN TRỌNG: Phải gửi cái này client mới biết ai đánh
-            })
+            room.players.reverse() 
+            room.start_game(player_user_ids(room, server))
+        
+            # 3. Lấy tên hiển thị chuẩn để gửi về Client
+            p1_id = room.players[0]
+            p2_id = room.players[1]
+            c1 = server.user_manager.get_client(p1_id)
+            c2 = server.user_manager.get_client(p2_id)
+        
+            p1_name = c1.name
+            p2_name = c2.name
+        
+            # 4. Gửi thông báo start game cho TỪNG người với Symbol cụ thể
+            # Người đầu tiên trong list luôn là X, người thứ 2 là O
+            for i, pid in enumerate(room.players):
+                symbol = 'X' if i == 0 else 'O'
+                server.send_to_client(pid, {
+                    'type': 'ROOM_JOINED', 
+                    'room_id': room_id,
+                    'players': [p1_name, p2_name],
+                    'player_symbol': symbol, # <--- QUAN TRỌNG: Phải gửi cái này client mới biết ai đánh
+                    **board_config(room)
+                })
             
-        # Reset Timer
-        room['turn_deadline'] = time.time() + room['time_limit'] + 2 # buffer
+            # Reset Timer
+            server.room_manager.set_turn_deadline(room, time.time() + room.time_limit + 2) # buffer
+            server.room_manager.refresh_room(room)
             
-        print(f"🔄 Room {room_id} restarted! X: {p1_name}, O: {p2_name}")
+            print(f"🔄 Room {room_id} restarted! X: {p1_name}, O: {p2_name}")
         
+    @staticmethod
+    def save_game(room, winner_id, server):
+        """Đưa ván vừa xong (các nước + thời gian thật) vào hàng đợi ghi. False nếu không lưu được.
+
+        Một lần save_game = game + moves + thống kê + điểm (+10 / -5) trong cùng transaction.
+        """
+        if len(room.user_ids) != 2 or None in room.user_ids or room.started_at is None:
+            return False  # Chưa đăng nhập / ván không bắt đầu bình thường
+        user_ids = room.user_ids
+        winner_user_id = None
+        if winner_id is not None:
+            if winner_id not in room.players:
+                return False
+            winner_user_id = user_ids[room.players.index(winner_id)]
+        ended_at = time.time()
+        history = room.board.moves_history
+        times = room.move_times if len(room.move_times) == len(history) else [ended_at] * len(history)
+        moves_data = [{'player_id': user_ids[player - 1], 'x': x, 'y': y, 'time': when}
+                      for (x, y, player), when in zip(history, times)]
+        return server.db_writer.save_game(
+            player1_id=user_ids[0], player2_id=user_ids[1], moves_data=moves_data,
+            winner_id=winner_user_id, board_size=room.board_size,
+            started_at=room.started_at, ended_at=ended_at,
+            win_points=10, loss_points=5, draw_points=0)
+
     @staticmethod
     def handle_game_over(room, winner_id, server):
-        room['status'] = 'finished'
+        """Kết thúc ván (gọi khi đang giữ room.lock)"""
+        # Hết giờ và nước thắng cùng lúc: chỉ tính điểm một lần
+        if room.status == 'finished':
+            return
+        room.status = 'finished'
+        server.room_manager.set_turn_deadline(room, None)
+        server.room_manager.refresh_room(room)
         
         # Lấy thông tin người thắng để hiển thị
         winner_username = 'Draw'
@@ -174,41 +203,41 @@ class GameLogic:
         if winner_id:
             w_client = server.user_manager.get_client(winner_id)
             if w_client:
-                winner_username = w_client['username']
-                winner_display_name = w_client.get('display_name', w_client['username'])
+                winner_username = w_client.username
+                winner_display_name = w_client.name
         
-        # --- CẬP NHẬT ĐIỂM SỐ (DATABASE) ---
-        if winner_id and winner_id in server.user_manager.clients:
+        # --- LƯU VÁN + ĐIỂM SỐ (DATABASE, ghi phía sau: không chờ commit trong room lock) ---
+        saved = GameLogic.save_game(room, winner_id, server)
+        if not saved and winner_id and winner_id in server.user_manager.clients:
+            # Không lưu được ván (thiếu user id): chỉ cập nhật điểm như trước
             # Cộng điểm người thắng
-            winner_user_id = server.user_manager.clients[winner_id]['user_id']
-            server.db.update_user_score(winner_user_id, 10)
+            winner_user_id = server.user_manager.clients[winner_id].user_id
+            server.db_writer.update_score(winner_user_id, 10)
             
             # Trừ điểm người thua
             loser_id = None
-            for pid in room['players']:
+            for pid in room.players:
                 if pid != winner_id:
                     loser_id = pid
                     break
             
             if loser_id and loser_id in server.user_manager.clients:
-                loser_user_id = server.user_manager.clients[loser_id]['user_id']
-                server.db.update_user_score(loser_user_id, -5)
-        
-        # --- GỬI THÔNG BÁO ---
-        for pid in room['players']:
-            server.send_to_client(pid, {
-                'type': 'GAME_OVER',
-                'message': f"Kết thúc! Người thắng: {winner_display_name}" if winner_id else "Hòa cờ!",
-                'winner': winner_username if winner_id else 'Draw' 
-            })
-            
-        # Broadcast to Spectators
-        for spec_id in room.get('spectators', []):
-             server.send_to_client(spec_id, {
-                'type': 'GAME_OVER',
-                'message': f"Kết thúc! Người thắng: {winner_display_name}" if winner_id else "Hòa cờ!",
-                'winner': winner_username if winner_id else 'Draw' 
-            })
+                loser_user_id = server.user_manager.clients[loser_id].user_id
+                server.db_writer.update_score(loser_user_id, -5)
+        
+        # Điểm trong phiên (dùng cho QUICK_MATCH) đi cùng database, không cần đọc lại
+        if winner_id:
+            for pid in room.players:
+                client = server.user_manager.get_client(pid)
+                if client and client.rating is not None:
+                    client.rating = client.rating + 10 if pid == winner_id else max(client.rating - 5, 0)
+        
+        # --- GỬI THÔNG BÁO (người chơi + khán giả) ---
+        server.bus.publish(room_topic(room.id), {
+            'type': 'GAME_OVER',
+            'message': f"Kết thúc! Người thắng: {winner_display_name}" if winner_id else "Hòa cờ!",
+            'winner': winner_username if winner_id else 'Draw' 
+        })
         
         # Cập nhật lại danh sách điểm số ngoài sảnh chờ
-        server.user_manager.broadcast_online_players(server)
\ No newline at end of file
+        server.lobby_broadcaster.mark_dirty(rooms=True, players=True)
\ No newline at end of file
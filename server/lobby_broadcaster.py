@@ -0,0 +1,89 @@
+import threading
+import time
+
+DEFAULT_LOBBY_BROADCAST_INTERVAL = 0.1  # Giây; 0 = gửi ngay (đồng bộ như trước)
+
+
+class LobbyBroadcaster:
+    """Gộp các cập nhật sảnh chờ: đánh dấu 'dirty', gửi tối đa một lần mỗi interval.
+
+    Lúc cao điểm mỗi giây có hàng chục lượt vào/ra phòng; thay vì mỗi lượt dựng và
+    gửi lại danh sách phòng + người chơi cho cả sảnh, các lượt trong cùng một
+    khoảng interval chỉ tạo ra một lần broadcast (chi phí không tăng theo số lượt).
+
+    Lần đánh dấu đầu tiên sau một khoảng yên lặng được gửi ngay, các lần sau phải
+    đợi tới hết interval kể từ lần gửi trước.
+    """
+    def __init__(self, server, interval=DEFAULT_LOBBY_BROADCAST_INTERVAL):
+        self.server = server
+        self.interval = interval
+        self.rooms_dirty = False
+        self.players_dirty = False
+        self.last_flush = 0.0
+        self.running = True
+        self.condition = threading.Condition()
+
+        # --- METRICS ---
+        self.marks = 0    # Số lần được yêu cầu broadcast
+        self.flushes = 0  # Số lần broadcast thật sự
+
+        self.thread = None
+        if interval > 0:
+            self.thread = threading.Thread(target=self._flush_loop, daemon=True)
+            self.thread.start()
+
+    def mark_dirty(self, rooms=False, players=False):
+        """Báo sảnh chờ đã thay đổi; không block người gọi khi interval > 0"""
+        with self.condition:
+            self.marks += 1
+            self.rooms_dirty = self.rooms_dirty or rooms
+            self.players_dirty = self.players_dirty or players
+            if self.thread is not None:
+                self.condition.notify()
+                return
+        self.flush()
+
+    def flush(self):
+        """Gửi ngay những phần đang dirty"""
+        with self.condition:
+            rooms, players = self.rooms_dirty, self.players_dirty
+            self.rooms_dirty = self.players_dirty = False
+            self.last_flush = time.monotonic()
+            if rooms or players:
+                self.flushes += 1
+
+        # Gửi ngoài lock: broadcast lấy lock của RoomManager / LobbyState
+        if rooms:
+            self.server.room_manager.broadcast_room_list(self.server)
+        if players:
+            self.server.user_manager.broadcast_online_players(self.server)
+
+    def _flush_loop(self):
+        while True:
+            with self.condition:
+                while self.running and not (self.rooms_dirty or self.players_dirty):
+                    self.condition.wait()
+                if not self.running:
+                    return
+                # Chờ hết interval kể từ lần gửi trước (các lần đánh dấu trong lúc chờ được gộp)
+                delay = self.last_flush + self.interval - time.monotonic()
+                if delay > 0:
+                    self.condition.wait(delay)
+                    continue
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error in lobby broadcaster: {e}")
+
+    def stats(self):
+        with self.condition:
+            return {'marks': self.marks, 'flushes': self.flushes}
+
+    def stop(self):
+        """Dừng thread, gửi nốt thay đổi còn lại"""
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join(1)
+        self.flush()
@@ -0,0 +1,90 @@
+import threading
+
+from server.pubsub import LOBBY_TOPIC
+
+# --- CÁC LOẠI SỰ KIỆN DELTA ---
+PLAYER_JOINED = 'PLAYER_JOINED'
+PLAYER_LEFT = 'PLAYER_LEFT'
+PLAYER_UPDATED = 'PLAYER_UPDATED'
+ROOM_ADDED = 'ROOM_ADDED'
+ROOM_CHANGED = 'ROOM_CHANGED'
+ROOM_REMOVED = 'ROOM_REMOVED'
+
+
+class LobbyState:
+    """Trạng thái sảnh chờ có đánh version, dùng để gửi delta thay vì gửi lại toàn bộ danh sách.
+
+    Mỗi sự kiện tăng version lên 1. Một lần publish gửi một message LOBBY_DELTA
+    {base_version, version, events}; client chỉ áp dụng khi base_version khớp version
+    đang có, ngược lại gửi GET_LOBBY_SNAPSHOT để lấy lại toàn bộ.
+    """
+    def __init__(self):
+        self.version = 0
+        self.players = {}  # user_id -> player dict (như get_online_players)
+        self.rooms = {}    # room_id -> room summary (như get_room_list, giữ thứ tự tạo phòng)
+        self.lock = threading.RLock()
+
+    def _sync(self, current, items, key, added, changed, removed, item_name):
+        """So sánh danh sách mới với trạng thái đang giữ, cập nhật và trả về các sự kiện"""
+        events = []
+        seen = set()
+        for item in items:
+            item_id = item[key]
+            seen.add(item_id)
+            old = current.get(item_id)
+            if old is None:
+                events.append({'type': added, item_name: item})
+            elif old != item:
+                events.append({'type': changed, item_name: item})
+            else:
+                continue
+            current[item_id] = item
+
+        for item_id in [i for i in current if i not in seen]:
+            del current[item_id]
+            events.append({'type': removed, key: item_id})
+
+        self.version += len(events)
+        return events
+
+    def sync_players(self, players):
+        return self._sync(self.players, players, 'user_id', PLAYER_JOINED, PLAYER_UPDATED, PLAYER_LEFT, 'player')
+
+    def sync_rooms(self, rooms):
+        return self._sync(self.rooms, rooms, 'id', ROOM_ADDED, ROOM_CHANGED, ROOM_REMOVED, 'room')
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'type': 'LOBBY_SNAPSHOT',
+                'version': self.version,
+                'players': list(self.players.values()),
+                'rooms': list(self.rooms.values())
+            }
+
+    def publish(self, server, players=None, rooms=None, exclude=None):
+        """Cập nhật trạng thái và gửi delta cho các client hỗ trợ lobby_deltas.
+
+        exclude: client sắp nhận snapshot, không cần delta trước đó.
+
+        Giữ lock trong lúc xếp hàng gửi (không block, xem connection.py) để các delta
+        tới client đúng thứ tự version.
+        """
+        with self.lock:
+            base_version = self.version
+            events = []
+            if players is not None:
+                events += self.sync_players(players)
+            if rooms is not None:
+                events += self.sync_rooms(rooms)
+            if not events:
+                return
+
+            # Người nghe LOBBY_TOPIC: client đã đăng nhập và hỗ trợ lobby_deltas.
+            # Version là của node này nên delta không gửi sang node khác (remote=False).
+            server.bus.publish(LOBBY_TOPIC, {
+                'type': 'LOBBY_DELTA',
+                'base_version': base_version,
+                'version': self.version,
+                'events': events
+            }, exclude=(exclude,), remote=False)
@@ -10,24 +10,64 @@ import time
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from database.database import CaroDatabase
+from database.write_behind import WriteBehindQueue
+from server.lobby_state import LobbyState
+from server.lobby_broadcaster import LobbyBroadcaster, DEFAULT_LOBBY_BROADCAST_INTERVAL
+from server.scheduler import DeadlineScheduler
+from server.reconnect_grace import ReconnectGraceService, DEFAULT_GRACE_SECONDS, DEFAULT_MAX_SESSIONS
+from server.matchmaking import MatchmakingService, DEFAULT_MATCHMAKING_TICK
+from server.pubsub import LocalBus, room_topic
+from shared.protocol import MessageDecoder, InvalidMessage, SUPPORTED_FRAMINGS, SUPPORTED_FEATURES, FEATURE_LOBBY_DELTAS
 from server.room_manager import RoomManager
 from server.user_manager import UserManager
+from server.connection import ThreadedConnection, DEFAULT_MAX_QUEUE_BYTES, OVERFLOW_DISCONNECT
+
+HEARTBEAT_TIMEOUT = 15  # Giây không nhận được gì từ client -> ngắt
 
 class CaroServer:
-    def __init__(self, host='127.0.0.1', port=5555):
+    def __init__(self, host='127.0.0.1', port=5555, db_path=None,
+                 max_queue_bytes=DEFAULT_MAX_QUEUE_BYTES, overflow_policy=OVERFLOW_DISCONNECT,
+                 lobby_broadcast_interval=DEFAULT_LOBBY_BROADCAST_INTERVAL,
+                 reconnect_grace_seconds=DEFAULT_GRACE_SECONDS, max_grace_sessions=DEFAULT_MAX_SESSIONS,
+                 matchmaking_tick=DEFAULT_MATCHMAKING_TICK):
         self.host = host
         self.port = port
-        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket = None
+        # Hàng đợi gửi của mỗi client: giới hạn bytes + xử lý khi tràn ('drop' / 'disconnect')
+        self.connection_options = {
+            'max_queue_bytes': max_queue_bytes,
+            'overflow_policy': overflow_policy
+        }
         
         # KẾT NỐI DATABASE
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-        db_path = os.path.join(base_dir, "../database/caro.db")
+        if db_path is None:
+            base_dir = os.path.dirname(os.path.abspath(__file__))
+            db_path = os.path.join(base_dir, "../database/caro.db")
         self.db = CaroDatabase(db_path)
+        # Ghi điểm / last_login / ván đấu phía sau, gộp transaction (không fsync trong room lock)
+        self.db_writer = WriteBehindQueue(self.db)
+        
+        # Mọi hạn giờ (lượt đi, chờ kết nối lại, heartbeat) dùng chung một heap
+        self.scheduler = DeadlineScheduler()
+        # Phiên của người chơi rớt mạng giữa ván (chờ đăng nhập lại)
+        self.reconnect_grace = ReconnectGraceService(self.scheduler, reconnect_grace_seconds, max_grace_sessions)
+        
+        # Pub/sub: một topic mỗi phòng + một topic sảnh chờ (xem pubsub.py)
+        self.bus = LocalBus(self.broadcast)
         
         # Khởi tạo managers
         self.user_manager = UserManager(self.db)
         self.room_manager = RoomManager()
         self.room_manager.set_server(self)
+        self.lobby = LobbyState() # Trạng thái sảnh chờ có version (gửi delta)
+        # Gộp broadcast sảnh chờ: tối đa một lần mỗi lobby_broadcast_interval giây
+        self.lobby_broadcaster = LobbyBroadcaster(self, lobby_broadcast_interval)
+        # QUICK_MATCH ghép theo điểm mỗi matchmaking_tick giây
+        # (None: vào phòng đang chờ lâu nhất như trước)
+        self.matchmaking = None
+        if matchmaking_tick:
+            self.matchmaking = MatchmakingService(self.scheduler, self.room_manager.start_match, tick=matchmaking_tick,
+                                                  on_unmatched=self.room_manager.fill_waiting_room)
         
         self.client_counter = 1
         self.running = False
@@ -40,32 +80,37 @@ class CaroServer:
     def rooms(self):
         return self.room_manager.rooms
         
+    def create_ssl_context(self):
+        """Tạo SSL context nếu có chứng chỉ, ngược lại trả về None (plain text)"""
+        cert_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "certs", "server.crt")
+        key_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "certs", "server.key")
+        
+        if os.path.exists(cert_path) and os.path.exists(key_path):
+            context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            context.load_cert_chain(certfile=cert_path, keyfile=key_path)
+            print(f"🔒 SSL/TLS Enabled using {cert_path}")
+            return context
+        
+        print("⚠️ SSL Certificates not found. Running in PLAIN TEXT mode.")
+        return None
+        
     def start(self):
         try:
+            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             self.server_socket.bind((self.host, self.port))
             self.server_socket.listen(5)
 
             # --- SSL CONFIGURATION ---
-            cert_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "certs", "server.crt")
-            key_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "certs", "server.key")
-            
-            if os.path.exists(cert_path) and os.path.exists(key_path):
-                context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
-                context.load_cert_chain(certfile=cert_path, keyfile=key_path)
+            context = self.create_ssl_context()
+            if context:
                 self.server_socket = context.wrap_socket(self.server_socket, server_side=True)
-                print(f"🔒 SSL/TLS Enabled using {cert_path}")
-            else:
-                print("⚠️ SSL Certificates not found. Running in PLAIN TEXT mode.")
 
             self.running = True
             
             print(f"🚀 Caro Server running on {self.host}:{self.port}")
             print("💾 Database connected successfully")
             
-            # Start Timeout Checker
-            threading.Thread(target=self.timeout_checker, daemon=True).start()
-            
             # Set timeout to allow checking for signals (Ctrl+C)
             self.server_socket.settimeout(1.0)
             
@@ -88,9 +133,12 @@ class CaroServer:
             print(f"❌ Server error: {e}")
         finally:
             print("Cleaning up...")
-            self.db.close()
+            self.scheduler.stop()
+            self.lobby_broadcaster.stop()
+            self.db_writer.shutdown()  # Ghi nốt hàng đợi rồi mới đóng database
             try:
-                self.server_socket.close()
+                if self.server_socket:
+                    self.server_socket.close()
             except: pass
 
 
@@ -98,58 +146,26 @@ class CaroServer:
     def handle_client(self, client_socket):
         client_id = self.client_counter
         self.client_counter += 1
-        self.user_manager.add_client(client_id, client_socket)
+        connection = ThreadedConnection(client_socket, **self.connection_options)
+        self.user_manager.add_client(client_id, connection)
+        self.watch_heartbeat(client_id)
         
-        buffer = ""
+        decoder = MessageDecoder()
         try:
             while self.running:
                 try:
-                    data = client_socket.recv(4096)
-                    if not data: break
+                    # Nhận thẳng vào buffer cấp phát sẵn của decoder (không tạo bytes/str trung gian)
+                    nbytes = client_socket.recv_into(decoder.get_buffer())
+                    if not nbytes: break
+                    decoder.buffer_updated(nbytes)
                     try:
                         self.user_manager.update_activity(client_id)
                     except: pass
-                    buffer += data.decode('utf-8')
                 except Exception as e:
                     print(f"⚠️ Socket receive error for {client_id}: {e}")
                     break
                 
-                # --- ROBUST JSON PARSING (BRACE COUNTING) ---
-                while True:
-                    start_index = buffer.find('{')
-                    if start_index == -1:
-                        buffer = "" # Discard garbage
-                        break
-                        
-                    brace_count = 0
-                    end_index = -1
-                    
-                    for i, char in enumerate(buffer[start_index:], start=start_index):
-                        if char == '{':
-                            brace_count += 1
-                        elif char == '}':
-                            brace_count -= 1
-                            if brace_count == 0:
-                                end_index = i
-                                break
-                    
-                    if end_index != -1:
-                        json_str = buffer[start_index : end_index + 1]
-                        buffer = buffer[end_index + 1:] # Keep remainder
-                        
-                        try:
-                            message = json.loads(json_str)
-                            # --- SAFE MESSAGE PROCESSING ---
-                            try:
-                                self.process_message(client_id, message)
-                            except Exception as e:
-                                print(f"❌ Error processing message from {client_id}: {e}")
-                                import traceback
-                                traceback.print_exc()
-                        except json.JSONDecodeError:
-                            print(f"⚠️ Invalid JSON from {client_id}: {json_str[:50]}...")
-                    else:
-                        break # Incomplete message, wait for more data
+                self.process_incoming(client_id, decoder)
 
         except Exception as e:
             print(f"Error client {client_id}: {e}")
@@ -158,6 +174,35 @@ class CaroServer:
         finally:
             self.disconnect_client(client_id)
 
+    def process_incoming(self, client_id, decoder):
+        """Xử lý mọi message đã hoàn chỉnh trong decoder của kết nối.
+        
+        Decoder nhận cả JSON kiểu cũ (đếm ngoặc) lẫn frame có độ dài (xem shared/protocol.py).
+        ProtocolError (stream hỏng) được ném ra để nơi gọi đóng kết nối.
+        """
+        while True:
+            message = self.next_message(client_id, decoder)
+            if message is None:
+                return
+            self.dispatch(client_id, message)
+
+    def next_message(self, client_id, decoder):
+        """Message hoàn chỉnh tiếp theo trong decoder (bỏ qua JSON hỏng), None nếu chưa đủ dữ liệu"""
+        while True:
+            try:
+                return decoder.next_message()
+            except InvalidMessage as e:
+                print(f"⚠️ Invalid JSON from {client_id}: {e}")
+
+    def dispatch(self, client_id, message):
+        # --- SAFE MESSAGE PROCESSING ---
+        try:
+            self.process_message(client_id, message)
+        except Exception as e:
+            print(f"❌ Error processing message from {client_id}: {e}")
+            import traceback
+            traceback.print_exc()
+
     def process_message(self, client_id, message):
         msg_type = message.get('type')
         client = self.user_manager.get_client(client_id)
@@ -171,12 +216,12 @@ class CaroServer:
         
         # Nhóm User & Hệ thống
         # THÊM 'REGISTER' VÀO ĐÂY
-        if msg_type in ['LOGIN', 'REGISTER', 'EDIT_PROFILE', 'GET_ONLINE_PLAYERS']:
+        if msg_type in ['LOGIN', 'REGISTER', 'EDIT_PROFILE', 'GET_ONLINE_PLAYERS', 'GET_LOBBY_SNAPSHOT']:
             self.user_manager.handle_message(client_id, message, self)
             
         # Nhóm Phòng & Trận đấu
         # THÊM 'QUICK_MATCH' VÀO ĐÂY
-        elif msg_type in ['CREATE_ROOM', 'JOIN_ROOM', 'GET_ROOMS', 'LEAVE_ROOM', 'VIEW_MATCH', 'QUICK_MATCH']:
+        elif msg_type in ['CREATE_ROOM', 'JOIN_ROOM', 'GET_ROOMS', 'LEAVE_ROOM', 'VIEW_MATCH', 'QUICK_MATCH', 'CANCEL_MATCH']:
             self.room_manager.handle_message(client_id, message, self)
             
         # Nhóm Gameplay
@@ -188,6 +233,10 @@ class CaroServer:
         elif msg_type == 'CHAT':
             self.handle_chat_message(client_id, message)
 
+        # Thỏa thuận định dạng gói tin
+        elif msg_type == 'HELLO':
+            self.handle_hello(client_id, message)
+
         # Heartbeat
         elif msg_type == 'PING':
             self.send_to_client(client_id, {'type': 'PONG'})
@@ -195,44 +244,55 @@ class CaroServer:
         else:
             print(f"Unknown message type: {msg_type}")
 
+    def handle_hello(self, client_id, message):
+        """Client đề nghị framing mới và các tính năng tùy chọn. ACK được gửi bằng framing cũ, sau đó mới chuyển."""
+        client = self.user_manager.get_client(client_id)
+        if not client: return
+        
+        framing = message.get('framing')
+        if framing not in SUPPORTED_FRAMINGS:
+            framing = client.framing
+        features = [f for f in message.get('features', []) if f in SUPPORTED_FEATURES]
+            
+        self.send_to_client(client_id, {'type': 'HELLO_ACK', 'framing': framing, 'features': features})
+        client.framing = framing
+        client.lobby_deltas = FEATURE_LOBBY_DELTAS in features
+        self.user_manager.update_lobby_subscription(client_id, self)
+
     def handle_chat_message(self, client_id, message):
         """Xử lý tin nhắn chat"""
         client = self.user_manager.get_client(client_id)
         if not client: return
             
-        room_id = client.get('room_id')
+        room_id = client.room_id
         message_content = message.get('message')
         
-        if room_id and room_id in self.room_manager.rooms:
-            room = self.room_manager.rooms[room_id]
+        with self.room_manager.locked_room(room_id) as room:
+            if room is None:
+                return
             # Gửi tên hiển thị thay vì username (Fallback nếu None)
-            sender_name = client.get('display_name') or client.get('username') or f"Client {client_id}"
+            sender_name = client.display_name or client.username or f"Client {client_id}"
             
-            for pid in room['players']:
-                if pid != client_id:
-                    self.send_to_client(pid, {
-                        'type': 'CHAT',
-                        'sender': sender_name,
-                        'message': message_content
-                    })
-                    
-            # Broadcast to Spectators
-            for spec_id in room.get('spectators', []):
-                 # Don't send back to self if spectator is chatting (though spectators usually can't chat)
-                 if spec_id != client_id:
-                    self.send_to_client(spec_id, {
-                        'type': 'CHAT',
-                        'sender': sender_name,
-                        'message': message_content
-                    })
+            # Gửi cho đối thủ và khán giả (không gửi lại cho chính người chat)
+            self.bus.publish(room_topic(room.id), {
+                'type': 'CHAT',
+                'sender': sender_name,
+                'message': message_content
+            }, exclude=(client_id,))
 
     def send_to_client(self, client_id, message):
         self.user_manager.send_to_client(client_id, message)
 
+    def broadcast(self, client_ids, message):
+        self.user_manager.broadcast(client_ids, message)
+
     def send_error(self, client_id, msg):
         self.send_to_client(client_id, {'type': 'ERROR', 'message': msg})
 
     def disconnect_client(self, client_id):
+        self.scheduler.cancel(('heartbeat', client_id))
+        if self.matchmaking is not None:
+            self.matchmaking.cancel(client_id)
         # Ủy quyền hoàn toàn cho UserManager xử lý disconnect
         # UserManager sẽ quyết định:
         # - Nếu đang chơi game -> Lưu session (Level 1 Persistence)
@@ -240,17 +300,24 @@ class CaroServer:
         self.user_manager.handle_disconnect(client_id, self)
 
 
-    def timeout_checker(self):
-        """Periodically check for inactive clients"""
-        while self.running:
-            try:
-                inactive_ids = self.user_manager.check_inactive_clients(timeout_seconds=15)
-                for cid in inactive_ids:
-                    print(f"⌛ Client {cid} timed out.")
-                    self.disconnect_client(cid)
-            except Exception as e:
-                print(f"Error in timeout checker: {e}")
-            time.sleep(5)
+    def watch_heartbeat(self, client_id, deadline=None):
+        """Đặt hạn heartbeat cho client (thay cho vòng quét mọi client mỗi 5 giây)"""
+        if deadline is None:
+            deadline = time.time() + HEARTBEAT_TIMEOUT
+        self.scheduler.schedule(('heartbeat', client_id), deadline, self.check_heartbeat, client_id)
+
+    def check_heartbeat(self, client_id):
+        client = self.user_manager.get_client(client_id)
+        if not client:
+            return
+        # update_activity chỉ ghi thời gian (O(1) mỗi message); tới hạn mới xem lại
+        # và dời hạn nếu client vẫn còn gửi dữ liệu
+        deadline = client.last_activity + HEARTBEAT_TIMEOUT
+        if deadline > time.time():
+            self.watch_heartbeat(client_id, deadline)
+            return
+        print(f"⌛ Client {client_id} timed out.")
+        self.disconnect_client(client_id)
 
 if __name__ == "__main__":
     server = CaroServer()
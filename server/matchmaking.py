@@ -0,0 +1,242 @@
+import threading
+import time
+from collections import OrderedDict, deque
+
+DEFAULT_MATCHMAKING_TICK = 0.5  # Giây giữa hai lượt ghép cặp
+DEFAULT_BUCKET_WIDTH = 25       # Điểm mỗi bucket (độ chính xác khi chọn đối thủ)
+DEFAULT_BASE_WINDOW = 50        # Chênh lệch điểm chấp nhận lúc mới vào hàng
+DEFAULT_WIDEN_RATE = 25         # Điểm nới thêm mỗi giây chờ
+DEFAULT_MAX_WINDOW = 1000       # Chờ đủ lâu thì gặp ai cũng được
+DEFAULT_FALLBACK_AFTER = 10.0   # Giây chờ trong hàng trước khi thử chỗ khác (on_unmatched)
+METRIC_SAMPLES = 10000          # Số mẫu gần nhất giữ để tính percentile
+EDGE_SCAN = 8                   # Số người xem thử ở bucket biên (chỉ một phần nằm trong cửa sổ)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+class Ticket:
+    """Một người chơi đang chờ trong hàng"""
+    __slots__ = ('player_id', 'rating', 'enqueued_at', 'bucket')
+
+    def __init__(self, player_id, rating, enqueued_at, bucket):
+        self.player_id = player_id
+        self.rating = rating
+        self.enqueued_at = enqueued_at
+        self.bucket = bucket
+
+
+class MatchmakingService:
+    """Hàng đợi tìm trận theo điểm (users.score), ghép cặp theo lượt (tick).
+
+    Người chơi được xếp vào bucket theo điểm (rating // bucket_width). Mỗi tick duyệt
+    người chờ lâu nhất trước; mỗi người chấp nhận đối thủ lệch tối đa
+    base_window + widen_rate * số giây đã chờ (không quá max_window), tìm từ bucket của
+    mình ra hai bên và lấy người chờ lâu nhất ở bucket gần nhất còn trong cửa sổ.
+    Người chờ lâu nới rộng dần nên cuối cùng luôn có trận, người mới vào chỉ gặp
+    người gần điểm mình.
+
+    Tick chạy trên DeadlineScheduler và chỉ được đặt khi hàng đợi có người.
+    on_match(ticket_a, ticket_b) được gọi ngoài lock, sau khi cả hai đã rời hàng.
+    on_unmatched(ticket, window) (nếu có) được gọi ngoài lock cho người chưa ghép được
+    ở lượt này và đã chờ ít nhất fallback_after giây, kèm cửa sổ điểm hiện tại của họ;
+    người gọi rút họ khỏi hàng bằng remove() nếu tìm được chỗ khác (phòng đang chờ).
+    """
+    def __init__(self, scheduler=None, on_match=None, tick=DEFAULT_MATCHMAKING_TICK,
+                 bucket_width=DEFAULT_BUCKET_WIDTH, base_window=DEFAULT_BASE_WINDOW,
+                 widen_rate=DEFAULT_WIDEN_RATE, max_window=DEFAULT_MAX_WINDOW, clock=time.time,
+                 on_unmatched=None, fallback_after=DEFAULT_FALLBACK_AFTER):
+        self.scheduler = scheduler
+        self.on_match = on_match
+        self.on_unmatched = on_unmatched
+        self.fallback_after = fallback_after
+        self.tick_interval = tick
+        self.bucket_width = bucket_width
+        self.base_window = base_window
+        self.widen_rate = widen_rate
+        self.max_window = max_window
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.queue = OrderedDict()  # player_id -> Ticket, chờ lâu nhất ở đầu
+        self.buckets = {}           # bucket -> OrderedDict(player_id -> Ticket)
+        self.tick_scheduled = False
+
+        # --- METRICS ---
+        self.started_at = clock()
+        self.enqueued = 0
+        self.cancelled = 0
+        self.matches = 0
+        self.fallbacks = 0
+        self.ticks = 0
+        self.last_tick_seconds = 0.0
+        self.wait_times = deque(maxlen=METRIC_SAMPLES)   # Giây chờ của mỗi người được ghép
+        self.rating_gaps = deque(maxlen=METRIC_SAMPLES)  # Chênh lệch điểm mỗi trận
+
+    def window(self, waited):
+        """Chênh lệch điểm chấp nhận sau waited giây"""
+        return min(self.max_window, self.base_window + self.widen_rate * max(0.0, waited))
+
+    def enqueue(self, player_id, rating, enqueued_at=None):
+        """Vào hàng. Đã ở trong hàng thì chỉ cập nhật điểm (giữ chỗ và thời gian chờ).
+
+        enqueued_at: trả người chơi về hàng với thời gian chờ cũ (đối thủ vừa ghép bỏ đi),
+        họ được xếp lên đầu hàng để không mất lượt.
+        """
+        bucket_id = int(rating // self.bucket_width)
+        with self.lock:
+            ticket = self.queue.get(player_id)
+            if ticket is not None:
+                self._leave_bucket(ticket)
+                ticket.rating, ticket.bucket = rating, bucket_id
+            else:
+                ticket = Ticket(player_id, rating, enqueued_at if enqueued_at is not None else self.clock(), bucket_id)
+                self.queue[player_id] = ticket
+                if enqueued_at is not None:
+                    self.queue.move_to_end(player_id, last=False)
+                self.enqueued += 1
+            self.buckets.setdefault(bucket_id, OrderedDict())[player_id] = ticket
+            self._schedule_tick()
+        return ticket
+
+    def cancel(self, player_id):
+        """Rời hàng (hủy tìm trận, ngắt kết nối). Trả về True nếu đang chờ."""
+        with self.lock:
+            ticket = self.queue.get(player_id)
+            if ticket is None:
+                return False
+            self._discard(ticket)
+            self.cancelled += 1
+            return True
+
+    def remove(self, ticket):
+        """Rút ticket khỏi hàng nếu nó vẫn đang chờ (chưa bị ghép / hủy). Trả về True nếu rút được."""
+        with self.lock:
+            if self.queue.get(ticket.player_id) is not ticket:
+                return False
+            self._discard(ticket)
+            self.fallbacks += 1
+            self.wait_times.append(self.clock() - ticket.enqueued_at)
+            return True
+
+    def _discard(self, ticket):
+        del self.queue[ticket.player_id]
+        self._leave_bucket(ticket)
+
+    def _leave_bucket(self, ticket):
+        bucket = self.buckets[ticket.bucket]
+        del bucket[ticket.player_id]
+        if not bucket:
+            del self.buckets[ticket.bucket]
+
+    def __contains__(self, player_id):
+        with self.lock:
+            return player_id in self.queue
+
+    def _schedule_tick(self):
+        if self.scheduler is not None and self.queue and not self.tick_scheduled:
+            self.tick_scheduled = True
+            self.scheduler.schedule_in(('matchmaking',), self.tick_interval, self._on_tick)
+
+    def _on_tick(self):
+        with self.lock:
+            self.tick_scheduled = False
+        self.tick()
+        with self.lock:
+            self._schedule_tick()
+
+    def _best_opponent(self, ticket, window):
+        """Đối thủ trong cửa sổ ở bucket gần nhất (lệch không quá ~1 bucket so với tốt nhất).
+
+        Trong một bucket ưu tiên người chờ lâu nhất, nên mỗi lần tìm chỉ xem vài người
+        đầu mỗi bucket thay vì quét cả bucket (hàng vạn người cùng mức điểm).
+        """
+        reach = int(window // self.bucket_width) + 1
+        for distance in range(reach + 1):
+            best, best_gap = None, window
+            for bucket_id in (ticket.bucket - distance, ticket.bucket + distance) if distance else (ticket.bucket,):
+                bucket = self.buckets.get(bucket_id)
+                if not bucket:
+                    continue
+                for scanned, other in enumerate(bucket.values()):
+                    if scanned > EDGE_SCAN:
+                        break
+                    if other is ticket:
+                        continue
+                    gap = abs(other.rating - ticket.rating)
+                    if gap <= best_gap and (best is None or gap < best_gap):
+                        best, best_gap = other, gap
+                        break  # Người chờ lâu nhất trong cửa sổ của bucket này
+            if best is not None:
+                return best, best_gap
+        return None, None
+
+    def tick(self, now=None):
+        """Ghép cặp một lượt; trả về danh sách (ticket_a, ticket_b)"""
+        start = time.perf_counter()
+        if now is None:
+            now = self.clock()
+        pairs = []
+        unmatched = []
+        with self.lock:
+            for ticket in list(self.queue.values()):
+                if ticket.player_id not in self.queue:
+                    continue  # Đã được ghép với người chờ lâu hơn ở lượt này
+                waited = now - ticket.enqueued_at
+                window = self.window(waited)
+                opponent, gap = self._best_opponent(ticket, window)
+                if opponent is None:
+                    if waited >= self.fallback_after:
+                        unmatched.append((ticket, window))
+                    continue
+                self._discard(ticket)
+                self._discard(opponent)
+                pairs.append((ticket, opponent))
+                self.rating_gaps.append(gap)
+                self.wait_times.append(now - ticket.enqueued_at)
+                self.wait_times.append(now - opponent.enqueued_at)
+            self.matches += len(pairs)
+            self.ticks += 1
+            self.last_tick_seconds = time.perf_counter() - start
+
+        if self.on_match is not None:
+            for ticket, opponent in pairs:
+                try:
+                    self.on_match(ticket, opponent)
+                except Exception as e:
+                    print(f"Error starting match {ticket.player_id} vs {opponent.player_id}: {e}")
+        if self.on_unmatched is not None:
+            for ticket, window in unmatched:
+                if ticket.player_id not in self:
+                    continue  # Người chờ sau đã chọn họ ở cùng lượt
+                try:
+                    self.on_unmatched(ticket, window)
+                except Exception as e:
+                    print(f"Error placing {ticket.player_id} outside the queue: {e}")
+        return pairs
+
+    def stats(self, now=None):
+        if now is None:
+            now = self.clock()
+        with self.lock:
+            waits = sorted(self.wait_times)
+            gaps = sorted(self.rating_gaps)
+            uptime = max(now - self.started_at, 1e-9)
+            return {
+                'queued': len(self.queue),
+                'enqueued': self.enqueued,
+                'cancelled': self.cancelled,
+                'matches': self.matches,
+                'fallbacks': self.fallbacks,
+                'matches_per_second': self.matches / uptime,
+                'ticks': self.ticks,
+                'last_tick_ms': self.last_tick_seconds * 1000,
+                'wait_p50': percentile(waits, 0.5),
+                'wait_p90': percentile(waits, 0.9),
+                'wait_p99': percentile(waits, 0.99),
+                'rating_gap_avg': sum(gaps) / len(gaps) if gaps else 0,
+                'rating_gap_p95': percentile(gaps, 0.95),
+            }
@@ -0,0 +1,73 @@
+import threading
+import time
+
+from shared.protocol import FRAMING_JSON
+
+
+class Room:
+    """Một phòng chơi. __slots__: không có __dict__ riêng, truy cập thuộc tính
+    thay cho tra cứu chuỗi trong dict ở mọi nước đi (xem benchmarks/bench_memory.py)."""
+    __slots__ = ('id', 'players', 'board', 'board_size', 'win_length', 'status', 'owner',
+                 'password', 'time_limit', 'turn_deadline', 'spectators', 'match_pending',
+                 'is_frozen', 'saved_remaining_time', 'lock', 'removed',
+                 'user_ids', 'started_at', 'move_times')
+
+    def __init__(self, room_id, owner, board, password=None, time_limit=30):
+        self.id = room_id
+        self.players = [owner]           # players[0] là X, players[1] là O
+        self.board = board
+        self.board_size = board.size
+        self.win_length = board.win_length
+        self.status = 'waiting'          # waiting / playing / finished
+        self.owner = owner
+        self.password = password
+        self.time_limit = time_limit
+        self.turn_deadline = None        # Will be set when game starts
+        self.spectators = []             # List of spectator client_ids
+        self.match_pending = False
+        self.is_frozen = False           # Pause game flag
+        self.saved_remaining_time = 0    # For pausing timer
+        self.lock = threading.RLock()    # Lock riêng của phòng (xem RoomManager)
+        self.removed = False             # Đã bị xóa khỏi sổ đăng ký
+        self.user_ids = []               # users.id của players (chốt lúc bắt đầu ván, để lưu ván)
+        self.started_at = None           # Giờ bắt đầu ván (Unix)
+        self.move_times = []             # Giờ của từng nước, song song với board.moves_history
+
+    def start_game(self, user_ids):
+        """Ván mới bắt đầu: bấm đồng hồ ván, chốt user id của X và O"""
+        self.user_ids = list(user_ids)
+        self.started_at = time.time()
+        self.move_times = []
+
+    def __repr__(self):
+        return f"Room({self.id!r}, players={self.players!r}, status={self.status!r})"
+
+
+class ClientSession:
+    """Trạng thái của một kết nối (đã đăng nhập hay chưa)."""
+    __slots__ = ('connection', 'framing', 'lobby_deltas', 'username', 'user_id', 'room_id',
+                 'display_name', 'avatar_id', 'last_activity', 'rating')
+
+    def __init__(self, connection):
+        self.connection = connection     # OutboundConnection: hàng đợi gửi riêng, không block
+        self.framing = FRAMING_JSON      # Đổi sang 'length' sau khi client gửi HELLO
+        self.lobby_deltas = False        # Client nhận LOBBY_DELTA thay vì danh sách đầy đủ
+        self.username = None
+        self.user_id = None
+        self.room_id = None
+        self.display_name = None
+        self.avatar_id = 0               # Default avatar
+        self.last_activity = time.time() # For Heartbeat
+        self.rating = None               # users.score lúc đăng nhập, cập nhật sau mỗi ván (matchmaking)
+
+    @property
+    def name(self):
+        """Tên hiển thị, fallback về username"""
+        return self.display_name or self.username
+
+    def snapshot(self):
+        """Dữ liệu cần giữ khi mất kết nối (không kèm connection)"""
+        return {slot: getattr(self, slot) for slot in self.__slots__ if slot != 'connection'}
+
+    def __repr__(self):
+        return f"ClientSession({self.username!r}, room_id={self.room_id!r})"
@@ -0,0 +1,178 @@
+import threading
+
+LOBBY_TOPIC = 'lobby'
+
+
+def room_topic(room_id):
+    """Topic của một phòng: người chơi + khán giả"""
+    return f"room:{room_id}"
+
+
+class LocalBus:
+    """Pub/sub trong một process: topic -> tập client_id đang nghe.
+
+    Mỗi phòng là một topic (người chơi + khán giả), sảnh chờ là LOBBY_TOPIC.
+    publish() chỉ tính danh sách người nhận rồi gọi deliver(client_ids, message) một lần,
+    thường là server.broadcast (json.dumps một lần cho mỗi kiểu framing).
+    Người gọi giữ room.lock khi publish sự kiện của phòng nên thứ tự trong một topic được giữ.
+    """
+    def __init__(self, deliver):
+        self.deliver = deliver
+        self.topics = {}   # topic -> set(client_id)
+        self.clients = {}  # client_id -> set(topic), để gỡ hết khi ngắt kết nối
+        self.lock = threading.Lock()
+
+        # --- METRICS ---
+        self.published = 0
+        self.delivered = 0
+
+    def subscribe(self, topic, client_id):
+        with self.lock:
+            subscribers = self.topics.get(topic)
+            if subscribers is None:
+                subscribers = self.topics[topic] = set()
+                self._topic_opened(topic)
+            subscribers.add(client_id)
+            self.clients.setdefault(client_id, set()).add(topic)
+
+    def unsubscribe(self, topic, client_id):
+        with self.lock:
+            self._unsubscribe(topic, client_id)
+
+    def unsubscribe_all(self, client_id):
+        with self.lock:
+            for topic in list(self.clients.get(client_id, ())):
+                self._unsubscribe(topic, client_id)
+
+    def drop_topic(self, topic):
+        """Xóa topic (phòng bị giải tán)"""
+        with self.lock:
+            for client_id in list(self.topics.get(topic, ())):
+                self._unsubscribe(topic, client_id)
+
+    def _unsubscribe(self, topic, client_id):
+        subscribers = self.topics.get(topic)
+        if subscribers is None or client_id not in subscribers:
+            return
+        subscribers.discard(client_id)
+        if not subscribers:
+            del self.topics[topic]
+            self._topic_closed(topic)
+        topics = self.clients[client_id]
+        topics.discard(topic)
+        if not topics:
+            del self.clients[client_id]
+
+    def _topic_opened(self, topic):
+        """Gọi (trong lock) khi topic có người nghe đầu tiên ở node này"""
+
+    def _topic_closed(self, topic):
+        """Gọi (trong lock) khi người nghe cuối cùng ở node này rời topic"""
+
+    def subscribers(self, topic):
+        with self.lock:
+            return set(self.topics.get(topic, ()))
+
+    def publish(self, topic, message, exclude=(), remote=True):
+        """Gửi message cho mọi người nghe topic (trừ exclude).
+
+        remote=False: chỉ node này (vd. LOBBY_DELTA mang version riêng của từng node).
+        """
+        self.published += 1
+        self._deliver_local(topic, message, exclude)
+
+    def receive(self, topic, message, exclude=()):
+        """Message do node khác publish (qua hub)"""
+        self._deliver_local(topic, message, exclude)
+
+    def _deliver_local(self, topic, message, exclude):
+        with self.lock:
+            subscribers = self.topics.get(topic)
+            if not subscribers:
+                return
+            recipients = [cid for cid in subscribers if cid not in exclude]
+            self.delivered += len(recipients)
+        if recipients:
+            self.deliver(recipients, message)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'topics': len(self.topics),
+                'subscriptions': sum(len(s) for s in self.topics.values()),
+                'published': self.published,
+                'delivered': self.delivered,
+            }
+
+
+class PipeBus(LocalBus):
+    """Pub/sub nhiều node: mỗi node (process) giao cho người nghe của mình, hub chuyển giữa các node.
+
+    link: bất kỳ object nào có send(item) (vd. ShardLink trên multiprocessing Pipe).
+    Node báo cho hub ('subscribe', topic) / ('unsubscribe', topic) khi topic có người nghe
+    đầu tiên / hết người nghe ở node này; ('publish', topic, message, exclude) được hub
+    gửi tiếp MỘT lần cho mỗi node đang nghe, node đó tự fan-out cho client của nó
+    (xem TopicHub). client_id phải là duy nhất trên mọi node (front cấp id).
+
+    Hub báo lại ('topic_nodes', topic, nodes) khi tập node nghe một topic đổi, nên
+    publish chỉ đi qua pipe khi thật sự có node khác đang nghe (phòng bình thường
+    không tốn gì thêm).
+    """
+    def __init__(self, deliver, link, node=None):
+        super().__init__(deliver)
+        self.link = link
+        self.node = node
+        self.remote_topics = set()  # Topic có node khác đang nghe
+        self.forwarded = 0
+
+    def _topic_opened(self, topic):
+        self.link.send(('subscribe', topic))
+
+    def _topic_closed(self, topic):
+        self.link.send(('unsubscribe', topic))
+
+    def set_topic_nodes(self, topic, nodes):
+        if any(node != self.node for node in nodes):
+            self.remote_topics.add(topic)
+        else:
+            self.remote_topics.discard(topic)
+
+    def publish(self, topic, message, exclude=(), remote=True):
+        super().publish(topic, message, exclude)
+        if remote and topic in self.remote_topics:
+            self.forwarded += 1
+            self.link.send(('publish', topic, message, tuple(exclude)))
+
+    def stats(self):
+        stats = super().stats()
+        stats['forwarded'] = self.forwarded
+        return stats
+
+
+class TopicHub:
+    """Phía hub của PipeBus: nhớ node nào đang nghe topic nào, chuyển publish cho đúng các node đó"""
+    def __init__(self):
+        self.nodes = {}  # topic -> set(node)
+
+    def handle(self, node, command, send):
+        """Xử lý lệnh bus từ node; send(node, item) gửi cho một node. True nếu là lệnh bus."""
+        kind = command[0]
+        if kind in ('subscribe', 'unsubscribe'):
+            topic = command[1]
+            old = self.nodes.get(topic, set())
+            new = old | {node} if kind == 'subscribe' else old - {node}
+            if new == old:
+                return True
+            if new:
+                self.nodes[topic] = new
+            else:
+                self.nodes.pop(topic, None)
+            for other in old | new:
+                send(other, ('topic_nodes', topic, tuple(new)))
+        elif kind == 'publish':
+            for other in self.nodes.get(command[1], ()):
+                if other != node:
+                    send(other, command)
+        else:
+            return False
+        return True
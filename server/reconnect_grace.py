@@ -0,0 +1,97 @@
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_GRACE_SECONDS = 60      # Giữ chỗ trong ván cho người chơi mất kết nối
+DEFAULT_MAX_SESSIONS = 10000    # Giới hạn bảng phiên chờ (mất mạng hàng loạt)
+
+
+class ReconnectGraceService:
+    """Giữ phiên của người chơi mất kết nối giữa ván để họ đăng nhập lại và chơi tiếp.
+
+    Mỗi phiên là một hạn trong DeadlineScheduler (không tốn thread nào), bị hủy khi
+    người chơi quay lại. Mọi thao tác lấy/xóa phiên đi qua một lock và so đúng
+    object phiên, nên lượt hết hạn cũ không thể xóa nhầm phiên mới của cùng user
+    (trường hợp đăng nhập lại rồi lại rớt mạng).
+
+    Bảng có giới hạn: khi đầy, phiên cũ nhất hết hạn ngay để nhường chỗ.
+    """
+    def __init__(self, scheduler, grace_seconds=DEFAULT_GRACE_SECONDS, max_sessions=DEFAULT_MAX_SESSIONS):
+        self.scheduler = scheduler
+        self.grace_seconds = grace_seconds
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()  # user_id -> session, cũ nhất ở đầu
+        self.lock = threading.Lock()
+
+        # --- METRICS ---
+        self.held = 0
+        self.resumed = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def hold(self, user_id, client_data, old_client_id, on_expire):
+        """Lưu phiên; on_expire(session) được gọi nếu hết hạn mà chưa quay lại"""
+        data = dict(client_data)  # ClientSession.snapshot(): không kèm connection
+        session = {
+            'user_id': user_id,
+            'data': data,
+            'disconnect_time': time.time(),
+            'old_client_id': old_client_id,
+            'on_expire': on_expire
+        }
+
+        evicted = []
+        with self.lock:
+            self.sessions.pop(user_id, None)  # Phiên cũ (nếu có) bị thay, hạn cũng bị thay bên dưới
+            while len(self.sessions) >= self.max_sessions:
+                old_user_id, old_session = self.sessions.popitem(last=False)
+                self.scheduler.cancel(('grace', old_user_id))
+                evicted.append(old_session)
+            self.sessions[user_id] = session
+            self.held += 1
+            self.evicted += len(evicted)
+            self.scheduler.schedule(('grace', user_id), session['disconnect_time'] + self.grace_seconds,
+                                    self._expire, user_id, session)
+
+        for old_session in evicted:
+            self._run_expire(old_session)
+        return session
+
+    def resume(self, user_id):
+        """Lấy lại phiên khi người chơi đăng nhập lại; None nếu không có / đã hết hạn"""
+        with self.lock:
+            session = self.sessions.pop(user_id, None)
+            if session is None:
+                return None
+            self.scheduler.cancel(('grace', user_id))
+            self.resumed += 1
+        return session
+
+    def has_session(self, user_id):
+        with self.lock:
+            return user_id in self.sessions
+
+    def _expire(self, user_id, session):
+        with self.lock:
+            if self.sessions.get(user_id) is not session:
+                return  # Đã quay lại hoặc đã bị thay bằng phiên mới
+            del self.sessions[user_id]
+            self.expired += 1
+        print(f"⏰ Session expired for {user_id}. Cleaning up...")
+        self._run_expire(session)
+
+    def _run_expire(self, session):
+        try:
+            session['on_expire'](session)
+        except Exception as e:
+            print(f"Error expiring session {session['user_id']}: {e}")
+
+    def stats(self):
+        with self.lock:
+            return {
+                'active': len(self.sessions),
+                'held': self.held,
+                'resumed': self.resumed,
+                'expired': self.expired,
+                'evicted': self.evicted,
+            }
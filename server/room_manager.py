@@ -1,73 +1,171 @@
 import json
 import threading
-from shared.board import CaroBoard
+from collections import OrderedDict
+from contextlib import contextmanager
+from shared.bitboard import BitboardCaroBoard as CaroBoard
+from server.models import Room
+from server.pubsub import room_topic
+
+# --- KÍCH THƯỚC BÀN CỜ ---
+DEFAULT_BOARD_SIZE = 15
+DEFAULT_WIN_LENGTH = 5
+MIN_BOARD_SIZE = 5
+MAX_BOARD_SIZE = 50  # Bàn "vô hạn" 30-50 ô
+MIN_WIN_LENGTH = 3
+DEFAULT_RATING = 1000  # Điểm mặc định của users.score
+
+
+def board_config(room):
+    """Kích thước + số quân để thắng, gửi kèm các message vào phòng"""
+    return {'board_size': room.board_size, 'win_length': room.win_length}
+
+
+def board_moves(board):
+    """Các quân đã đánh dạng [{x, y, val}] (theo moves_history, không quét cả bàn cờ)"""
+    symbols = {1: 'X', 2: 'O'}
+    return [{'x': x, 'y': y, 'val': symbols.get(p, '?')} for x, y, p in board.moves_history]
+
+
+def player_user_ids(room, server):
+    """users.id của người chơi trong phòng (None nếu client đã rời / chưa đăng nhập)"""
+    clients = [server.user_manager.get_client(pid) for pid in room.players]
+    return [client.user_id if client else None for client in clients]
+
+
+def player_names(room, server):
+    """Tên hiển thị của người chơi trong phòng (bỏ qua client đã rời)"""
+    names = []
+    for p_id in room.players:
+        c = server.user_manager.get_client(p_id)
+        if c:
+            # Fallback to 'Unknown' if both display_name and username are None (should be rare)
+            names.append(c.display_name or c.username or f"Client {p_id}")
+    return names
+
 
 class RoomManager:
+    """Quản lý phòng với lock riêng cho từng phòng.
+
+    Nước đi, hẹn giờ, vào/ra... ở các phòng khác nhau chạy song song; self.lock chỉ
+    bảo vệ sổ đăng ký (rooms, room_owners, room_counter, danh sách phòng) và chỉ
+    giữ trong vài thao tác dict.
+
+    Thứ tự lấy lock (ngoài -> trong), không bao giờ lấy ngược chiều:
+      1. room.lock          - một phòng (RLock); không giữ lock của hai phòng cùng lúc
+      2. LobbyState.lock    - publish delta sảnh chờ
+      3. RoomManager.lock   - sổ đăng ký phòng; giữ nó thì không được lấy room.lock
+      4. lock lá: hàng đợi gửi của connection, scheduler, lobby broadcaster, reconnect grace
+    Gửi message khi đang giữ room lock là an toàn vì send() chỉ xếp hàng, không block.
+
+    Danh sách phòng cho sảnh là copy-on-write: mỗi thay đổi dựng lại tóm tắt của phòng
+    đó và đánh dấu tuple cũ là hết hạn; tuple mới chỉ được dựng khi có người đọc
+    (broadcast đã gộp, tối đa vài lần/giây), người đọc không cần lock khi tuple còn mới.
+
+    waiting_rooms là hàng đợi FIFO các phòng công khai đang chờ đúng 1 người, cập nhật
+    cùng lúc với tóm tắt -> QUICK_MATCH lấy phòng chờ lâu nhất trong O(1).
+    """
     def __init__(self):
-        self.rooms = {}    # room_id -> {players[], board, status, owner}
+        self.rooms = {}    # room_id -> Room (server/models.py)
         self.room_owners = {}  # room_id -> owner_client_id
         self.room_counter = 1
+        self.room_id_step = 1    # Chế độ nhiều process: mỗi shard đánh số cách nhau (xem sharding.py)
         self.lock = threading.Lock()
-        
-        # --- TIMEOUT MONITOR THREAD ---
-        self.running = True
-        self.monitor_thread = threading.Thread(target=self._timeout_loop, daemon=True)
-        self.monitor_thread.start()
+        self.summaries = {}      # room_id -> tóm tắt cho sảnh (dict không bị sửa sau khi tạo)
+        self.room_list = ()      # tuple(summaries.values()); None = cần dựng lại
+        self.waiting_rooms = OrderedDict()  # room_id -> None, phòng chờ lâu nhất ở đầu
         
     def set_server(self, server):
         self.server_instance = server
 
+    def get_room(self, room_id):
+        with self.lock:
+            return self.rooms.get(room_id)
+
+    @contextmanager
+    def locked_room(self, room_id):
+        """Giữ lock của phòng; trả về None nếu phòng không tồn tại / vừa bị xóa"""
+        room = self.get_room(room_id) if room_id else None
+        if room is None:
+            yield None
+            return
+        with room.lock:
+            yield None if room.removed else room
 
+    def refresh_room(self, room):
+        """Dựng lại tóm tắt của phòng sau khi thay đổi (gọi khi đang giữ room.lock)"""
+        if room.removed:
+            return
+        names = player_names(room, self.server_instance)
+        match_text = " vs ".join(names) if names else "Chờ đối thủ..."
+        if len(names) == 1:
+            match_text = f"{names[0]} vs ..."
+        summary = {
+            'id': room.id,
+            'count': len(room.players),
+            'status': room.status,
+            'players': names,
+            'match_text': match_text,
+            'has_password': bool(room.password),
+            **board_config(room)
+        }
+        is_open = room.status == 'waiting' and len(room.players) == 1 and not room.password
+        with self.lock:
+            if room.id in self.rooms:
+                self.summaries[room.id] = summary
+                self.room_list = None
+                if not is_open:
+                    self.waiting_rooms.pop(room.id, None)
+                elif room.id not in self.waiting_rooms:
+                    self.waiting_rooms[room.id] = None  # Mới mở lại -> xếp cuối hàng
 
-    def _timeout_loop(self):
-        """Luồng chạy ngầm kiểm tra hết giờ"""
-        import time
+    def refresh_room_of(self, client_id, server):
+        """Tên người chơi đổi (hồ sơ) -> cập nhật phòng họ đang ở"""
+        client = server.user_manager.get_client(client_id)
+        with self.locked_room(client and client.room_id) as room:
+            if room:
+                self.refresh_room(room)
+
+    def _remove_room(self, room):
+        """Xóa phòng khỏi sổ đăng ký (gọi khi đang giữ room.lock)"""
+        room.removed = True
+        self.set_turn_deadline(room, None)
+        self.server_instance.bus.drop_topic(room_topic(room.id))
+        with self.lock:
+            self.rooms.pop(room.id, None)
+            self.room_owners.pop(room.id, None)
+            self.summaries.pop(room.id, None)
+            self.waiting_rooms.pop(room.id, None)
+            self.room_list = None
+
+    def set_turn_deadline(self, room, deadline):
+        """Đặt (hoặc xóa khi None) hạn lượt đi; scheduler gọi _on_turn_timeout đúng lúc hết giờ"""
+        room.turn_deadline = deadline
+        key = ('turn', room.id)
+        if deadline is None:
+            self.server_instance.scheduler.cancel(key)
+        else:
+            self.server_instance.scheduler.schedule(key, deadline, self._on_turn_timeout, room.id, deadline)
+
+    def _on_turn_timeout(self, room_id, deadline):
+        """Chạy trên thread của scheduler khi một lượt hết giờ"""
         from server.game_logic import GameLogic
         
-        while self.running:
-            time.sleep(1) # Kiểm tra mỗi giây
-            
-            if not hasattr(self, 'server_instance'):
-                continue
-
-            try:
-                # Dùng lock để lấy danh sách phòng an toàn
-                current_rooms = []
-                with self.lock:
-                    # Chỉ lấy các phòng đang chơi
-                    for r_id, room in self.rooms.items():
-                        if room['status'] == 'playing':
-                            current_rooms.append(room)
-                
-                # Duyệt qua từng phòng (ngoài lock để tránh treo)
-                now = time.time()
-                for room in current_rooms:
-                    try:
-                        turn_deadline = room.get('turn_deadline')
-                        if turn_deadline and now > turn_deadline:
-                            print(f"⏰ Active Timeout detected in {room['id']}")
-                            
-                            # Xác định người bị hết giờ (là người đang có lượt đi)
-                            # board.current_player: 1 (X) hoặc 2 (O)
-                            # room['players'][0] là X, room['players'][1] là O
-                            current_turn_idx = 0 if room['board'].current_player == 1 else 1
-                            
-                            if len(room['players']) > current_turn_idx:
-                                timeout_player_id = room['players'][current_turn_idx]
-                                
-                                # Đối thủ thắng
-                                opponent_idx = 1 - current_turn_idx
-                                if len(room['players']) > opponent_idx:
-                                    winner_id = room['players'][opponent_idx]
-                                    
-                                    # Gọi GameLogic để xử lý thắng thua
-                                    # Cần một instance 'server' để truyền vào.
-                                    GameLogic.handle_game_over(room, winner_id, self.server_instance)
-                    except Exception as e_inner:
-                         print(f"Error checking room {room.get('id')}: {e_inner}")
-
-            except Exception as e:
-                print(f"Error in timeout loop: {e}")
+        with self.locked_room(room_id) as room:
+            # Hạn đã bị thay (nước đi mới, tạm dừng...) hoặc ván đã xong
+            if not room or room.status != 'playing' or room.turn_deadline != deadline:
+                return
+            print(f"⏰ Active Timeout detected in {room_id}")
+            
+            # Xác định người bị hết giờ (là người đang có lượt đi)
+            # board.current_player: 1 (X) hoặc 2 (O)
+            # room.players[0] là X, room.players[1] là O
+            current_turn_idx = 0 if room.board.current_player == 1 else 1
+            opponent_idx = 1 - current_turn_idx
+            if len(room.players) <= max(current_turn_idx, opponent_idx):
+                return
+            # Đối thủ thắng (giữ room lock: không đua với nước đi cuối cùng)
+            winner_id = room.players[opponent_idx]
+            GameLogic.handle_game_over(room, winner_id, self.server_instance)
         
     def handle_message(self, client_id, message, server):
         msg_type = message.get('type')
@@ -75,8 +173,18 @@ class RoomManager:
         if msg_type == 'CREATE_ROOM':
             password = message.get('password')
             time_limit = message.get('time_limit', 30)
+            board_size = message.get('board_size', DEFAULT_BOARD_SIZE)
+            win_length = message.get('win_length', DEFAULT_WIN_LENGTH)
             print(f"DEBUG: Creating room with time_limit={time_limit} (type: {type(time_limit)})")
-            self.create_room(client_id, server, password, time_limit)
+            
+            if not (isinstance(board_size, int) and isinstance(win_length, int)
+                    and MIN_BOARD_SIZE <= board_size <= MAX_BOARD_SIZE
+                    and MIN_WIN_LENGTH <= win_length <= board_size):
+                server.send_error(client_id, f"Bàn cờ không hợp lệ (kích thước {MIN_BOARD_SIZE}-{MAX_BOARD_SIZE}, "
+                                             f"số quân thắng {MIN_WIN_LENGTH}-kích thước)")
+                return
+            self.create_room(client_id, server, password, time_limit,
+                             board_size=board_size, win_length=win_length)
             
         elif msg_type == 'JOIN_ROOM':
             room_id = message.get('room_id')
@@ -85,7 +193,14 @@ class RoomManager:
         
         # --- THÊM: XỬ LÝ TÌM TRẬN NHANH ---
         elif msg_type == 'QUICK_MATCH':
-            self.quick_match(client_id, server)
+            if server.matchmaking is not None:
+                self.enqueue_match(client_id, server)
+            else:
+                self.quick_match(client_id, server)
+            
+        elif msg_type == 'CANCEL_MATCH':
+            if server.matchmaking is not None:
+                server.matchmaking.cancel(client_id)
             
         elif msg_type == 'ACCEPT_MATCH':
             self.accept_match(client_id, message.get('room_id'), server)
@@ -109,19 +224,20 @@ class RoomManager:
     # --- HÀM MỚI: TÌM TRẬN ---
     def quick_match(self, client_id, server):
         """Tìm phòng đang chờ có 1 người, nếu không có thì tạo mới"""
-        found_room_id = None
+        client = server.user_manager.get_client(client_id)
+        own_room_id = client.room_id if client else None
         
-        # Duyệt tìm phòng phù hợp (Chỉ tìm phòng đang WAITING)
+        # Lấy phòng chờ lâu nhất (bỏ qua phòng mình vừa tạo) và rút khỏi hàng đợi luôn,
+        # để hai người tìm trận cùng lúc không tranh nhau một phòng.
+        # join_room kiểm tra lại dưới lock của phòng
+        found_room_id = None
         with self.lock:
-            for r_id, room in self.rooms.items():
-                if room['status'] == 'waiting' and \
-                   len(room['players']) == 1 and \
-                   not room.get('password'):
-                
-                    # Đảm bảo không tự vào phòng mình vừa tạo
-                    if client_id not in room['players']:
-                        found_room_id = r_id
-                        break
+            for room_id in self.waiting_rooms:
+                if room_id != own_room_id:
+                    found_room_id = room_id
+                    break
+            if found_room_id:
+                del self.waiting_rooms[found_room_id]
         
         if found_room_id:
             # Tìm thấy -> VÀO LUÔN (Bỏ xác nhận kép)
@@ -132,6 +248,72 @@ class RoomManager:
             # Truyền cờ is_quick_match=True để thông báo cho client biết mà đợi
             self.create_room(client_id, server, is_quick_match=True)
 
+    def enqueue_match(self, client_id, server):
+        """Vào hàng tìm trận theo điểm; MatchmakingService gọi start_match khi ghép được"""
+        client = server.user_manager.get_client(client_id)
+        if not client or not client.user_id:
+            return
+        if client.room_id:
+            server.send_error(client_id, "Bạn đang ở trong phòng khác")
+            return
+        # Điểm đã có trong phiên (không đọc database trên event loop / ở shard)
+        rating = client.rating if client.rating is not None else DEFAULT_RATING
+        server.matchmaking.enqueue(client_id, rating)
+
+    def start_match(self, ticket, opponent):
+        """Hai người vừa được ghép: tạo phòng cho người chờ lâu hơn, người kia vào luôn"""
+        server = self.server_instance
+        ready = []
+        for t in (ticket, opponent):
+            client = server.user_manager.get_client(t.player_id)
+            if client and client.room_id is None:
+                ready.append(t)
+        if len(ready) < 2:
+            # Một bên đã thoát / vào phòng khác -> người còn lại về đầu hàng, giữ thời gian chờ
+            for t in ready:
+                server.matchmaking.enqueue(t.player_id, t.rating, t.enqueued_at)
+            return
+        room_id = self.create_room(ticket.player_id, server, is_quick_match=True)
+        self.join_room(opponent.player_id, room_id, server)
+
+    def fill_waiting_room(self, ticket, window):
+        """Chờ lâu mà chưa có đối thủ trong hàng: vào phòng đang chờ lâu nhất có chủ phòng
+        lệch điểm không quá window (cùng luật với hàng đợi)
+
+        Phòng tạo bằng CREATE_ROOM không nằm trong hàng đợi tìm trận; không có bước này
+        thì khi bật matchmaking, QUICK_MATCH không bao giờ vào được các phòng đó.
+        """
+        if not self.waiting_rooms:
+            return False
+        server = self.server_instance
+        client = server.user_manager.get_client(ticket.player_id)
+        if not client or client.room_id is not None:
+            return False  # start_match xử lý khi họ được ghép
+        found_room_id = None
+        with self.lock:
+            for room_id in self.waiting_rooms:
+                owner = server.user_manager.get_client(self.room_owners.get(room_id))
+                rating = owner.rating if owner and owner.rating is not None else DEFAULT_RATING
+                if abs(rating - ticket.rating) <= window:
+                    found_room_id = room_id
+                    break
+            if found_room_id:
+                del self.waiting_rooms[found_room_id]
+        if not found_room_id:
+            return False
+        if not server.matchmaking.remove(ticket):
+            # Vừa được ghép / hủy tìm trận: trả phòng về hàng chờ
+            with self.locked_room(found_room_id) as room:
+                if room:
+                    self.refresh_room(room)
+            return False
+        self.join_room(ticket.player_id, found_room_id, server)
+        if client.room_id is None:
+            # Phòng vừa đầy / giải tán -> về đầu hàng, giữ thời gian chờ
+            server.matchmaking.enqueue(ticket.player_id, ticket.rating, ticket.enqueued_at)
+            return False
+        return True
+
     def accept_match(self, client_id, room_id, server):
         # Deprecated: No double confirmation anymore
         pass
@@ -140,181 +322,140 @@ class RoomManager:
         # Deprecated: No double confirmation anymore
         pass
             
-    def create_room(self, client_id, server, password=None, time_limit=30, is_quick_match=False):
-        room_id = f"room_{self.room_counter}"
-        self.room_counter += 1
-        
+    def create_room(self, client_id, server, password=None, time_limit=30, is_quick_match=False,
+                    board_size=DEFAULT_BOARD_SIZE, win_length=DEFAULT_WIN_LENGTH):
         with self.lock:
-            self.rooms[room_id] = {
-                'id': room_id,
-                'players': [client_id],
-                'board': CaroBoard(), 
-                'status': 'waiting',
-                'owner': client_id,
-                'password': password,
-                'time_limit': time_limit,
-                'turn_deadline': None,  # Will be set when game starts
-                'spectators': [],  # List of spectator client_ids
-                'match_pending': False, # New flag
-                'is_frozen': False, # Pause game flag
-                'saved_remaining_time': 0 # For pausing timer
-
-            }
-            self.room_owners[room_id] = client_id
+            room_id = f"room_{self.room_counter}"
+            self.room_counter += self.room_id_step
         
-        # Cập nhật room_id cho client
-        client = server.user_manager.get_client(client_id)
-        if client:
-            client['room_id'] = room_id
+        room = Room(room_id, client_id, CaroBoard(board_size, win_length), password, time_limit)
+        with room.lock:
+            with self.lock:
+                self.rooms[room_id] = room
+                self.room_owners[room_id] = client_id
+            
+            # Cập nhật room_id cho client
+            client = server.user_manager.get_client(client_id)
+            if client:
+                client.room_id = room_id
+            server.bus.subscribe(room_topic(room_id), client_id)
+            self.refresh_room(room)
         
         # Gửi thông báo tạo phòng kèm cờ is_quick_match
         server.send_to_client(client_id, {
             'type': 'ROOM_CREATED', 
             'room_id': room_id, 
             'player_symbol': 'X',
-            'is_quick_match': is_quick_match
+            'is_quick_match': is_quick_match,
+            'board_size': board_size,
+            'win_length': win_length
         })
 
-        # Broadcast cập nhật danh sách
-        self.broadcast_room_list(server)
-        server.user_manager.broadcast_online_players(server)
+        # Broadcast cập nhật danh sách (gộp lại, xem lobby_broadcaster.py)
+        server.lobby_broadcaster.mark_dirty(rooms=True, players=True)
+        return room_id
         
     def join_room(self, client_id, room_id, server, password=None):
-        with self.lock:
-            if room_id not in self.rooms:
+        with self.locked_room(room_id) as room:
+            if room is None:
                 server.send_error(client_id, "Phòng không tồn tại hoặc đã giải tán")
                 # Gửi lại danh sách phòng mới nhất để client cập nhật
                 self.send_room_list(client_id, server)
                 return
-                
-            room = self.rooms[room_id]
             
             # Check password
-            if room.get('password') and room.get('password') != password:
+            if room.password and room.password != password:
                 server.send_error(client_id, "Sai mật khẩu phòng!")
                 return
     
-            if len(room['players']) >= 2:
+            if len(room.players) >= 2:
                 server.send_error(client_id, "Phòng đã đầy")
                 return
             
-            if client_id in room['players']:
+            if client_id in room.players:
                  return # Đã ở trong phòng rồi
                 
-            room['players'].append(client_id)
+            room.players.append(client_id)
             client = server.user_manager.get_client(client_id)
             if client:
-                client['room_id'] = room_id
+                client.room_id = room_id
+            server.bus.subscribe(room_topic(room_id), client_id)
                 
-            room['status'] = 'playing'
+            room.status = 'playing'
+            room.start_game(player_user_ids(room, server))
             
             # --- FIX: LẤY DISPLAY NAME THAY VÌ USERNAME ---
-            p1_id = room['players'][0]
-            p2_id = room['players'][1]
+            p1_id = room.players[0]
+            p2_id = room.players[1]
             
             # Set initial timer
             import time
-            room['turn_deadline'] = time.time() + room['time_limit'] + 2 # +2s buffer for UI
+            self.set_turn_deadline(room, time.time() + room.time_limit + 2) # +2s buffer for UI
+            self.refresh_room(room)
 
         c1 = server.user_manager.get_client(p1_id)
         c2 = server.user_manager.get_client(p2_id)
         
         # Fallback if display_name is None (DB null) or key missing
-        p1_name = c1.get('display_name') or c1.get('username') or f"Client {p1_id}"
-        p2_name = c2.get('display_name') or c2.get('username') or f"Client {p2_id}"
+        p1_name = c1.display_name or c1.username or f"Client {p1_id}"
+        p2_name = c2.display_name or c2.username or f"Client {p2_id}"
         # ---------------------------------------------
 
         # Gửi thông báo vào game
         server.send_to_client(p1_id, {
             'type': 'ROOM_JOINED', 'room_id': room_id, 
             'players': [p1_name, p2_name], 'player_symbol': 'X',
-            'time_limit': room['time_limit']
+            'time_limit': room.time_limit, **board_config(room)
         })
         server.send_to_client(p2_id, {
             'type': 'ROOM_JOINED', 'room_id': room_id,
             'players': [p1_name, p2_name], 'player_symbol': 'O',
-            'time_limit': room['time_limit']
+            'time_limit': room.time_limit, **board_config(room)
         })
         
         # Cập nhật danh sách phòng
-        self.broadcast_room_list(server)
-        server.user_manager.broadcast_online_players(server)
+        server.lobby_broadcaster.mark_dirty(rooms=True, players=True)
+        
+    def get_room_list(self, server):
+        """Danh sách phòng cho sảnh chờ: đọc snapshot copy-on-write, chỉ lấy lock khi cần dựng lại"""
+        room_list = self.room_list
+        if room_list is None:
+            with self.lock:
+                if self.room_list is None:
+                    self.room_list = tuple(self.summaries.values())
+                room_list = self.room_list
+        return list(room_list)
         
     def send_room_list(self, client_id, server):
-        room_list = []
-        with self.lock:
-            for r_id, r in self.rooms.items():
-                # --- FIX: HIỂN THỊ TÊN ĐẸP TRÊN DANH SÁCH PHÒNG ---
-                player_names = []
-                for p_id in r['players']:
-                    c = server.user_manager.get_client(p_id)
-                    if c:
-                        # Fallback to 'Unknown' if both display_name and username are None (should be rare)
-                        name = c.get('display_name') or c.get('username') or f"Client {p_id}"
-                        player_names.append(name)
-                # --------------------------------------------------
-                
-                match_text = " vs ".join(player_names) if player_names else "Chờ đối thủ..."
-                if len(player_names) == 1:
-                    match_text = f"{player_names[0]} vs ..."
-                
-                room_list.append({
-                    'id': r_id,
-                    'count': len(r['players']),
-                    'status': r['status'],
-                    'players': player_names,
-                    'match_text': match_text,
-                    'has_password': bool(r.get('password'))
-                })
-            
         server.send_to_client(client_id, {
             'type': 'ROOM_LIST',
-            'rooms': room_list
+            'rooms': self.get_room_list(server)
         })
         
     def view_match(self, client_id, room_id, server):
-        with self.lock:
-            if room_id not in self.rooms:
+        with self.locked_room(room_id) as room:
+            if room is None:
                 server.send_error(client_id, "Phòng không tồn tại")
                 return
                 
-            room = self.rooms[room_id]
-            # Fix tên hiển thị khi xem
-            player_names = []
-            for p in room['players']:
-                 c = server.user_manager.get_client(p)
-                 if c:
-                     # Fallback to 'Unknown' if both display_name and username are None
-                     name = c.get('display_name') or c.get('username') or f"Client {p}"
-                     player_names.append(name)
-            
             server.send_to_client(client_id, {
                 'type': 'VIEW_MATCH_INFO',
                 'room_id': room_id,
-                'players': player_names,
-                'status': room['status'],
-                'time_limit': room['time_limit']
+                'players': player_names(room, server),
+                'status': room.status,
+                'time_limit': room.time_limit,
+                **board_config(room)
             })
             
             # Add to spectators list if not already there
-            if client_id not in room['spectators']:
-                room['spectators'].append(client_id)
+            if client_id not in room.spectators:
+                room.spectators.append(client_id)
+                server.bus.subscribe(room_topic(room_id), client_id)
                 print(f"👀 {client_id} started spectating room {room_id}")
 
-            # Gửi trạng thái bàn cờ hiện tại (QUAN TRỌNG)
-            board_state = room['board'].get_board()
-            # Convert int to 'X'/'O'
-            symbols = {0: '', 1: 'X', 2: 'O'}
-            converted_board = [[symbols[cell] for cell in row] for row in board_state]
-
-            server.send_to_client(client_id, {
-                'type': 'BOARD_STATE',
-                'board': converted_board
-            })
-            
             # Gửi Timer sync luôn để khán giả biết còn bao nhiêu giây
             import time
-            remaining = int(room['turn_deadline'] - time.time()) if room.get('turn_deadline') else 0
+            remaining = int(room.turn_deadline - time.time()) if room.turn_deadline else 0
             remaining = max(0, remaining)
             
             server.send_to_client(client_id, {
@@ -325,8 +466,8 @@ class RoomManager:
             # Tính thời gian còn lại
             import time
             remaining = 0
-            if room['turn_deadline']:
-                remaining = int(room['turn_deadline'] - time.time())
+            if room.turn_deadline:
+                remaining = int(room.turn_deadline - time.time())
                 if remaining < 0: remaining = 0
             
             server.send_to_client(client_id, {
@@ -334,15 +475,8 @@ class RoomManager:
                 'remaining_time': remaining
             })
             
-            # Gửi toàn bộ bàn cờ hiện tại
-            board_state = []
-            symbols = {1: 'X', 2: 'O'} # Map int -> symbol
-            for r in range(15):
-                for c in range(15):
-                    piece_val = room['board'].board[r][c]
-                    if piece_val != 0:
-                        symbol = symbols.get(piece_val, '?')
-                        board_state.append({'x': c, 'y': r, 'val': symbol}) # Send symbol, not int
+            # Gửi toàn bộ bàn cờ hiện tại (chỉ các quân đã đánh, bàn lớn cũng không tốn thêm)
+            board_state = board_moves(room.board)
             
             if board_state:
                 server.send_to_client(client_id, {
@@ -354,24 +488,31 @@ class RoomManager:
         """Gửi danh sách phòng mới nhất cho tất cả mọi người"""
         # Chỉ gửi cho những người KHÔNG ở trong phòng (đang ở sảnh) để đỡ spam
         # Copy keys to avoid size change during iteration (though user_manager.clients shouldn't change much, locking there is hard)
-        client_ids = list(server.user_manager.clients.keys())
-        for client_id in client_ids:
-            client = server.user_manager.get_client(client_id)
-            if client and client.get('room_id') is None: 
-                self.send_room_list(client_id, server)
+        # Dựng danh sách MỘT lần cho mọi người nhận: O(N + R) thay vì O(N·R)
+        room_list = self.get_room_list(server)
+        
+        # Client mới: chỉ nhận phần thay đổi (ROOM_ADDED/CHANGED/REMOVED)
+        server.lobby.publish(server, rooms=room_list)
+        
+        # Client cũ: vẫn nhận toàn bộ danh sách (encode một lần, ghi cùng bytes cho N client)
+        lobby_ids = [cid for cid, c in list(server.user_manager.clients.items())
+                     if c.room_id is None and not c.lobby_deltas]
+        server.broadcast(lobby_ids, {
+            'type': 'ROOM_LIST',
+            'rooms': room_list
+        })
 
     def leave_room(self, client_id, room_id, server):
-        with self.lock:
-            if room_id not in self.rooms:
+        with self.locked_room(room_id) as room:
+            if room is None:
                 return
-                
-            room = self.rooms[room_id]
             
             # 1. Xóa người chơi khỏi list
-            if client_id in room['players']:
-                room['players'].remove(client_id)
-            elif client_id in room['spectators']:
-                room['spectators'].remove(client_id)
+            server.bus.unsubscribe(room_topic(room_id), client_id)
+            if client_id in room.players:
+                room.players.remove(client_id)
+            elif client_id in room.spectators:
+                room.spectators.remove(client_id)
                 print(f"👋 Spectator {client_id} left room {room_id}")
                 # Spectator leaving doesn't affect game state
                 return
@@ -379,55 +520,54 @@ class RoomManager:
             # Reset room_id của client về None
             client_left = server.user_manager.get_client(client_id)
             if client_left:
-                client_left['room_id'] = None
-                username_left = client_left.get('display_name', client_left.get('username', 'Unknown'))
+                client_left.room_id = None
+                username_left = client_left.name or 'Unknown'
             else:
                 username_left = 'Unknown'
     
             # 2. Thông báo cho người còn lại (nếu có)
-            if room['players']:
-                opponent_id = room['players'][0]
+            if room.players:
+                opponent_id = room.players[0]
                 server.send_to_client(opponent_id, {
                     'type': 'OPPONENT_LEFT',
                     'message': f'{username_left} đã rời phòng'
                 })
-                room['status'] = 'waiting'
-                # Reset bàn cờ
-                room['board'] = CaroBoard()
+                room.status = 'waiting'
+                # Reset bàn cờ (giữ kích thước của phòng)
+                room.board = CaroBoard(room.board_size, room.win_length)
+                room.start_game([])
+                self.set_turn_deadline(room, None)
+                self.refresh_room(room)
                 print(f"Room {room_id}: Player left. Waiting for new opponent.")
             
             # 3. QUAN TRỌNG: Nếu phòng TRỐNG -> XÓA NGAY LẬP TỨC
             else:
                 print(f"Room {room_id} is empty. Deleting...")
-                del self.rooms[room_id]
-                if room_id in self.room_owners:
-                    del self.room_owners[room_id]
+                self._remove_room(room)
             
         # Cập nhật UI cho mọi người
-        self.broadcast_room_list(server)
-        server.user_manager.broadcast_online_players(server)
+        server.lobby_broadcaster.mark_dirty(rooms=True, players=True)
             
     def handle_client_disconnect(self, client_id, room_id, server):
         self.leave_room(client_id, room_id, server)
 
     def handle_player_disconnected_gracefully(self, client_id, room_id, server):
         """Called when a player disconnects but might reconnect. Do NOT remove from room."""
-        with self.lock:
-            if room_id not in self.rooms: return
-            room = self.rooms[room_id]
+        with self.locked_room(room_id) as room:
+            if room is None: return
             
             # --- LEVEL 2: FREEZE ROOM ---
-            if not room['is_frozen'] and room.get('turn_deadline'):
+            if not room.is_frozen and room.turn_deadline:
                 import time
-                room['is_frozen'] = True
-                room['saved_remaining_time'] = room['turn_deadline'] - time.time()
-                room['turn_deadline'] = None # Stop timer check
-                print(f"❄️ Room {room_id} frozen. Time left: {room['saved_remaining_time']:.1f}s")
+                room.is_frozen = True
+                room.saved_remaining_time = room.turn_deadline - time.time()
+                self.set_turn_deadline(room, None) # Stop timer check
+                print(f"❄️ Room {room_id} frozen. Time left: {room.saved_remaining_time:.1f}s")
             # -----------------------------
             
             # Notify opponent
             opponent_id = None
-            for pid in room['players']:
+            for pid in room.players:
                 if pid != client_id:
                     opponent_id = pid
                     break
@@ -443,61 +583,58 @@ class RoomManager:
 
     def reconnect_player(self, old_client_id, new_client_id, room_id, server):
         """Restore player connection to the room"""
-        with self.lock:
-            if room_id not in self.rooms:
+        with self.locked_room(room_id) as room:
+            if room is None:
                  server.send_error(new_client_id, "Phòng chơi đã kết thúc hoặc không tồn tại.")
                  return
             
-            room = self.rooms[room_id]
-            
             # --- LEVEL 2: UNFREEZE ROOM ---
-            if room['is_frozen']:
+            if room.is_frozen:
                 import time
-                room['is_frozen'] = False
+                room.is_frozen = False
                 # Restore deadline
-                room['turn_deadline'] = time.time() + room.get('saved_remaining_time', 30) + 2 # +2s buffer
-                print(f"🔥 Room {room_id} unfrozen. New deadline in {room.get('saved_remaining_time'):.1f}s")
+                self.set_turn_deadline(room, time.time() + room.saved_remaining_time + 2) # +2s buffer
+                print(f"🔥 Room {room_id} unfrozen. New deadline in {room.saved_remaining_time:.1f}s")
             # ------------------------------
 
             # 1. Update players list: Swap old_id -> new_id
-            if old_client_id in room['players']:
+            if old_client_id in room.players:
                 # Find index and replace
-                idx = room['players'].index(old_client_id)
-                room['players'][idx] = new_client_id
+                idx = room.players.index(old_client_id)
+                room.players[idx] = new_client_id
             else:
                 # Fallback: Just append if not full? No, must replace.
                 # If old_id not found, maybe already replaced? Or logic error.
                 print(f"⚠️ Reconnect warning: Old ID {old_client_id} not found in room {room_id}")
                 # Try to find empty slot? No, just force add if < 2, else error
-                if new_client_id not in room['players']:
-                    room['players'].append(new_client_id)
+                if new_client_id not in room.players:
+                    room.players.append(new_client_id)
+
+            server.bus.unsubscribe(room_topic(room_id), old_client_id)
+            server.bus.subscribe(room_topic(room_id), new_client_id)
 
             # Update owner if needed
-            if room['owner'] == old_client_id:
-                room['owner'] = new_client_id
-                self.room_owners[room_id] = new_client_id
+            if room.owner == old_client_id:
+                room.owner = new_client_id
+                with self.lock:
+                    self.room_owners[room_id] = new_client_id
+            self.refresh_room(room)
                 
             print(f"✅ Player {old_client_id} -> {new_client_id} reconnected to room {room_id}")
 
             # 2. Get Game State
-            board_state = []
-            symbols = {1: 'X', 2: 'O'}
-            for r in range(15):
-                for c in range(15):
-                    piece_val = room['board'].board[r][c]
-                    if piece_val != 0:
-                         board_state.append({'x': c, 'y': r, 'val': symbols.get(piece_val, '?')})
+            board_state = board_moves(room.board)
             
             # Determine symbol
             # Index 0 is X, Index 1 is O
             # Check if new_client_id is at index 0 or 1
             idx = 0
-            if new_client_id in room['players']:
-                idx = room['players'].index(new_client_id)
+            if new_client_id in room.players:
+                idx = room.players.index(new_client_id)
             
             my_symbol = 'X' if idx == 0 else 'O'
-            is_my_turn = (room['board'].current_player == 1 and my_symbol == 'X') or \
-                         (room['board'].current_player == 2 and my_symbol == 'O')
+            is_my_turn = (room.board.current_player == 1 and my_symbol == 'X') or \
+                         (room.board.current_player == 2 and my_symbol == 'O')
 
             # 3. Send RESUME_GAME to reconnected user
             server.send_to_client(new_client_id, {
@@ -506,14 +643,15 @@ class RoomManager:
                 'player_symbol': my_symbol,
                 'is_my_turn': is_my_turn,
                 'moves': board_state,
-                'time_limit': room['time_limit']
+                'time_limit': room.time_limit,
+                **board_config(room)
             })
             
             # Send updated timer to BOTH players (sync)
-            remaining = int(room['saved_remaining_time']) if 'saved_remaining_time' in room else 30
+            remaining = int(room.saved_remaining_time)
             
             # 4. Notify Opponent
-            opponent_id = room['players'][1-idx] if len(room['players']) > 1 else None
+            opponent_id = room.players[1-idx] if len(room.players) > 1 else None
             if opponent_id:
                  server.send_to_client(opponent_id, {
                     'type': 'CHAT',
@@ -0,0 +1,121 @@
+import heapq
+import itertools
+import threading
+import time
+
+
+class DeadlineScheduler:
+    """Một min-heap chung cho mọi hạn giờ: lượt đi, thời gian chờ kết nối lại, heartbeat.
+
+    Thay cho các vòng lặp quét toàn bộ phòng/client mỗi giây: mỗi hạn giờ là một
+    mục trong heap (O(log n) khi thêm), thread chỉ thức dậy đúng lúc mục sớm nhất
+    tới hạn. Mỗi mục có một key (vd: ('turn', room_id)); đặt lại cùng key sẽ thay
+    hạn cũ, cancel() chỉ đánh dấu mục cũ là bỏ (xóa lười khi nó lên tới đỉnh heap).
+
+    Callback chạy trên thread của scheduler, không giữ lock nào -> phải ngắn và
+    tự kiểm tra lại trạng thái (phòng có thể đã đổi từ lúc đặt hạn).
+    """
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.heap = []         # [deadline, seq, key, callback, args]
+        self.entries = {}      # key -> mục đang hiệu lực trong heap
+        self.counter = itertools.count()  # Phá hòa khi cùng deadline, giữ thứ tự đặt
+        self.condition = threading.Condition()
+        self.running = True
+
+        # --- METRICS ---
+        self.fired = 0
+        self.cancelled = 0
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def schedule(self, key, deadline, callback, *args):
+        """Gọi callback(*args) tại deadline (cùng đồng hồ với clock). Thay hạn cũ cùng key."""
+        entry = [deadline, next(self.counter), key, callback, args]
+        with self.condition:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                old[3] = None
+                self._compact()
+            self.entries[key] = entry
+            heapq.heappush(self.heap, entry)
+            # Chỉ cần đánh thức thread khi hạn mới sớm hơn hạn nó đang chờ
+            if self.heap[0] is entry:
+                self.condition.notify()
+
+    def schedule_in(self, key, delay, callback, *args):
+        self.schedule(key, self.clock() + delay, callback, *args)
+
+    def cancel(self, key):
+        """Hủy hạn của key. Trả về True nếu còn đang chờ."""
+        with self.condition:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                return False
+            entry[3] = None
+            self.cancelled += 1
+            self._compact()
+            return True
+
+    def _compact(self):
+        # Hạn bị thay liên tục (mỗi nước đi) -> dọn khi mục chết chiếm quá nửa heap
+        if len(self.heap) > 64 and len(self.heap) > 2 * len(self.entries):
+            self.heap = [e for e in self.heap if e[3] is not None]
+            heapq.heapify(self.heap)
+
+    def deadline(self, key):
+        with self.condition:
+            entry = self.entries.get(key)
+            return entry[0] if entry else None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _pop_due(self):
+        """Chờ tới khi có mục tới hạn; trả về (callback, args) hoặc None khi dừng"""
+        with self.condition:
+            while self.running:
+                # Bỏ các mục đã hủy / bị thay ở đỉnh heap
+                while self.heap and self.heap[0][3] is None:
+                    heapq.heappop(self.heap)
+
+                if not self.heap:
+                    self.condition.wait()
+                    continue
+
+                delay = self.heap[0][0] - self.clock()
+                if delay > 0:
+                    self.condition.wait(delay)
+                    continue
+
+                deadline, _, key, callback, args = heapq.heappop(self.heap)
+                del self.entries[key]
+                self.fired += 1
+                return callback, args
+            return None
+
+    def _run(self):
+        while True:
+            due = self._pop_due()
+            if due is None:
+                return
+            callback, args = due
+            try:
+                callback(*args)
+            except Exception as e:
+                print(f"Error in scheduled task: {e}")
+                import traceback
+                traceback.print_exc()
+
+    def stats(self):
+        with self.condition:
+            return {'pending': len(self.entries), 'heap_size': len(self.heap),
+                    'fired': self.fired, 'cancelled': self.cancelled}
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.thread is not threading.current_thread():
+            self.thread.join(1)
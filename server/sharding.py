@@ -0,0 +1,639 @@
+"""Chế độ nhiều process: N worker, mỗi worker giữ một shard phòng.
+
+    python server/sharding.py [--workers 4] [--port 5555]
+
+Một process CPython chỉ dùng được một core cho logic game. Ở chế độ này:
+
+- Front (ShardedCaroServer) nhận mọi kết nối bằng asyncio, tách message bằng
+  MessageDecoder rồi chuyển (đã decode) qua pipe tới worker đang giữ client đó.
+  Bytes trả lời đã được worker encode sẵn, front chỉ ghi ra socket.
+- Mỗi worker chạy một CaroServer nguyên vẹn (ShardServer): cùng game logic, room
+  lock, scheduler, reconnect grace... chỉ khác là "socket" của client là pipe về front.
+- Phòng ở shard i có id room_{i+1}, room_{i+1+N}, ... nên front biết phòng ở đâu
+  chỉ từ room_id. JOIN_ROOM / VIEW_MATCH vào phòng ở shard khác thì client được
+  chuyển sang shard đó trước (detach -> snapshot phiên -> attach), message của client
+  trong lúc chuyển được giữ lại ở front và gửi tiếp theo đúng thứ tự.
+- Sảnh chờ: mỗi worker gửi danh sách phòng / người chơi của shard mình khi nó đổi,
+  front chuyển cho các worker khác; mỗi worker gộp lại rồi broadcast như bình thường.
+- Sự kiện phòng (nước đi, chat, kết thúc ván) đi qua PipeBus: topic có người nghe
+  ở shard khác thì front (TopicHub) chuyển một bản cho mỗi shard đó.
+- Tìm trận (QUICK_MATCH) chạy một hàng đợi chung ở front; cặp được ghép sẽ chơi ở
+  shard của người chờ lâu hơn. Khác chế độ một process: người chờ lâu không được
+  đưa vào phòng CREATE_ROOM đang chờ (không có on_unmatched), vì phòng chờ và điểm
+  chủ phòng nằm ở các shard; front chỉ thấy tóm tắt phòng, giành một phòng sẽ cần
+  một vòng hỏi shard cho mỗi người chưa ghép được ở mỗi tick.
+- Người chơi rớt mạng giữa ván được giữ phiên ở shard của phòng; front nhớ
+  username -> shard để LOGIN lại được đưa về đúng shard đó.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+
+# Thêm đường dẫn để import được module từ thư mục cha
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.database import CaroDatabase
+from server.connection import OutboundConnection, AsyncConnection, DEFAULT_MAX_QUEUE_BYTES, OVERFLOW_DISCONNECT
+from server.main import CaroServer
+from server.matchmaking import MatchmakingService, Ticket, DEFAULT_MATCHMAKING_TICK
+from server.pubsub import PipeBus, TopicHub, room_topic
+from server.reconnect_grace import ReconnectGraceService
+from server.room_manager import RoomManager
+from server.scheduler import DeadlineScheduler
+from server.user_manager import UserManager
+from shared.protocol import MessageDecoder, InvalidMessage
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+_BATCH = 256  # Số lệnh tối đa gộp trong một lần ghi pipe
+
+
+def shard_of_room(room_id, shard_count):
+    """Shard giữ phòng room_{n}; None nếu room_id không đúng dạng"""
+    try:
+        n = int(str(room_id).rsplit('_', 1)[1])
+    except (IndexError, ValueError):
+        return None
+    return (n - 1) % shard_count
+
+
+class ShardLink:
+    """Một chiều của pipe giữa front và worker: gửi không block, gộp lệnh thành lô.
+
+    Nhiều thread (game logic, scheduler, lobby broadcaster) cùng gửi; một writer thread
+    gom mọi lệnh đang chờ vào một list rồi pickle + ghi một lần.
+    """
+    _STOP = object()
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.queue = queue.SimpleQueue()
+        self.writer = threading.Thread(target=self._writer_loop, daemon=True)
+        self.writer.start()
+
+    def send(self, item):
+        self.queue.put(item)
+
+    def _writer_loop(self):
+        while True:
+            item = self.queue.get()
+            batch = []
+            while item is not self._STOP:
+                batch.append(item)
+                if len(batch) >= _BATCH:
+                    break
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    self.conn.send(batch)
+                except (OSError, EOFError):
+                    return  # Đầu kia đã đóng
+            if item is self._STOP:
+                return
+
+    def close(self):
+        self.queue.put(self._STOP)
+        self.writer.join(1)
+
+
+def read_link(conn, handle_batch):
+    """Đọc các lô lệnh từ pipe cho tới khi đầu kia đóng"""
+    while True:
+        try:
+            batch = conn.recv()
+        except (EOFError, OSError):
+            return
+        handle_batch(batch)
+
+
+# --- WORKER ---
+
+class ShardConnection(OutboundConnection):
+    """'Socket' của một client trong worker: bytes đã encode được chuyển về front"""
+    def __init__(self, client_id, link):
+        super().__init__()
+        self.client_id = client_id
+        self.link = link
+
+    def _enqueue(self, data):
+        self.link.send(('send', self.client_id, data))
+        self._mark_sent(len(data), 1)  # Hàng đợi thật (có giới hạn) nằm ở front
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.link.send(('close', self.client_id))
+
+    abort = close
+
+
+class ShardUserManager(UserManager):
+    """Người chơi của shard này + người chơi các shard khác (để hiện trên sảnh)"""
+    def __init__(self, db, shard_index, link):
+        super().__init__(db)
+        self.shard_index = shard_index
+        self.link = link
+        self.remote_players = {}     # shard -> danh sách người chơi online của shard đó
+        self.published_players = None
+
+    def get_local_players(self):
+        return super().get_online_players()
+
+    def get_online_players(self):
+        players = self.get_local_players()
+        for remote in list(self.remote_players.values()):
+            players.extend(remote)
+        return players
+
+    def broadcast_online_players(self, server):
+        local = self.get_local_players()
+        if local != self.published_players:
+            self.published_players = local
+            self.link.send(('lobby_players', self.shard_index, local))
+        super().broadcast_online_players(server)
+
+    def detach_client(self, client_id, server):
+        """Gỡ client khỏi shard này để chuyển sang shard khác; trả về snapshot phiên"""
+        client = self.get_client(client_id)
+        if not client:
+            return None
+        server.scheduler.cancel(('heartbeat', client_id))
+        if client.room_id:
+            # Vào phòng ở shard khác = rời phòng hiện tại
+            server.room_manager.leave_room(client_id, client.room_id, server)
+        server.room_manager.forget_spectator(client_id)
+        server.bus.unsubscribe_all(client_id)
+        del self.clients[client_id]  # Không đóng connection: kết nối ở front vẫn sống
+        server.lobby_broadcaster.mark_dirty(players=True)
+        return client.snapshot()
+
+    def attach_client(self, client_id, snapshot, server):
+        self.add_client(client_id, ShardConnection(client_id, self.link))
+        client = self.clients[client_id]
+        for key, value in (snapshot or {}).items():
+            setattr(client, key, value)
+        self.update_lobby_subscription(client_id, server)
+        if client.username and client.lobby_deltas:
+            # lobby_version của client là của shard cũ: gửi snapshot để nó nhận delta của shard này
+            self.send_lobby_snapshot(client_id, server)
+        server.watch_heartbeat(client_id)
+        server.lobby_broadcaster.mark_dirty(players=True)
+
+
+class ShardRoomManager(RoomManager):
+    """Phòng của shard này (id cách nhau shard_count) + tóm tắt phòng các shard khác"""
+    def __init__(self, shard_index, shard_count, link):
+        super().__init__()
+        self.shard_index = shard_index
+        self.room_counter = shard_index + 1
+        self.room_id_step = shard_count
+        self.link = link
+        self.remote_rooms = {}       # shard -> tóm tắt phòng của shard đó
+        self.published_rooms = None
+
+    def get_room_list(self, server):
+        room_list = super().get_room_list(server)
+        for remote in list(self.remote_rooms.values()):
+            room_list.extend(remote)
+        return room_list
+
+    def broadcast_room_list(self, server):
+        local = RoomManager.get_room_list(self, server)
+        if local != self.published_rooms:
+            self.published_rooms = local
+            self.link.send(('lobby_rooms', self.shard_index, local))
+        super().broadcast_room_list(server)
+
+    def forget_spectator(self, client_id):
+        for room in list(self.rooms.values()):
+            with room.lock:
+                if client_id in room.spectators:
+                    room.spectators.remove(client_id)
+                    self.server_instance.bus.unsubscribe(room_topic(room.id), client_id)
+
+
+class ShardReconnectGrace(ReconnectGraceService):
+    """Báo cho front biết phiên của username đang được giữ ở shard này"""
+    def __init__(self, scheduler, shard_index, link, **kwargs):
+        super().__init__(scheduler, **kwargs)
+        self.shard_index = shard_index
+        self.link = link
+
+    def hold(self, user_id, client_data, old_client_id, on_expire):
+        session = super().hold(user_id, client_data, old_client_id, on_expire)
+        self.link.send(('held', session['data'].get('username'), self.shard_index))
+        return session
+
+    def resume(self, user_id):
+        session = super().resume(user_id)
+        if session:
+            self.link.send(('released', session['data'].get('username'), self.shard_index))
+        return session
+
+    def _run_expire(self, session):
+        self.link.send(('released', session['data'].get('username'), self.shard_index))
+        super()._run_expire(session)
+
+
+class MatchmakingProxy:
+    """Thay MatchmakingService trong worker: hàng đợi thật nằm ở front (chung mọi shard)"""
+    def __init__(self, link):
+        self.link = link
+
+    def enqueue(self, player_id, rating, enqueued_at=None):
+        self.link.send(('enqueue', player_id, rating, enqueued_at))
+
+    def cancel(self, player_id):
+        self.link.send(('cancel', player_id))
+
+
+class ShardServer(CaroServer):
+    """CaroServer chạy trong một worker: client đến từ front qua pipe, không mở socket"""
+    def __init__(self, shard_index, shard_count, link, db_path=None, matchmaking=True, **kwargs):
+        super().__init__(db_path=db_path, matchmaking_tick=None, **kwargs)
+        self.shard_index = shard_index
+        self.link = link
+        self.bus = PipeBus(self.broadcast, link, shard_index)
+        self.user_manager = ShardUserManager(self.db, shard_index, link)
+        self.room_manager = ShardRoomManager(shard_index, shard_count, link)
+        self.room_manager.set_server(self)
+        self.reconnect_grace = ShardReconnectGrace(self.scheduler, shard_index, link,
+                                                   grace_seconds=self.reconnect_grace.grace_seconds,
+                                                   max_sessions=self.reconnect_grace.max_sessions)
+        self.matchmaking = MatchmakingProxy(link) if matchmaking else None
+
+    def handle_command(self, command):
+        kind = command[0]
+        if kind == 'messages':
+            _, client_id, messages = command
+            self.user_manager.update_activity(client_id)
+            for message in messages:
+                try:
+                    self.process_message(client_id, message)
+                except Exception as e:
+                    print(f"❌ Error processing message from {client_id}: {e}")
+                    import traceback
+                    traceback.print_exc()
+        elif kind == 'connect':
+            self.user_manager.add_client(command[1], ShardConnection(command[1], self.link))
+            self.watch_heartbeat(command[1])
+        elif kind == 'disconnect':
+            self.disconnect_client(command[1])
+        elif kind == 'detach':
+            _, client_id, target = command
+            snapshot = self.user_manager.detach_client(client_id, self)
+            self.link.send(('attach', client_id, target, snapshot))
+        elif kind == 'attach':
+            _, client_id, snapshot = command
+            self.user_manager.attach_client(client_id, snapshot, self)
+        elif kind == 'lobby_rooms':
+            self.room_manager.remote_rooms[command[1]] = command[2]
+            self.lobby_broadcaster.mark_dirty(rooms=True)
+        elif kind == 'lobby_players':
+            self.user_manager.remote_players[command[1]] = command[2]
+            self.lobby_broadcaster.mark_dirty(players=True)
+        elif kind == 'publish':
+            self.bus.receive(command[1], command[2], command[3])
+        elif kind == 'topic_nodes':
+            self.bus.set_topic_nodes(command[1], command[2])
+        elif kind == 'start_match':
+            ticket, opponent = (Ticket(*fields) for fields in command[1:3])
+            self.room_manager.start_match(ticket, opponent)
+
+    def run(self, inbox):
+        """Vòng lặp chính của worker: xử lý lệnh từ front tới khi nhận 'stop'"""
+        self.running = True
+        try:
+            while self.running:
+                try:
+                    batch = inbox.recv()
+                except (EOFError, OSError):
+                    break
+                for command in batch:
+                    if command[0] == 'stop':
+                        self.running = False
+                        break
+                    try:
+                        self.handle_command(command)
+                    except Exception as e:
+                        print(f"❌ Shard {self.shard_index} error on {command[0]}: {e}")
+        finally:
+            self.scheduler.stop()
+            self.lobby_broadcaster.stop()
+            self.link.close()
+            self.db_writer.shutdown()  # Ghi nốt hàng đợi rồi mới đóng database
+
+
+def run_shard(shard_index, shard_count, inbox, outbox, db_path, options):
+    """Điểm vào của process worker"""
+    link = ShardLink(outbox)
+    server = ShardServer(shard_index, shard_count, link, db_path, **options)
+    print(f"🧩 Shard {shard_index}/{shard_count} ready (pid {os.getpid()})")
+    server.run(inbox)
+
+
+# --- FRONT ---
+
+class FrontClient:
+    """Một kết nối ở front: shard đang giữ client và message chờ khi đang chuyển shard"""
+    __slots__ = ('client_id', 'shard', 'pending', 'connection', 'transport', 'closed')
+
+    def __init__(self, client_id, shard, connection, transport):
+        self.client_id = client_id
+        self.shard = shard
+        self.pending = None      # list lệnh chờ gửi khi đang chuyển shard, None nếu không
+        self.connection = connection
+        self.transport = transport
+        self.closed = False
+
+
+class FrontProtocol(asyncio.BufferedProtocol):
+    def __init__(self, front):
+        self.front = front
+        self.client = None
+        self.decoder = MessageDecoder()
+
+    def connection_made(self, transport):
+        self.client = self.front.add_client(transport)
+
+    def get_buffer(self, sizehint):
+        return self.decoder.get_buffer(sizehint)
+
+    def buffer_updated(self, nbytes):
+        self.decoder.buffer_updated(nbytes)
+        messages = []
+        try:
+            while True:
+                try:
+                    message = self.decoder.next_message()
+                except InvalidMessage as e:
+                    print(f"⚠️ Invalid JSON from {self.client.client_id}: {e}")
+                    continue
+                if message is None:
+                    break
+                messages.append(message)
+        except Exception as e:
+            print(f"Error client {self.client.client_id}: {e}")
+            self.client.transport.close()
+        if messages:
+            self.front.route(self.client, messages)
+
+    def connection_lost(self, exc):
+        self.front.remove_client(self.client)
+
+
+class ShardedCaroServer:
+    """Front nhận kết nối và điều phối N ShardServer (mỗi cái một process)"""
+    create_ssl_context = CaroServer.create_ssl_context
+
+    def __init__(self, host='127.0.0.1', port=5555, db_path=None, workers=DEFAULT_WORKERS, backlog=1024,
+                 max_queue_bytes=DEFAULT_MAX_QUEUE_BYTES, overflow_policy=OVERFLOW_DISCONNECT,
+                 matchmaking_tick=DEFAULT_MATCHMAKING_TICK, **shard_options):
+        self.host = host
+        self.port = port
+        if db_path is None:
+            base_dir = os.path.dirname(os.path.abspath(__file__))
+            db_path = os.path.join(base_dir, "../database/caro.db")
+        self.db_path = db_path
+        self.workers = workers
+        self.backlog = backlog
+        self.connection_options = {'max_queue_bytes': max_queue_bytes, 'overflow_policy': overflow_policy}
+        self.shard_options = dict(shard_options, matchmaking=bool(matchmaking_tick))
+        self.matchmaking_tick = matchmaking_tick
+
+        self.clients = {}        # client_id -> FrontClient
+        self.client_counter = 1
+        self.held_sessions = {}  # username -> shard đang giữ phiên chờ kết nối lại
+        self.topics = TopicHub() # Pub/sub giữa các shard (server/pubsub.py)
+        self.processes = []
+        self.links = []          # front -> worker
+        self.readers = []
+        self.scheduler = None
+        self.matchmaking = None
+        self.loop = None
+        self.aio_server = None
+        self.running = False
+        self.started = threading.Event()  # Báo hiệu đã listen xong (dùng cho test)
+
+        # --- METRICS ---
+        self.routed = 0
+        self.migrations = 0
+
+    def start(self):
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            print("\n🛑 Server stopped by user.")
+        except Exception as e:
+            print(f"❌ Server error: {e}")
+        finally:
+            print("Cleaning up...")
+            self.running = False
+            self.stop_workers()
+
+    def start_workers(self):
+        # Tạo bảng + dữ liệu mặc định một lần trước khi các worker cùng mở database
+        CaroDatabase(self.db_path).close()
+        context = multiprocessing.get_context('spawn')
+        for index in range(self.workers):
+            inbox_read, inbox_write = context.Pipe(duplex=False)
+            outbox_read, outbox_write = context.Pipe(duplex=False)
+            process = context.Process(target=run_shard, daemon=True, name=f"caro-shard-{index}",
+                                      args=(index, self.workers, inbox_read, outbox_write,
+                                            self.db_path, self.shard_options))
+            process.start()
+            inbox_read.close()
+            outbox_write.close()
+            self.processes.append(process)
+            self.links.append(ShardLink(inbox_write))
+            reader = threading.Thread(target=read_link, daemon=True,
+                                      args=(outbox_read, lambda batch, shard=index: self.from_worker(shard, batch)))
+            reader.start()
+            self.readers.append(reader)
+
+        if self.matchmaking_tick:
+            self.scheduler = DeadlineScheduler()
+            # Không có on_unmatched: phòng đang chờ ở các shard (xem docstring của module)
+            self.matchmaking = MatchmakingService(
+                self.scheduler, self.on_match,
+                tick=self.matchmaking_tick)
+
+    def stop_workers(self):
+        for link in self.links:
+            link.send(('stop',))
+            link.close()
+        for process in self.processes:
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+        if self.scheduler:
+            self.scheduler.stop()
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.start_workers()
+        context = self.create_ssl_context()
+        self.aio_server = await self.loop.create_server(
+            lambda: FrontProtocol(self), self.host, self.port,
+            ssl=context, reuse_address=True, backlog=self.backlog)
+        self.port = self.aio_server.sockets[0].getsockname()[1]
+        self.running = True
+
+        print(f"🚀 Caro Server ({self.workers} shards) running on {self.host}:{self.port}")
+        self.started.set()
+
+        async with self.aio_server:
+            try:
+                await self.aio_server.serve_forever()
+            except asyncio.CancelledError:
+                pass
+
+    def stop(self):
+        """Dừng server từ một thread khác"""
+        self.running = False
+        if self.loop and self.aio_server:
+            self.loop.call_soon_threadsafe(self.aio_server.close)
+
+    # --- Kết nối (chạy trong event loop) ---
+
+    def add_client(self, transport):
+        client_id = self.client_counter
+        self.client_counter += 1
+        connection = AsyncConnection(transport, self.loop, **self.connection_options)
+        client = FrontClient(client_id, client_id % self.workers, connection, transport)
+        self.clients[client_id] = client
+        self.links[client.shard].send(('connect', client_id))
+        return client
+
+    def remove_client(self, client):
+        client.closed = True
+        self.deliver(client, ('disconnect', client.client_id))
+        if client.pending is None:
+            self.clients.pop(client.client_id, None)
+        if self.matchmaking:
+            self.matchmaking.cancel(client.client_id)
+
+    def route(self, client, messages):
+        """Gửi message tới shard giữ client; chuyển shard trước nếu message nhắm tới phòng ở shard khác"""
+        batch = []
+        for message in messages:
+            msg_type = message.get('type')
+            target = client.shard
+            if msg_type in ('JOIN_ROOM', 'VIEW_MATCH'):
+                shard = shard_of_room(message.get('room_id'), self.workers)
+                if shard is not None:
+                    target = shard
+            elif msg_type == 'LOGIN':
+                target = self.held_sessions.get(message.get('username'), target)
+
+            if target != client.shard:
+                if batch:
+                    self.deliver(client, ('messages', client.client_id, batch))
+                    batch = []
+                self.migrate(client, target)
+            batch.append(message)
+            self.routed += 1
+        if batch:
+            self.deliver(client, ('messages', client.client_id, batch))
+
+    def deliver(self, client, command):
+        if client.pending is not None:
+            client.pending.append(command)  # Đang chuyển shard: gửi sau khi attach
+        else:
+            self.links[client.shard].send(command)
+
+    def migrate(self, client, target):
+        if client.pending is None:
+            self.links[client.shard].send(('detach', client.client_id, target))
+            client.pending = []
+            self.migrations += 1
+        # Đang chuyển dở: snapshot sẽ được gửi thẳng tới shard mới nhất
+        client.shard = target
+
+    def finish_migration(self, client_id, snapshot):
+        client = self.clients.get(client_id)
+        if client is None or client.pending is None:
+            return
+        link = self.links[client.shard]
+        link.send(('attach', client_id, snapshot))
+        for command in client.pending:
+            link.send(command)
+        client.pending = None
+        if client.closed:
+            self.clients.pop(client_id, None)
+
+    def start_match(self, ticket, opponent):
+        """Hai người được ghép: chơi ở shard của người chờ lâu hơn"""
+        a, b = self.clients.get(ticket.player_id), self.clients.get(opponent.player_id)
+        if not (a and b and not a.closed and not b.closed and a.pending is None and b.pending is None):
+            for t, c in ((ticket, a), (opponent, b)):
+                if c and not c.closed:
+                    self.matchmaking.enqueue(t.player_id, t.rating, t.enqueued_at)
+            return
+        if b.shard != a.shard:
+            self.migrate(b, a.shard)
+        fields = lambda t: (t.player_id, t.rating, t.enqueued_at, t.bucket)
+        self.deliver(b, ('start_match', fields(ticket), fields(opponent)))
+
+    def handle_batch(self, shard, batch):
+        """Lệnh từ worker (chạy trong event loop)"""
+        for command in batch:
+            kind = command[0]
+            if kind == 'send':
+                client = self.clients.get(command[1])
+                if client and not client.closed:
+                    client.connection.send(command[2])
+            elif kind == 'close':
+                client = self.clients.get(command[1])
+                if client:
+                    client.transport.close()
+            elif kind == 'attach':
+                self.finish_migration(command[1], command[3])
+            elif kind in ('lobby_rooms', 'lobby_players'):
+                for index, link in enumerate(self.links):
+                    if index != shard:
+                        link.send(command)
+            elif self.topics.handle(shard, command, self.send_to_shard):
+                pass
+            elif kind == 'held':
+                self.held_sessions[command[1]] = command[2]
+            elif kind == 'released':
+                if self.held_sessions.get(command[1]) == command[2]:
+                    del self.held_sessions[command[1]]
+            elif kind == 'enqueue' and self.matchmaking:
+                self.matchmaking.enqueue(*command[1:])
+            elif kind == 'cancel' and self.matchmaking:
+                self.matchmaking.cancel(command[1])
+
+    def send_to_shard(self, shard, command):
+        self.links[shard].send(command)
+
+    def on_match(self, ticket, opponent):
+        """Scheduler thread -> event loop"""
+        self.loop.call_soon_threadsafe(self.start_match, ticket, opponent)
+
+    def from_worker(self, shard, batch):
+        """Thread đọc pipe -> event loop"""
+        try:
+            self.loop.call_soon_threadsafe(self.handle_batch, shard, batch)
+        except RuntimeError:
+            pass  # Loop đã đóng (đang tắt server)
+
+    def stats(self):
+        return {'workers': self.workers, 'clients': len(self.clients), 'routed': self.routed,
+                'migrations': self.migrations, 'held_sessions': len(self.held_sessions)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Caro server, multi-process")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5555)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    args = parser.parse_args()
+    ShardedCaroServer(args.host, args.port, workers=args.workers).start()
@@ -1,25 +1,19 @@
-import json
 import time
 
+from shared.protocol import encode_message
+from server.models import ClientSession
+from server.pubsub import LOBBY_TOPIC
+from server.room_manager import DEFAULT_RATING
+
 class UserManager:
     def __init__(self, db):
         self.db = db
-        # client_id -> {socket, username, user_id, room_id, display_name}
+        # client_id -> ClientSession (server/models.py)
         self.clients = {}  
-        self.disconnected_sessions = {} # user_id -> {data, timestamp}
 
         
-    def add_client(self, client_id, socket):
-        self.clients[client_id] = {
-            'socket': socket,
-            'username': None,
-            'user_id': None,
-            'room_id': None,
-            'display_name': None,
-            'display_name': None,
-            'avatar_id': 0, # Default avatar
-            'last_activity': time.time() # For Heartbeat
-        }
+    def add_client(self, client_id, connection):
+        self.clients[client_id] = ClientSession(connection)
         
     def get_client(self, client_id):
         return self.clients.get(client_id)
@@ -27,75 +21,58 @@ class UserManager:
     def remove_client(self, client_id):
         if client_id in self.clients:
             try: 
-                self.clients[client_id]['socket'].close()
+                self.clients[client_id].connection.close()
             except: 
                 pass
             del self.clients[client_id]
 
-    import threading
     def handle_disconnect(self, client_id, server):
         """Handle logic when a client disconnects (save session if in game)"""
         client = self.get_client(client_id)
         if not client: return
 
-        room_id = client.get('room_id')
-        user_id = client.get('user_id')
+        room_id = client.room_id
+        user_id = client.user_id
 
         # Logic Level 1: Check if in game -> Save session
         game_saved = False
         if room_id and user_id:
             # Check if room is actually playing? (Ask room manager or assume yes if room_id set)
             # Better to assume yes, room manager filters anyway.
-            print(f"⚠️ User {client['username']} disconnected during game. Saving session...")
+            print(f"⚠️ User {client.username} disconnected during game. Saving session...")
             
-            self.disconnected_sessions[user_id] = {
-                'data': client.copy(),
-                'disconnect_time': time.time(),
-                'old_client_id': client_id
-            }
-            # Don't save socket object obviously
-            if 'socket' in self.disconnected_sessions[user_id]['data']:
-                del self.disconnected_sessions[user_id]['data']['socket']
+            # Hết thời gian chờ mà chưa quay lại -> kick khỏi phòng như rời phòng thường
+            def on_expire(session):
+                server.room_manager.leave_room(session['old_client_id'], session['data'].get('room_id'), server)
+
+            server.reconnect_grace.hold(user_id, client.snapshot(), client_id, on_expire)
                 
             # Notify RoomManager to FREEZE/PAUSE player, NOT KICK
             server.room_manager.handle_player_disconnected_gracefully(client_id, room_id, server)
             game_saved = True
 
-            # Schedule cleanup after 60s
-            def cleanup_task():
-                time.sleep(60)
-                if user_id in self.disconnected_sessions:
-                    print(f"⏰ Session expired for {user_id}. Cleaning up...")
-                    # Now force kick
-                    # We need a way to tell room manager to kick "old_client_id"
-                    # But wait, room might still have old_client_id or be empty.
-                    server.room_manager.leave_room(client_id, room_id, server) 
-                    del self.disconnected_sessions[user_id]
-
-            threading.Thread(target=cleanup_task, daemon=True).start()
-
         # If not game saved, do normal kick (only if not saved!)
         if not game_saved:
             if room_id:
                  server.room_manager.leave_room(client_id, room_id, server)
         
         # Always remove from active clients
+        server.bus.unsubscribe_all(client_id)
         self.remove_client(client_id)
-        self.broadcast_online_players(server)
+        server.lobby_broadcaster.mark_dirty(players=True)
 
 
+    def update_lobby_subscription(self, client_id, server):
+        """Client đã đăng nhập + hỗ trợ lobby_deltas thì nghe LOBBY_TOPIC"""
+        client = self.get_client(client_id)
+        if client and client.username and client.lobby_deltas:
+            server.bus.subscribe(LOBBY_TOPIC, client_id)
+        else:
+            server.bus.unsubscribe(LOBBY_TOPIC, client_id)
+
     def update_activity(self, client_id):
         if client_id in self.clients:
-            self.clients[client_id]['last_activity'] = time.time()
-            
-    def check_inactive_clients(self, timeout_seconds=15):
-        """Returns a list of client_ids that are inactive"""
-        now = time.time()
-        inactive_ids = []
-        for cid, data in self.clients.items():
-            if now - data['last_activity'] > timeout_seconds:
-                inactive_ids.append(cid)
-        return inactive_ids
+            self.clients[client_id].last_activity = time.time()
             
     def handle_message(self, client_id, message, server):
         msg_type = message.get('type')
@@ -113,17 +90,21 @@ class UserManager:
         elif msg_type == 'GET_ONLINE_PLAYERS':
             self.send_online_players(client_id, server)
             
+        elif msg_type == 'GET_LOBBY_SNAPSHOT':
+            self.send_lobby_snapshot(client_id, server, message.get('version'))
+            
     def handle_login(self, client_id, message, server):
         """Xử lý đăng nhập thuần túy"""
         username = message.get('username')
         password = message.get('password') 
         print(f"🔍 Login request: {username}")
 
-        success, result = self.db.authenticate_user(username, password)
+        success, result = self.db.authenticate_user(username, password, record_login=False)
         
         if success:
             client = self.get_client(client_id)
             if not client: return
+            server.db_writer.record_login(result['id'])
 
             # Lấy thông tin chi tiết (display_name)
             user_info = self.db.get_user_info(result['id'])
@@ -135,10 +116,13 @@ class UserManager:
                 avatar_id = 0
             
             # Lưu vào RAM để dùng sau này (Cache)
-            client['username'] = result['username']
-            client['user_id'] = result['id']
-            client['display_name'] = display_name
-            client['avatar_id'] = avatar_id
+            client.username = result['username']
+            client.user_id = result['id']
+            client.display_name = display_name
+            client.avatar_id = avatar_id
+            client.rating = user_info['score'] if user_info else None
+            # Nghe delta trước khi nhận snapshot: delta cũ hơn snapshot bị client bỏ qua theo version
+            self.update_lobby_subscription(client_id, server)
             
             # Phản hồi cho Client
             server.send_to_client(client_id, {
@@ -149,19 +133,19 @@ class UserManager:
             })
             
             # Gửi dữ liệu cần thiết sau khi login
-            server.room_manager.send_room_list(client_id, server)
-            self.broadcast_online_players(server)
+            self.send_lobby(client_id, server)
+            server.lobby_broadcaster.mark_dirty(players=True)
 
             # --- LEVEL 1: CHECK RESUME GAME ---
-            if result['id'] in self.disconnected_sessions:
+            saved_session = server.reconnect_grace.resume(result['id'])
+            if saved_session:
                 print(f"🔄 Found disconnected session for {result['username']}. Restoring...")
-                saved_session = self.disconnected_sessions.pop(result['id'])
                 old_data = saved_session['data']
                 room_id = old_data.get('room_id')
                 old_client_id = saved_session['old_client_id']
                 
                 # Restore runtime data
-                client['room_id'] = room_id
+                client.room_id = room_id
                 
                 if room_id:
                     server.room_manager.reconnect_player(old_client_id, client_id, room_id, server)
@@ -192,10 +176,12 @@ class UserManager:
             # 3. Tự động Login luôn cho người dùng
             client = self.get_client(client_id)
             if client:
-                client['username'] = username
-                client['user_id'] = user_id
-                client['display_name'] = display_name
-                client['avatar_id'] = 0
+                client.username = username
+                client.user_id = user_id
+                client.display_name = display_name
+                client.avatar_id = 0
+                client.rating = DEFAULT_RATING  # users.score mặc định của tài khoản mới
+                self.update_lobby_subscription(client_id, server)  # Như handle_login
             
             server.send_to_client(client_id, {
                 'type': 'LOGIN_SUCCESS',
@@ -205,8 +191,8 @@ class UserManager:
             })
             
             # Gửi dữ liệu bàn chơi
-            server.room_manager.send_room_list(client_id, server)
-            self.broadcast_online_players(server)
+            self.send_lobby(client_id, server)
+            server.lobby_broadcaster.mark_dirty(players=True)
             
         else:
             server.send_error(client_id, "Đăng ký thất bại: Tên đăng nhập đã tồn tại.")
@@ -215,7 +201,7 @@ class UserManager:
         client = self.get_client(client_id)
         if not client: return
             
-        user_id = client.get('user_id')
+        user_id = client.user_id
         display_name = message.get('display_name', '').strip()
         old_password = message.get('old_password', '').strip()
         new_password = message.get('new_password', '').strip()
@@ -231,7 +217,7 @@ class UserManager:
                 server.send_error(client_id, "Cần mật khẩu cũ để đổi mật khẩu mới")
                 return
             # Check pass cũ
-            auth_success, _ = self.db.authenticate_user(client['username'], old_password)
+            auth_success, _ = self.db.authenticate_user(client.username, old_password, record_login=False)
             if not auth_success:
                 server.send_error(client_id, "Mật khẩu cũ không đúng")
                 return
@@ -246,21 +232,21 @@ class UserManager:
         
         if success:
             # Cập nhật Cache trong RAM
-            client['display_name'] = display_name
+            client.display_name = display_name
             if avatar_id is not None:
-                client['avatar_id'] = int(avatar_id)
+                client.avatar_id = int(avatar_id)
             
             server.send_to_client(client_id, {
                 'type': 'PROFILE_UPDATED',
                 'message': 'Cập nhật hồ sơ thành công!',
                 'display_name': display_name,
-                'avatar_id': client['avatar_id']
+                'avatar_id': client.avatar_id
             })
             # Thông báo cho mọi người biết mình đổi info
-            self.broadcast_online_players(server)
             # Cập nhật lại danh sách phòng (vì tên trong phòng có thể thay đổi)
             # TODO: Cập nhật avatar trong phòng nếu cần
-            server.room_manager.broadcast_room_list(server)
+            server.room_manager.refresh_room_of(client_id, server)
+            server.lobby_broadcaster.mark_dirty(rooms=True, players=True)
         else:
             server.send_error(client_id, "Lỗi hệ thống: Cập nhật thất bại")
             
@@ -275,15 +261,15 @@ class UserManager:
         """Lấy danh sách online từ RAM (nhanh hơn gọi DB)"""
         online_players = []
         for cid, cdata in self.clients.items():
-            if cdata.get('username'): # Chỉ lấy người đã login
+            if cdata.username: # Chỉ lấy người đã login
                 # Ưu tiên lấy display_name từ RAM, nếu không có thì lấy username
-                d_name = cdata.get('display_name') or cdata.get('username')
+                d_name = cdata.display_name or cdata.username
                 
                 online_players.append({
-                    'username': cdata['username'],
+                    'username': cdata.username,
                     'display_name': d_name,
-                    'user_id': cdata['user_id'],
-                    'avatar_id': cdata.get('avatar_id', 0)
+                    'user_id': cdata.user_id,
+                    'avatar_id': cdata.avatar_id
                 })
         return online_players
         
@@ -291,18 +277,85 @@ class UserManager:
         """Gửi danh sách người chơi online cho tất cả client"""
         online_players = self.get_online_players()
         
-        for cid in list(self.clients.keys()):
-            if self.clients[cid].get('username'):
-                server.send_to_client(cid, {
-                    'type': 'ONLINE_PLAYERS',
-                    'players': online_players
+        # Client mới: chỉ nhận phần thay đổi (PLAYER_JOINED/LEFT/UPDATED)
+        server.lobby.publish(server, players=online_players)
+        
+        # Client cũ: vẫn nhận toàn bộ danh sách
+        legacy = [cid for cid, cdata in list(self.clients.items())
+                  if cdata.username and not cdata.lobby_deltas]
+        server.broadcast(legacy, {
+            'type': 'ONLINE_PLAYERS',
+            'players': online_players
+        })
+        
+    def send_lobby(self, client_id, server):
+        """Gửi trạng thái sảnh chờ ban đầu theo khả năng của client"""
+        client = self.get_client(client_id)
+        if client and client.lobby_deltas:
+            self.send_lobby_snapshot(client_id, server)
+        else:
+            server.room_manager.send_room_list(client_id, server)
+            
+    def send_lobby_snapshot(self, client_id, server, known_version=None):
+        """Gửi toàn bộ sảnh chờ, hoặc delta rỗng nếu client đã có version mới nhất"""
+        lobby = server.lobby
+        with lobby.lock:
+            # Đồng bộ trước để snapshot luôn phản ánh trạng thái thật (người khác nhận delta nếu có)
+            lobby.publish(server, players=self.get_online_players(),
+                          rooms=server.room_manager.get_room_list(server),
+                          exclude=client_id)
+            
+            if known_version == lobby.version:
+                server.send_to_client(client_id, {
+                    'type': 'LOBBY_DELTA',
+                    'base_version': lobby.version,
+                    'version': lobby.version,
+                    'events': []
                 })
+            else:
+                server.send_to_client(client_id, lobby.snapshot())
                 
     def send_to_client(self, client_id, message):
-        if client_id in self.clients:
+        client = self.clients.get(client_id)
+        if client:
             try:
-                self.clients[client_id]['socket'].sendall(json.dumps(message).encode('utf-8'))
+                # Chỉ xếp hàng, writer của kết nối sẽ gửi -> client chậm không làm treo người gọi
+                client.connection.send(encode_message(message, client.framing))
             except Exception as e: 
                 print(f"❌ Error sending to {client_id}: {e}")
                 # Don't auto-disconnect here, let recv loop handle it
-                pass
\ No newline at end of file
+                pass
+
+    def broadcast(self, client_ids, message):
+        """Gửi cùng một message cho nhiều client: chỉ json.dumps một lần cho mỗi kiểu framing"""
+        encoded = {} # framing -> bytes
+        for client_id in client_ids:
+            client = self.clients.get(client_id)
+            if not client:
+                continue
+            framing = client.framing
+            data = encoded.get(framing)
+            if data is None:
+                data = encoded[framing] = encode_message(message, framing)
+            try:
+                client.connection.send(data)
+            except Exception as e:
+                print(f"❌ Error sending to {client_id}: {e}")
+
+    def get_outbound_stats(self):
+        """Tổng hợp độ sâu hàng đợi gửi của mọi client (để theo dõi client chậm)"""
+        totals = {'clients': 0, 'queued_bytes': 0, 'max_queued_bytes': 0,
+                  'messages_sent': 0, 'messages_dropped': 0, 'overflows': 0}
+        slowest = None
+        for cid, cdata in list(self.clients.items()):
+            stats = cdata.connection.stats()
+            totals['clients'] += 1
+            totals['queued_bytes'] += stats['queued_bytes']
+            totals['max_queued_bytes'] = max(totals['max_queued_bytes'], stats['max_queued_bytes'])
+            totals['messages_sent'] += stats['messages_sent']
+            totals['messages_dropped'] += stats['messages_dropped']
+            totals['overflows'] += stats['overflows']
+            if slowest is None or stats['queued_bytes'] > slowest[1]:
+                slowest = (cid, stats['queued_bytes'])
+        totals['slowest_client'] = slowest[0] if slowest and slowest[1] > 0 else None
+        return totals
@@ -0,0 +1,130 @@
+# shared/bitboard.py - Bàn cờ dùng bitmask (cùng API với CaroBoard)
+"""Bitboard engine for CaroBoard.
+
+Every player owns one Python int per line of the board: rows, columns,
+diagonals (x - y constant) and anti-diagonals (x + y constant). Bit ``i`` of
+a line mask is set when the player has a stone at position ``i`` along that
+line. A move touches exactly four masks, and ``win_length`` in a row is
+found with shift-and-AND on the ``2 * win_length - 1`` bit window around the
+move instead of walking cells with bounds checks. The shift sequence only
+depends on ``win_length`` and is computed once, so the cost per move does
+not grow with the board size.
+
+``board`` is still kept as a list of lists so code that reads cells directly
+(spectators, reconnect) keeps working.
+"""
+from functools import lru_cache
+
+from shared.board import CaroBoard
+
+
+@lru_cache(maxsize=None)
+def _run_shifts(win_length):
+    """Shifts that turn a mask into 'start of a run of win_length' bits.
+
+    After ``mask &= mask >> step`` a set bit marks a run of ``run + step``
+    (for step <= run), so runs double until the last step tops them up:
+    5 -> (1, 2, 1), 6 -> (1, 2, 2).
+    """
+    shifts, run = [], 1
+    while run < win_length:
+        step = min(run, win_length - run)
+        shifts.append(step)
+        run += step
+    return tuple(shifts)
+
+
+def has_run(mask, win_length=5):
+    """Return True if ``mask`` contains ``win_length`` consecutive set bits."""
+    for step in _run_shifts(win_length):
+        mask &= mask >> step
+    return mask != 0
+
+
+class BitboardCaroBoard(CaroBoard):
+    """Drop-in replacement for CaroBoard with O(1) win detection."""
+
+    def __init__(self, size=15, win_length=5):
+        super().__init__(size, win_length)
+        self._reach = win_length - 1
+        self._window = (1 << (2 * win_length - 1)) - 1  # Ô vừa đánh và reach ô mỗi bên
+        self._shifts = _run_shifts(win_length)
+        self._neighbours = 0b101 << (win_length - 2) if win_length > 1 else self._window
+        self._clear_masks()
+
+    def _has_run_through(self, lines):
+        """win_length in a row in any (mask, pos) line, through bit ``pos``"""
+        reach, window_mask, shifts, neighbours = self._reach, self._window, self._shifts, self._neighbours
+        for mask, pos in lines:
+            shift = pos - reach
+            # Only runs through (x, y) matter: keep bits pos-reach .. pos+reach
+            window = (mask >> shift if shift >= 0 else mask << -shift) & window_mask
+            # Cheap reject: a run through pos needs at least one neighbour on the line
+            if not window & neighbours:
+                continue
+            for step in shifts:
+                window &= window >> step
+            if window:
+                return True
+        return False
+
+    def _clear_masks(self):
+        lines = 2 * self.size - 1
+        # Index 0 is unused so player 1 / 2 can be used directly
+        self.rows = [None] + [[0] * self.size for _ in range(2)]
+        self.cols = [None] + [[0] * self.size for _ in range(2)]
+        self.diags = [None] + [[0] * lines for _ in range(2)]
+        self.anti_diags = [None] + [[0] * lines for _ in range(2)]
+
+    def make_move(self, x, y, player=None):
+        """Make a move at position (x, y)"""
+        if player is None:
+            player = self.current_player
+
+        if self.game_over or not (0 <= x < self.size and 0 <= y < self.size) or self.board[y][x]:
+            return False, "Invalid move"
+
+        self.board[y][x] = player
+        self.moves_history.append((x, y, player))
+        self._occupy(x, y)
+
+        # Only the four lines through (x, y) change; check them while updating
+        size = self.size
+        rows, cols = self.rows[player], self.cols[player]
+        diags, anti_diags = self.diags[player], self.anti_diags[player]
+        d, a = x - y + size - 1, x + y
+        rows[y] |= 1 << x
+        cols[x] |= 1 << y
+        diags[d] |= 1 << x
+        anti_diags[a] |= 1 << x
+
+        if self._has_run_through(((rows[y], x), (cols[x], y), (diags[d], x), (anti_diags[a], x))):
+            self.winner = player
+            self.game_over = True
+            return True, "win"
+
+        if self.empty_count == 0:
+            self.game_over = True
+            return True, "draw"
+
+        self.current_player = 3 - player
+        return True, "continue"
+
+    def check_win(self, x, y, player):
+        """Check if player wins after placing at (x, y)"""
+        if not (0 <= x < self.size and 0 <= y < self.size):
+            return False
+
+        bit = 1 << x
+        # Counted even if the stone is not placed yet, like CaroBoard
+        return self._has_run_through((
+            (self.rows[player][y] | bit, x),
+            (self.cols[player][x] | (1 << y), y),
+            (self.diags[player][x - y + self.size - 1] | bit, x),
+            (self.anti_diags[player][x + y] | bit, x),
+        ))
+
+    def reset(self):
+        """Reset the board for new game"""
+        super().reset()
+        self._clear_masks()
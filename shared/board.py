@@ -1,12 +1,46 @@
 # shared/board.py - ĐÚNG
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def _all_cells(size):
+    """Every (x, y) of a size x size board in row-major order (shared, read-only)"""
+    return tuple((x, y) for y in range(size) for x in range(size))
+
+
 class CaroBoard:
-    def __init__(self, size=15):
+    def __init__(self, size=15, win_length=5):
         self.size = size
-        self.board = [[0 for _ in range(size)] for _ in range(size)]
+        self.win_length = win_length
+        self.board = [[0] * size for _ in range(size)]
         self.current_player = 1  # 1 = X, 2 = O
         self.moves_history = []  # [(x, y, player), ...]
         self.winner = None
         self.game_over = False
+        self._reset_empty_cells()
+
+    def _reset_empty_cells(self):
+        """Count empty cells so is_full never scans the board"""
+        self.empty_count = self.size * self.size
+        self._legal_moves = None  # Built on first use (bots / analysis), not per room
+
+    @property
+    def legal_moves(self):
+        """Empty cells, kept up to date once built.
+
+        A dict keeps row-major order and supports O(1) removal; keys() is set-like.
+        Server rooms never ask for it, so they don't pay size * size entries each.
+        """
+        if self._legal_moves is None:
+            board = self.board
+            self._legal_moves = dict.fromkeys(cell for cell in _all_cells(self.size)
+                                              if board[cell[1]][cell[0]] == 0)
+        return self._legal_moves
+
+    def _occupy(self, x, y):
+        self.empty_count -= 1
+        if self._legal_moves is not None:
+            del self._legal_moves[(x, y)]
 
     def make_move(self, x, y, player=None):
         """Make a move at position (x, y)"""
@@ -20,6 +54,7 @@ class CaroBoard:
         # Make the move
         self.board[y][x] = player
         self.moves_history.append((x, y, player))
+        self._occupy(x, y)
 
         # Check for win
         if self.check_win(x, y, player):
@@ -61,7 +96,7 @@ class CaroBoard:
             count = 1  # Count the current stone
 
             # Check positive direction
-            for i in range(1, 5):
+            for i in range(1, self.win_length):
                 nx, ny = x + dx * i, y + dy * i
                 if 0 <= nx < self.size and 0 <= ny < self.size and self.board[ny][nx] == player:
                     count += 1
@@ -69,39 +104,65 @@ class CaroBoard:
                     break
 
             # Check negative direction
-            for i in range(1, 5):
+            for i in range(1, self.win_length):
                 nx, ny = x - dx * i, y - dy * i
                 if 0 <= nx < self.size and 0 <= ny < self.size and self.board[ny][nx] == player:
                     count += 1
                 else:
                     break
 
-            # If we have 5 or more in a row
-            if count >= 5:
+            if count >= self.win_length:
                 return True
 
         return False
 
     def is_full(self):
         """Check if board is full"""
-        for row in self.board:
-            for cell in row:
-                if cell == 0:
-                    return False
-        return True
+        return self.empty_count == 0
 
     def get_board(self):
         """Get copy of board state"""
         return [row[:] for row in self.board]
 
     def get_legal_moves(self):
-        """Get all legal moves for current player"""
-        moves = []
-        for y in range(self.size):
-            for x in range(self.size):
-                if self.board[y][x] == 0:
-                    moves.append((x, y))
-        return moves
+        """Get all legal moves for current player (row-major order)"""
+        return list(self.legal_moves)
+
+    def iter_legal_moves(self, center=None):
+        """Lazily yield legal moves.
+
+        Without ``center`` the order is row-major. With ``center=(x, y)`` moves
+        are yielded ring by ring (Chebyshev distance) around that cell, so a
+        caller that only needs the nearby moves stops early without building
+        the full list. Safe to use while moves are being made.
+        """
+        board = self.board
+        if center is None:
+            for y in range(self.size):
+                row = board[y]
+                for x in range(self.size):
+                    if row[x] == 0:
+                        yield (x, y)
+            return
+
+        cx, cy = center
+        for radius in range(self.size):
+            for x, y in self._ring(cx, cy, radius):
+                if 0 <= x < self.size and 0 <= y < self.size and board[y][x] == 0:
+                    yield (x, y)
+
+    @staticmethod
+    def _ring(cx, cy, radius):
+        """Cells at Chebyshev distance ``radius`` from (cx, cy)"""
+        if radius == 0:
+            yield (cx, cy)
+            return
+        for x in range(cx - radius, cx + radius + 1):
+            yield (x, cy - radius)
+            yield (x, cy + radius)
+        for y in range(cy - radius + 1, cy + radius):
+            yield (cx - radius, y)
+            yield (cx + radius, y)
 
     def reset(self):
         """Reset the board for new game"""
@@ -110,6 +171,7 @@ class CaroBoard:
         self.moves_history = []
         self.winner = None
         self.game_over = False
+        self._reset_empty_cells()
 
     def print_board(self):
         """Print board to console (for debugging)"""
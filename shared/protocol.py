@@ -0,0 +1,258 @@
+# shared/protocol.py - Định dạng gói tin dùng chung cho server và client
+"""Wire format helpers shared by server and client.
+
+Two framings can be used on the same connection:
+
+- ``json``   (legacy): JSON objects written back to back, boundaries found by
+  counting braces outside of strings.
+- ``length``: a 4-byte big-endian payload length followed by the UTF-8 JSON
+  payload. Finding a message boundary is O(1).
+
+A length header never starts with ``{``: frames are capped at MAX_FRAME_SIZE,
+so the first header byte is always 0x00. The decoder therefore recognises
+both framings message by message and a peer may switch at any point.
+
+Negotiation only decides what a side *sends*. The client sends
+``{'type': 'HELLO', 'framing': 'length', 'features': [...]}`` in legacy
+framing; a server that supports it answers ``HELLO_ACK`` (still legacy) with
+the framing and the subset of features it accepted, then sends
+length-prefixed frames. The client switches its own outgoing framing once it
+sees the ACK, so old servers that never answer keep working in legacy mode.
+"""
+import codecs
+import json
+import re
+import struct
+
+FRAMING_JSON = 'json'
+FRAMING_LENGTH = 'length'
+SUPPORTED_FRAMINGS = (FRAMING_JSON, FRAMING_LENGTH)
+
+# Optional features negotiated in HELLO / HELLO_ACK
+FEATURE_LOBBY_DELTAS = 'lobby_deltas'  # LOBBY_SNAPSHOT + LOBBY_DELTA instead of full lists
+SUPPORTED_FEATURES = (FEATURE_LOBBY_DELTAS,)
+
+HEADER = struct.Struct('>I')
+MAX_FRAME_SIZE = 1 << 20  # 1 MB is far above any real message
+RECV_BUFFER_SIZE = 8192  # Preallocated per connection, grows only for larger frames
+MIN_READ_SIZE = 4096
+
+# Only these bytes matter when scanning legacy JSON; everything else is skipped at C speed
+_LEGACY_TOKENS = re.compile(rb'[{}"\\]')
+# A complete object without nested objects (MOVE, CHAT, LOGIN...) in a single match
+_FLAT_OBJECT = re.compile(rb'\{(?:[^{}"\\]|"(?:[^"\\]|\\.)*")*\}', re.DOTALL)
+_MESSAGE_START = re.compile(rb'[{\x00]')
+
+_OPEN_BRACE = ord('{')
+_CLOSE_BRACE = ord('}')
+_QUOTE = ord('"')
+_BACKSLASH = ord('\\')
+
+
+class ProtocolError(Exception):
+    """The byte stream can no longer be framed; the connection should be closed."""
+
+
+class InvalidMessage(ProtocolError):
+    """One frame was skipped because it did not contain a JSON object."""
+
+
+def encode_message(message, framing=FRAMING_JSON):
+    """Serialize a message dict into bytes for the given framing."""
+    payload = json.dumps(message).encode('utf-8')
+    if framing == FRAMING_LENGTH:
+        return HEADER.pack(len(payload)) + payload
+    return payload
+
+
+def decode_payload(payload):
+    """Parse one frame payload (bytes or memoryview) into a message dict."""
+    try:
+        # utf_8_decode reads the memoryview in place, no intermediate bytes copy
+        message = json.loads(codecs.utf_8_decode(payload, 'strict', True)[0])
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidMessage(f"{e}: {bytes(payload[:50])!r}...")
+    if not isinstance(message, dict):
+        raise InvalidMessage(f"Ignored non-dict message: {message!r}")
+    return message
+
+
+class MessageDecoder:
+    """Incremental decoder accepting both legacy JSON and length-prefixed frames.
+
+    Received bytes live in one preallocated ``bytearray``. Callers either
+    ``feed()`` bytes they already have, or read straight into the buffer
+    without copying (``sock.recv_into(decoder.get_buffer())`` followed by
+    ``decoder.buffer_updated(n)``, the same contract as
+    ``asyncio.BufferedProtocol``).
+
+    Payloads are decoded from UTF-8 only once a whole frame is available, so
+    a multibyte character split across two reads is never a problem. The
+    legacy scanner remembers where it stopped, so every byte is looked at
+    once no matter how the stream is chunked.
+    """
+
+    def __init__(self, max_frame_size=MAX_FRAME_SIZE, capacity=RECV_BUFFER_SIZE):
+        self.max_frame_size = max_frame_size
+        self.capacity = capacity
+        self._buffer = bytearray(capacity)
+        self._view = memoryview(self._buffer)
+        self._start = 0  # First byte not yet consumed
+        self._end = 0    # End of received data
+        self._reset_scan()
+
+    def _reset_scan(self):
+        self._scan_pos = None  # Resume point of a partially scanned legacy message
+        self._depth = 0
+        self._in_string = False
+
+    def get_buffer(self, sizehint=-1):
+        """Return a writable memoryview of at least ``sizehint`` free bytes."""
+        needed = max(sizehint, MIN_READ_SIZE)
+        if len(self._buffer) - self._end < needed:
+            self._make_room(needed)
+        return self._view[self._end:]
+
+    def buffer_updated(self, nbytes):
+        """Mark ``nbytes`` written into the view from get_buffer() as received."""
+        self._end += nbytes
+
+    def feed(self, data):
+        """Append received bytes (copying them once into the buffer)."""
+        size = len(data)
+        self.get_buffer(size)[:size] = data
+        self._end += size
+
+    def _make_room(self, needed):
+        pending = self._end - self._start
+        if self._scan_pos is not None:
+            self._scan_pos -= self._start
+
+        if pending + needed <= len(self._buffer):
+            # Slide the unconsumed tail to the front, no reallocation
+            self._view[:pending] = self._view[self._start:self._end]
+        else:
+            # Only when one frame is larger than the buffer; old views stay valid
+            buffer = bytearray(max(2 * len(self._buffer), pending + needed))
+            buffer[:pending] = self._view[self._start:self._end]
+            self._buffer = buffer
+            self._view = memoryview(buffer)
+
+        self._start = 0
+        self._end = pending
+
+    def pending(self):
+        """Number of buffered bytes not yet returned as messages."""
+        return self._end - self._start
+
+    def __iter__(self):
+        while True:
+            message = self.next_message()
+            if message is None:
+                return
+            yield message
+
+    def next_message(self):
+        """Return the next complete message, or None if more data is needed.
+
+        Raises InvalidMessage for a frame that is not a JSON object (the frame
+        is consumed, decoding can continue) and ProtocolError when the stream
+        is unrecoverable.
+        """
+        if self._start == self._end:
+            # Everything consumed: next read starts at the front again for free
+            self._start = self._end = 0
+            if len(self._buffer) > self.capacity:
+                # Give back the memory grown for an unusually large frame
+                self._buffer = bytearray(self.capacity)
+                self._view = memoryview(self._buffer)
+            return None
+
+        if self._scan_pos is None:
+            # Skip garbage between messages (same as the old parser)
+            match = _MESSAGE_START.search(self._buffer, self._start, self._end)
+            if match is None:
+                self._start = self._end
+                return None
+            self._start = match.start()
+
+            if self._buffer[self._start] == 0:
+                return self._next_length_frame()
+
+            # Fast path: most messages are flat and arrive whole
+            match = _FLAT_OBJECT.match(self._buffer, self._start, self._end)
+            if match:
+                start = self._start
+                self._start = match.end()
+                return decode_payload(self._view[start:self._start])
+
+            self._scan_pos = self._start + 1
+            self._depth = 1
+
+        end = self._scan_legacy()
+        if end == -1:
+            return None
+
+        start = self._start
+        self._start = end
+        self._reset_scan()
+        return decode_payload(self._view[start:end])
+
+    def _next_length_frame(self):
+        start = self._start + HEADER.size
+        if self._end < start:
+            return None
+
+        (length,) = HEADER.unpack_from(self._buffer, self._start)
+        if length > self.max_frame_size:
+            raise ProtocolError(f"Frame too large: {length} bytes")
+
+        end = start + length
+        if self._end < end:
+            return None
+
+        self._start = end
+        return decode_payload(self._view[start:end])
+
+    def _scan_legacy(self):
+        """Advance the brace counter; return the end index of the object or -1."""
+        buf = self._buffer
+        limit = self._end
+        pos = self._scan_pos
+        depth = self._depth
+        in_string = self._in_string
+
+        while True:
+            match = _LEGACY_TOKENS.search(buf, pos, limit)
+            if match is None:
+                pos = limit
+                break
+
+            char = buf[match.start()]
+            pos = match.end()
+
+            if char == _BACKSLASH:
+                if in_string:
+                    if pos >= limit:
+                        # Escape split across chunks: look at it again next time
+                        pos = match.start()
+                        break
+                    pos += 1  # Skip escaped character (e.g. \" or \\)
+            elif char == _QUOTE:
+                in_string = not in_string
+            elif in_string:
+                continue
+            elif char == _OPEN_BRACE:
+                depth += 1
+            elif char == _CLOSE_BRACE:
+                depth -= 1
+                if depth == 0:
+                    return pos
+
+        if pos - self._start > self.max_frame_size:
+            raise ProtocolError(f"Message too large: over {self.max_frame_size} bytes")
+
+        self._scan_pos = pos
+        self._depth = depth
+        self._in_string = in_string
+        return -1
@@ -0,0 +1,95 @@
+# tests/test_bitboard.py - BitboardCaroBoard phải cho kết quả giống hệt CaroBoard
+import unittest
+import random
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.board import CaroBoard
+from shared.bitboard import BitboardCaroBoard, has_run
+
+
+class TestBitboardEquivalence(unittest.TestCase):
+    def play_random_game(self, seed, size=15):
+        rng = random.Random(seed)
+        reference, bitboard = CaroBoard(size), BitboardCaroBoard(size)
+        while not reference.game_over:
+            # Thỉnh thoảng đánh vào ô đã có quân / ngoài bàn cờ
+            x, y = rng.randrange(-1, size + 1), rng.randrange(-1, size + 1)
+            self.assertEqual(bitboard.make_move(x, y), reference.make_move(x, y))
+        return reference, bitboard
+
+    def test_random_games_match(self):
+        for seed in range(200):
+            reference, bitboard = self.play_random_game(seed)
+            self.assertEqual(bitboard.get_board(), reference.get_board())
+            self.assertEqual(bitboard.winner, reference.winner)
+            self.assertEqual(bitboard.moves_history, reference.moves_history)
+
+    def test_check_win_matches_every_cell(self):
+        """So sánh check_win ở mọi ô cho cả hai người chơi giữa ván"""
+        rng = random.Random(42)
+        for _ in range(30):
+            reference, bitboard = CaroBoard(), BitboardCaroBoard()
+            for _ in range(rng.randrange(20, 80)):
+                x, y = rng.randrange(15), rng.randrange(15)
+                if reference.board[y][x] == 0:
+                    # Bỏ qua game_over để bàn cờ dày hơn (nhiều đường 4-5 quân)
+                    player = rng.choice((1, 2))
+                    reference.board[y][x] = player
+                    bitboard.game_over = False
+                    bitboard.current_player = player
+                    bitboard.make_move(x, y, player)
+            for y in range(15):
+                for x in range(15):
+                    for player in (1, 2):
+                        self.assertEqual(bitboard.check_win(x, y, player),
+                                         reference.check_win(x, y, player), (x, y, player))
+
+    def test_small_board_draw(self):
+        reference, bitboard = self.play_random_game(7, size=3)
+        self.assertTrue(bitboard.is_full())
+        self.assertIsNone(bitboard.winner)
+
+    def test_win_at_edges(self):
+        for cells in ([(x, 14) for x in range(10, 15)],
+                      [(14 - i, i) for i in range(5)],
+                      [(i, 10 + i) for i in range(5)]):
+            board = BitboardCaroBoard()
+            for x, y in cells[:-1]:
+                board.current_player = 1
+                self.assertEqual(board.make_move(x, y, 1), (True, "continue"))
+            board.current_player = 1
+            self.assertEqual(board.make_move(*cells[-1], 1), (True, "win"))
+
+    def test_reset_clears_masks(self):
+        _, bitboard = self.play_random_game(3)
+        bitboard.reset()
+        self.assertEqual(bitboard.make_move(7, 7), (True, "continue"))
+        self.assertFalse(bitboard.check_win(8, 8, 1))
+
+    def test_has_run(self):
+        self.assertTrue(has_run(0b11111))
+        self.assertTrue(has_run(0b1011111000))
+        self.assertFalse(has_run(0b11110111))
+        for k in range(1, 12):
+            self.assertTrue(has_run((1 << k) - 1, k))
+            self.assertFalse(has_run((1 << (k - 1)) - 1, k))
+
+    def test_other_sizes_and_win_lengths_match(self):
+        """Bàn 19x19, bàn lớn 40x40, luật 4 hoặc 6 quân: kết quả giống CaroBoard"""
+        for size, win_length in ((19, 5), (40, 5), (15, 4), (30, 6), (9, 3)):
+            for seed in range(20):
+                rng = random.Random(seed)
+                reference = CaroBoard(size, win_length)
+                bitboard = BitboardCaroBoard(size, win_length)
+                for _ in range(500):
+                    # Đánh dồn vào một vùng nhỏ để có nhiều ván thắng
+                    x, y = rng.randrange(min(size, 8)), rng.randrange(min(size, 8))
+                    self.assertEqual(bitboard.make_move(x, y), reference.make_move(x, y))
+                self.assertEqual(bitboard.winner, reference.winner, (size, win_length, seed))
+
+
+if __name__ == "__main__":
+    unittest.main()
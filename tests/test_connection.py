@@ -0,0 +1,142 @@
+# tests/test_connection.py - TESTS CHO HÀNG ĐỢI GỬI CỦA MỖI CLIENT
+import unittest
+import socket
+import threading
+import time
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.connection import OutboundConnection, ThreadedConnection, AsyncConnection, OVERFLOW_DROP, OVERFLOW_DISCONNECT
+
+
+class TestThreadedConnection(unittest.TestCase):
+    def setUp(self):
+        self.pairs = []
+
+    def tearDown(self):
+        for conn, peer in self.pairs:
+            conn.close()
+            peer.close()
+
+    def make_connection(self, **kwargs):
+        server_side, peer = socket.socketpair()
+        conn = ThreadedConnection(server_side, **kwargs)
+        self.pairs.append((conn, peer))
+        return conn, peer
+
+    def test_messages_are_delivered_in_order(self):
+        conn, peer = self.make_connection()
+        for i in range(100):
+            self.assertTrue(conn.send(f"{i};".encode()))
+
+        expected = "".join(f"{i};" for i in range(100)).encode()
+        received = b""
+        peer.settimeout(5)
+        while len(received) < len(expected):
+            received += peer.recv(4096)
+        self.assertEqual(received, expected)
+
+        deadline = time.time() + 5
+        while conn.stats()['messages_sent'] < 100 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(conn.stats()['queued_bytes'], 0)
+
+    def test_stalled_client_does_not_block_broadcast(self):
+        """Một client không đọc không được làm chậm vòng gửi cho những người khác"""
+        slow, _ = self.make_connection(max_queue_bytes=64 * 1024, overflow_policy=OVERFLOW_DROP)
+        fast, fast_peer = self.make_connection()
+        payload = b"x" * 1024
+
+        fast_peer.setblocking(False)
+
+        start = time.time()
+        for i in range(4096):  # 4 MB, vượt xa buffer của kernel
+            slow.send(payload)
+            fast.send(payload)
+            if i % 64 == 0:
+                try:
+                    fast_peer.recv(1 << 20)  # Client nhanh vẫn đọc đều
+                except BlockingIOError:
+                    pass
+        elapsed = time.time() - start
+
+        self.assertLess(elapsed, 2.0)
+        stats = slow.stats()
+        self.assertGreater(stats['messages_dropped'], 0)
+        self.assertLessEqual(stats['queued_bytes'], 64 * 1024)
+        self.assertFalse(slow.closed)  # 'drop' giữ kết nối
+
+    def test_overflow_disconnects_slow_client(self):
+        conn, peer = self.make_connection(max_queue_bytes=16 * 1024, overflow_policy=OVERFLOW_DISCONNECT)
+        payload = b"y" * 4096
+        while conn.send(payload):
+            pass
+        self.assertTrue(conn.closed)
+        self.assertEqual(conn.stats()['overflows'], 1)
+
+    def test_base_class_needs_a_writer(self):
+        with self.assertRaises(TypeError):
+            OutboundConnection()
+
+
+class FakeLoop:
+    """Giữ các callback call_soon_threadsafe cho tới khi test cho loop chạy"""
+    def __init__(self):
+        self.callbacks = []
+
+    def call_soon_threadsafe(self, callback, *args):
+        self.callbacks.append((callback, args))
+
+    def run(self):
+        callbacks, self.callbacks = self.callbacks, []
+        for callback, args in callbacks:
+            callback(*args)
+
+
+class FakeTransport:
+    def __init__(self):
+        self.buffered = 0
+
+    def write(self, data):
+        self.buffered += len(data)
+
+    def get_write_buffer_size(self):
+        return self.buffered
+
+    def is_closing(self):
+        return False
+
+
+class TestAsyncConnection(unittest.TestCase):
+    def make_connection(self, **kwargs):
+        """Tạo connection trên một thread khác: mọi send của test đi qua call_soon_threadsafe"""
+        self.loop, self.transport = FakeLoop(), FakeTransport()
+        made = []
+        thread = threading.Thread(target=lambda: made.append(AsyncConnection(self.transport, self.loop, **kwargs)))
+        thread.start()
+        thread.join()
+        return made[0]
+
+    def test_pending_writes_count_toward_limit(self):
+        """Dữ liệu chưa tới event loop vẫn tính vào hàng đợi"""
+        conn = self.make_connection(max_queue_bytes=16 * 1024, overflow_policy=OVERFLOW_DROP)
+        payload = b"z" * 4096
+        for _ in range(4):
+            self.assertTrue(conn.send(payload))
+        self.assertEqual(conn.queue_depth(), 16 * 1024)
+        self.assertFalse(conn.send(payload))
+
+        self.loop.run()
+        self.assertEqual(self.transport.buffered, 16 * 1024)
+        self.assertEqual(conn.stats()['queued_bytes'], 16 * 1024)
+        self.assertEqual(conn.stats()['bytes_sent'], 16 * 1024)
+
+        self.transport.buffered = 0  # Kernel nhận hết
+        self.assertTrue(conn.send(payload))
+        self.assertEqual(conn.stats()['messages_dropped'], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
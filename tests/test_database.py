@@ -1,13 +1,20 @@
 # tests/test_database.py - TESTS RIÊNG CHO DATABASE
 import unittest
+import random
+import sqlite3
 import tempfile
+import threading
+import time
 import os
 import sys
 
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from database.database import CaroDatabase
+from database.database import CaroDatabase, encode_moves, decode_moves, USER_STATS_SQL, RECENT_GAMES_SQL
+from database.leaderboard import RankIndex, ScoreBucket, RANK_BLOCK
+from database.migrate_moves import migrate
+from database.write_behind import WriteBehindQueue
 
 class TestDatabaseIntegration(unittest.TestCase):
     """Integration tests for database"""
@@ -166,6 +173,374 @@ class TestDatabaseBasic(unittest.TestCase):
             if os.path.exists(db_path):
                 os.unlink(db_path)
 
+class TestWriteBehind(unittest.TestCase):
+    """Ghi phía sau: gộp transaction, đúng thứ tự, flush khi tắt"""
+
+    def setUp(self):
+        self.temp_db = tempfile.NamedTemporaryFile(delete=False, suffix='.db')
+        self.db_path = self.temp_db.name
+        self.temp_db.close()
+        self.db = CaroDatabase(self.db_path)
+        self.user_id = self.db.get_user_by_username('player1')['id']
+
+    def tearDown(self):
+        self.db.close()
+        if os.path.exists(self.db_path):
+            try:
+                os.unlink(self.db_path)
+            except:
+                pass
+
+    def score(self):
+        return self.db.get_user_info(self.user_id)['score']
+
+    def test_writes_are_batched_in_order(self):
+        writer = WriteBehindQueue(self.db)
+        with writer.cond:  # Giữ writer lại để mọi lệnh vào cùng một lô
+            for _ in range(50):
+                writer.pending.append(('score', (-100, self.user_id)))
+                writer.enqueued += 1
+        writer.update_score(self.user_id, 7)  # Sau khi về 0 (MAX(score + ?, 0)) -> 7
+        writer.record_login(self.user_id, '2024-01-02 03:04:05')
+        self.assertTrue(writer.flush(5))
+        writer.close()
+
+        self.assertEqual(self.score(), 7)
+        row = self.db.connection.execute("SELECT last_login FROM users WHERE id = ?", (self.user_id,)).fetchone()
+        self.assertEqual(row['last_login'], '2024-01-02 03:04:05')
+        stats = writer.stats()
+        self.assertEqual(stats['written'], 52)
+        self.assertLessEqual(stats['batches'], 2)
+
+    def test_close_drains_queue(self):
+        writer = WriteBehindQueue(self.db)
+        for _ in range(200):
+            writer.update_score(self.user_id, 1)
+        writer.close()
+        self.assertEqual(self.score(), 1200)
+        self.assertFalse(writer.update_score(self.user_id, 1))  # Đã tắt
+
+    def test_stalled_writer_never_blocks_or_loses_results(self):
+        """Disk kẹt: producer không chờ, điểm vẫn được xếp hàng (chỉ bỏ last_login),
+        shutdown không đóng database dưới writer"""
+        release = threading.Event()
+        apply_writes = self.db.apply_writes
+        self.db.apply_writes = lambda batch: release.wait(5) and apply_writes(batch)
+        writer = WriteBehindQueue(self.db, max_pending=1)
+        writer.update_score(self.user_id, 1)  # Writer kẹt với lô này
+        while writer.stats()['pending']:
+            time.sleep(0.01)
+        start = time.perf_counter()
+        for _ in range(3):
+            self.assertTrue(writer.update_score(self.user_id, 1))
+        self.assertFalse(writer.record_login(self.user_id))  # Hàng đợi đầy: bỏ timestamp
+        self.assertLess(time.perf_counter() - start, 0.5)
+        stats = writer.stats()
+        self.assertEqual((stats['spilled'], stats['dropped'], stats['max_depth']), (2, 1, 3))
+
+        self.assertFalse(writer.shutdown(timeout=0.05))
+        self.assertEqual(self.score(), 1000)  # Database vẫn mở
+        release.set()
+        self.assertTrue(writer.close())
+        self.assertEqual(self.score(), 1004)
+
+    def test_failed_batch_keeps_good_writes(self):
+        writer = WriteBehindQueue(self.db)
+        with writer.cond:
+            writer.pending.append(('score', (5, self.user_id)))
+            writer.pending.append(('bogus', ()))
+            writer.enqueued += 2
+            writer.cond.notify_all()
+        writer.close()
+        self.assertEqual(self.score(), 1005)
+        self.assertEqual(writer.stats()['failed'], 1)
+
+    def test_saved_game_keeps_real_clock(self):
+        """Thời lượng + giờ từng nước lấy từ đồng hồ ván, không ngẫu nhiên"""
+        opponent_id = self.db.get_user_by_username('player2')['id']
+        started = 1700000000
+        moves = [{'player_id': (self.user_id, opponent_id)[i % 2], 'x': i, 'y': 0, 'time': started + 2 * i}
+                 for i in range(120)]
+        writer = WriteBehindQueue(self.db)
+        writer.save_game(player1_id=self.user_id, player2_id=opponent_id, moves_data=moves,
+                         winner_id=None, started_at=started, ended_at=started + 300, draw_points=0)
+        writer.close()
+
+        with self.db.reader() as connection:
+            game = connection.execute('SELECT id, game_duration, start_time, total_moves FROM games').fetchone()
+        self.assertEqual(tuple(game)[1:], (300, '2023-11-14 22:13:20', 120))
+        self.assertEqual(self.db.get_game_moves(game[0]), moves)
+        self.assertEqual(self.score(), 1000)
+
+
+class TestConnectionPool(unittest.TestCase):
+    """Pool đọc + một writer: đọc song song, ghi lỗi thì rollback"""
+
+    def setUp(self):
+        self.temp_db = tempfile.NamedTemporaryFile(delete=False, suffix='.db')
+        self.db_path = self.temp_db.name
+        self.temp_db.close()
+        self.db = CaroDatabase(self.db_path, read_connections=3)
+
+    def tearDown(self):
+        self.db.close()
+        if os.path.exists(self.db_path):
+            try:
+                os.unlink(self.db_path)
+            except:
+                pass
+
+    def test_wal_and_pragmas(self):
+        self.assertEqual(self.db.connection.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+        with self.db.reader() as connection:
+            self.assertEqual(connection.execute('PRAGMA synchronous').fetchone()[0], 1)  # NORMAL
+            self.assertEqual(connection.execute('PRAGMA query_only').fetchone()[0], 1)
+
+    def test_concurrent_logins_and_writes(self):
+        errors = []
+
+        def login(i):
+            try:
+                for _ in range(50):
+                    success, user = self.db.authenticate_user('alice', 'password', record_login=False)
+                    self.assertTrue(success)
+                    self.db.update_user_score(user['id'], 1)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=login, args=(i,)) for i in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(30)
+        self.assertEqual(errors, [])
+        self.assertEqual(self.db.get_user_by_username('alice')['score'], 1000 + 16 * 50)
+        self.assertLessEqual(self.db.readers_open, 3)
+
+    def test_failed_write_rolls_back(self):
+        user_id = self.db.get_user_by_username('bob')['id']
+        with self.assertRaises(ValueError):
+            self.db.apply_writes([('score', (50, user_id)), ('bogus', ())])
+        self.assertEqual(self.db.get_user_info(user_id)['score'], 1000)
+
+    def test_failed_open_frees_pool_slot(self):
+        """Mở kết nối đọc lỗi không được giữ chỗ trong pool (nếu không reader sau chờ mãi)"""
+        real_open = self.db.open_connection
+
+        def broken_open(read_only=False):
+            raise sqlite3.OperationalError("unable to open database file")
+
+        self.db.open_connection = broken_open
+        for _ in range(5):  # Nhiều hơn read_connections
+            with self.assertRaises(sqlite3.OperationalError):
+                with self.db.reader():
+                    pass
+        self.assertEqual(self.db.readers_open, 0)
+        self.db.open_connection = real_open
+        self.assertEqual(self.db.get_user_by_username('bob')['username'], 'bob')
+
+
+class TestPackedMoves(unittest.TestCase):
+    """Nước đi nén trong games.move_data + công cụ chuyển từ bảng moves"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.temp_dir.name, 'archive.db')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def game(self, index, player1_id=1, player2_id=2, count=60):
+        started = 1700000000 + index * 3600
+        moves = [{'player_id': (player1_id, player2_id)[i % 2], 'x': (i * 7) % 50, 'y': (i * 3) % 50,
+                  'time': started + 2.5 * i + (i % 3) * 0.3} for i in range(count)]
+        return {'player1_id': player1_id, 'player2_id': player2_id, 'moves_data': moves,
+                'winner_id': player1_id, 'board_size': 50, 'started_at': started, 'ended_at': started + 200}
+
+    def test_round_trip(self):
+        game = self.game(0)
+        data = encode_moves(game['moves_data'], 1, 2, game['started_at'])
+        self.assertLess(len(data), 4 * 60)  # 2 byte tọa độ + 1 byte thời gian / nước (+ header)
+        self.assertEqual(decode_moves(data, 1, 2, game['started_at']), game['moves_data'])
+        with self.assertRaises(ValueError):
+            encode_moves([{'player_id': 3, 'x': 0, 'y': 0}], 1, 2, 0)
+
+    def test_migration_shrinks_archive(self):
+        db = CaroDatabase(self.db_path, packed_moves=False)
+        player1_id = db.get_user_by_username('player1')['id']
+        player2_id = db.get_user_by_username('player2')['id']
+        db.apply_writes([('game', self.game(i, player1_id, player2_id)) for i in range(500)])
+        before = db.get_game_moves(42)
+        db.close()
+
+        packed, skipped, size_before, size_after = migrate(self.db_path)
+        with self.assertRaises(FileNotFoundError):
+            migrate(self.db_path + '.missing')
+        self.assertFalse(os.path.exists(self.db_path + '.missing'))
+        self.assertEqual((packed, skipped), (500, 0))
+        self.assertLess(size_after * 8, size_before)
+
+        db = CaroDatabase(self.db_path)
+        try:
+            self.assertEqual(db.get_game_moves(42), before)
+            self.assertEqual(db.connection.execute('SELECT COUNT(*) FROM moves').fetchone()[0], 0)
+        finally:
+            db.close()
+
+
+class TestLeaderboard(unittest.TestCase):
+    """Top-N trong bộ nhớ luôn khớp với ORDER BY trên database"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.temp_dir.name, 'leaderboard.db')
+        self.db = CaroDatabase(self.db_path, leaderboard_size=8)  # Nhỏ: hay bị đẩy ra / nạp lại
+        self.user_ids = [self.db.register_user(f"user{i}", 'pass')[1]['user_id'] for i in range(30)]
+
+    def tearDown(self):
+        self.db.close()
+        self.temp_dir.cleanup()
+
+    def expected(self, key, limit):
+        with self.db.reader() as connection:
+            rows = self.db._leaderboard_query(connection, key, limit)
+        return [{k: v for k, v in row.items() if k != 'id'} for row in rows]
+
+    def test_cache_follows_every_write(self):
+        rng = random.Random(7)
+        writer = WriteBehindQueue(self.db)
+        for step in range(300):
+            player1_id, player2_id = rng.sample(self.user_ids, 2)
+            action = rng.randrange(4)
+            if action == 0:
+                self.db.update_user_score(player1_id, rng.randint(-60, 60))
+            elif action == 1:
+                writer.update_score(player1_id, rng.randint(-60, 60))
+                writer.flush()
+            elif action == 2:
+                self.db.save_game(player1_id, player2_id, [], winner_id=rng.choice((player1_id, None)))
+            else:
+                self.user_ids.append(self.db.register_user(f"new{step}", 'pass')[1]['user_id'])
+            for key in ('score', 'wins', 'win_streak', 'total_games'):
+                limit = rng.randint(1, 8)
+                self.assertEqual(self.db.get_leaderboard(limit, key), self.expected(key, limit), (step, key))
+        writer.close()
+        stats = self.db.leaderboard.stats()
+        self.assertGreater(stats['hits'], stats['misses'] * 5)
+        self.assertLessEqual(stats['rows'], 8 * 4)
+
+    def test_ranks_follow_score_changes(self):
+        rng = random.Random(11)
+        self.assertEqual(self.db.rank_of(self.user_ids[0]), 1 + 6)  # 6 user mặc định, cùng 1000 điểm, id nhỏ hơn
+        for step in range(200):
+            player1_id, player2_id = rng.sample(self.user_ids, 2)
+            if step % 3:
+                self.db.update_user_score(player1_id, rng.choice((-300, -20, 20, 300, 5000)))
+            else:
+                self.db.save_game(player1_id, player2_id, [], winner_id=player1_id)
+            if step % 50 == 0:
+                self.user_ids.append(self.db.register_user(f"new{step}", 'pass')[1]['user_id'])
+
+        order = self.expected('score', 1000)
+        names = {self.db.get_user_info(user_id)['username']: user_id for user_id in self.user_ids}
+        for rank, row in enumerate(order, 1):
+            if row['username'] in names:
+                self.assertEqual(self.db.rank_of(names[row['username']]), rank)
+        middle = names[order[10]['username']]
+        around = self.db.users_around(middle, 3)
+        self.assertEqual([row['rank'] for row in around], list(range(8, 15)))
+        self.assertEqual([row['username'] for row in around], [row['username'] for row in order[7:14]])
+        self.assertEqual([row['rank'] for row in self.db.users_around(names[order[0]['username']], 2)], [1, 2, 3])
+        self.assertIsNone(self.db.rank_of(10 ** 6))
+
+    def test_rank_index_with_shared_score(self):
+        """Phần lớn user cùng điểm mặc định: bucket lớn chia khối, thứ hạng vẫn đúng"""
+        rng = random.Random(5)
+        scores = {user_id: 1000 for user_id in range(1, 3 * RANK_BLOCK)}
+        ranks = RankIndex()
+        ranks.load(scores.items())
+        self.assertIsNotNone(ranks.buckets[1000].blocks)
+        for step in range(3000):
+            user_id = rng.randrange(1, 4 * RANK_BLOCK)  # Có cả user mới
+            scores[user_id] = rng.choice((1000, 1000, 1010, 990, rng.randrange(2000)))
+            ranks.update(user_id, scores[user_id])
+        order = sorted(scores, key=lambda user_id: (-scores[user_id], user_id))
+        for rank, user_id in enumerate(order, 1):
+            self.assertEqual(ranks.rank_of(user_id), rank)
+        middle = ranks.rank_of(order[len(order) // 2])
+        self.assertEqual(ranks.around(order[len(order) // 2], 3),
+                         [(rank, order[rank - 1]) for rank in range(middle - 3, middle + 4)])
+
+        bucket = ScoreBucket(range(RANK_BLOCK + 1))
+        for user_id in range(RANK_BLOCK - 10):
+            bucket.remove(user_id)
+        self.assertIsNone(bucket.blocks)  # Nhỏ lại -> về một mảng
+        self.assertEqual([bucket.at(i) for i in range(len(bucket))], list(range(RANK_BLOCK - 10, RANK_BLOCK + 1)))
+
+    def test_indexes_serve_sort_keys(self):
+        for key in ('score', 'wins', 'win_streak', 'total_games'):
+            self.assertEqual(self.db.get_leaderboard(20, key), self.expected(key, 20))  # Lớn hơn cache
+            with self.db.reader() as connection:
+                plan = ' '.join(row[3] for row in connection.execute(
+                    f"EXPLAIN QUERY PLAN SELECT id FROM users ORDER BY {key} DESC, id LIMIT 10"))
+            self.assertIn(f"idx_users_{key}", plan)
+            self.assertNotIn("TEMP B-TREE", plan)
+
+
+class TestUserStats(unittest.TestCase):
+    """get_user_stats: không JOIN ... OR, chi phí không tăng theo số ván"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db = CaroDatabase(os.path.join(self.temp_dir.name, 'stats.db'))
+        self.ids = [self.db.get_user_by_username(name)['id'] for name in ('player1', 'player2', 'alice')]
+
+    def tearDown(self):
+        self.db.close()
+        self.temp_dir.cleanup()
+
+    def plan(self, sql, params):
+        with self.db.reader() as connection:
+            return [row[3] for row in connection.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+
+    def test_query_plans_use_indexes(self):
+        stats_plan = self.plan(USER_STATS_SQL, (1,))
+        self.assertFalse([step for step in stats_plan if 'games' in step or step.startswith('SCAN')], stats_plan)
+
+        recent_plan = self.plan(RECENT_GAMES_SQL, {'user_id': 1, 'limit': 5})
+        self.assertIn('SEARCH games USING COVERING INDEX idx_games_player1_end (player1_id=?)', recent_plan)
+        self.assertIn('SEARCH games USING COVERING INDEX idx_games_player2_end (player2_id=?)', recent_plan)
+        self.assertFalse([step for step in recent_plan if step.startswith('SCAN g')], recent_plan)
+        # Chỉ sắp xếp lại <= 2 * limit dòng đã gộp, không sắp xếp các ván của user
+        self.assertEqual(recent_plan.count('USE TEMP B-TREE FOR ORDER BY'), 1)
+
+    def test_stats_match_games(self):
+        player1_id, _, alice_id = self.ids
+        rng = random.Random(5)
+        games = []
+        for i in range(300):
+            first, second = rng.sample(self.ids, 2)
+            duration = rng.randint(30, 900)
+            games.append(('game', {'player1_id': first, 'player2_id': second, 'moves_data': [],
+                                   'winner_id': rng.choice((first, second, None)),
+                                   'started_at': 1700000000 + 1000 * i, 'ended_at': 1700000000 + 1000 * i + duration}))
+        self.db.apply_writes(games)
+        self.db.add_friend_request(player1_id, alice_id)
+        with self.db.writer() as connection:
+            connection.execute("UPDATE friends SET status = 'accepted'")
+
+        stats = self.db.get_user_stats(player1_id)
+        with self.db.reader() as connection:
+            average, newest = connection.execute('''
+            SELECT AVG(game_duration), GROUP_CONCAT(id) FROM (
+                SELECT id, game_duration FROM games WHERE player1_id = ? OR player2_id = ?
+                ORDER BY end_time DESC, id DESC)
+            ''', (player1_id, player1_id)).fetchone()
+        self.assertAlmostEqual(stats['avg_game_duration'], average)
+        self.assertEqual([game['id'] for game in stats['recent_games']], [int(i) for i in newest.split(',')[:5]])
+        self.assertEqual(stats['friends_count'], 1)
+
+
 def run_database_tests():
     """Run database tests"""
     print("="*60)
@@ -176,6 +551,11 @@ def run_database_tests():
     suite = unittest.TestSuite()
     suite.addTests(loader.loadTestsFromTestCase(TestDatabaseIntegration))
     suite.addTests(loader.loadTestsFromTestCase(TestDatabaseBasic))
+    suite.addTests(loader.loadTestsFromTestCase(TestWriteBehind))
+    suite.addTests(loader.loadTestsFromTestCase(TestConnectionPool))
+    suite.addTests(loader.loadTestsFromTestCase(TestPackedMoves))
+    suite.addTests(loader.loadTestsFromTestCase(TestLeaderboard))
+    suite.addTests(loader.loadTestsFromTestCase(TestUserStats))
 
     runner = unittest.TextTestRunner(verbosity=2)
     result = runner.run(suite)
@@ -111,6 +111,43 @@ class TestCaroGame(unittest.TestCase):
         self.assertTrue(success)
         self.assertEqual(self.board.current_player, 1)
 
+    def test_empty_cell_tracking(self):
+        """Số ô trống và tập nước đi hợp lệ cập nhật theo từng nước"""
+        self.assertEqual(self.board.empty_count, 225)
+        self.board.make_move(7, 7, 1)
+        self.board.make_move(0, 0, 2)
+        self.board.make_move(20, 20, 1)  # Không hợp lệ, không đổi gì
+        self.assertEqual(self.board.empty_count, 223)
+        self.assertNotIn((7, 7), self.board.legal_moves)
+        legal = self.board.get_legal_moves()
+        self.assertEqual(legal, [(x, y) for y in range(15) for x in range(15) if self.board.board[y][x] == 0])
+
+        self.board.reset()
+        self.assertEqual(len(self.board.get_legal_moves()), 225)
+
+    def test_legal_moves_built_on_first_use(self):
+        """Bàn cờ của phòng không giữ size * size ô trống nếu không ai hỏi"""
+        self.board.make_move(7, 7, 1)
+        self.assertIsNone(self.board._legal_moves)
+        self.assertEqual(len(self.board.legal_moves), 224)
+        self.board.make_move(0, 0, 2)
+        self.assertNotIn((0, 0), self.board.legal_moves)
+        self.assertEqual(len(self.board.get_legal_moves()), 223)
+
+    def test_iter_legal_moves_by_proximity(self):
+        self.board.make_move(7, 7, 1)
+        nearby = []
+        for move in self.board.iter_legal_moves(center=(7, 7)):
+            nearby.append(move)
+            if len(nearby) == 8:
+                break
+        self.assertEqual(sorted(nearby), sorted((7 + dx, 7 + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy))
+
+        # Từ góc vẫn đi hết bàn cờ, không lặp, không ra ngoài
+        corner = list(self.board.iter_legal_moves(center=(0, 0)))
+        self.assertEqual(sorted(corner), sorted(self.board.get_legal_moves()))
+        self.assertEqual(list(self.board.iter_legal_moves()), self.board.get_legal_moves())
+
 def run_tests():
     """Run all tests"""
     suite = unittest.TestLoader().loadTestsFromTestCase(TestCaroGame)
@@ -0,0 +1,558 @@
+# tests/test_lobby.py - TESTS CHO SẢNH CHỜ (broadcast danh sách phòng / người chơi)
+import unittest
+import tempfile
+import threading
+import time
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.main import CaroServer
+from server.pubsub import room_topic
+from shared.protocol import MessageDecoder, FRAMING_LENGTH
+
+
+class FakeConnection:
+    """Thay cho socket thật: ghi lại bytes được gửi"""
+    def __init__(self):
+        self.sent = []
+        self.closed = False
+
+    def send(self, data):
+        self.sent.append(data)
+        return True
+
+    def close(self):
+        self.closed = True
+
+    def messages(self, msg_type=None):
+        decoder = MessageDecoder()
+        decoder.feed(b''.join(self.sent))
+        return [m for m in decoder if msg_type is None or m.get('type') == msg_type]
+
+
+class LobbyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_db = tempfile.NamedTemporaryFile(delete=False, suffix='.db')
+        self.db_path = self.temp_db.name
+        self.temp_db.close()
+        # interval = 0: broadcast đồng bộ, test kiểm tra kết quả ngay sau process_message
+        self.server = CaroServer(db_path=self.db_path, lobby_broadcast_interval=self.broadcast_interval,
+                                 **self.server_options)
+        self.connections = {}
+
+    broadcast_interval = 0
+    server_options = {}
+
+    def tearDown(self):
+        self.server.lobby_broadcaster.stop()
+        self.server.scheduler.stop()
+        self.server.db_writer.shutdown()
+        if os.path.exists(self.db_path):
+            try:
+                os.unlink(self.db_path)
+            except:
+                pass
+
+    def connect(self, client_id, username=None):
+        conn = FakeConnection()
+        self.connections[client_id] = conn
+        self.server.user_manager.add_client(client_id, conn)
+        if username:
+            self.server.process_message(client_id, {'type': 'LOGIN', 'username': username, 'password': '123' if username.startswith('player') else 'password'})
+        return conn
+
+
+class TestBroadcast(LobbyTestCase):
+    def test_room_list_encoded_once(self):
+        """Cùng một bytes object được ghi cho mọi client ở sảnh"""
+        for cid, name in enumerate(['player1', 'player2', 'alice', 'bob'], start=1):
+            self.connect(cid, name)
+        self.server.user_manager.get_client(4).framing = FRAMING_LENGTH
+        for conn in self.connections.values():
+            conn.sent.clear()
+
+        self.server.room_manager.broadcast_room_list(self.server)
+
+        json_payloads = [self.connections[cid].sent[-1] for cid in (1, 2, 3)]
+        self.assertTrue(all(p is json_payloads[0] for p in json_payloads))
+        self.assertEqual(self.connections[4].messages('ROOM_LIST'), self.connections[1].messages('ROOM_LIST'))
+
+    def test_room_list_skips_players_in_rooms(self):
+        self.connect(1, 'player1')
+        self.connect(2, 'player2')
+        self.server.process_message(1, {'type': 'CREATE_ROOM'})
+        for conn in self.connections.values():
+            conn.sent.clear()
+
+        self.server.room_manager.broadcast_room_list(self.server)
+        self.assertEqual(self.connections[1].messages('ROOM_LIST'), [])
+        rooms = self.connections[2].messages('ROOM_LIST')[0]['rooms']
+        self.assertEqual([r['count'] for r in rooms], [1])
+
+
+class TestLobbyDeltas(LobbyTestCase):
+    def connect_delta(self, client_id, username):
+        conn = self.connect(client_id)
+        self.server.process_message(client_id, {'type': 'HELLO', 'framing': FRAMING_LENGTH, 'features': ['lobby_deltas']})
+        self.server.process_message(client_id, {'type': 'LOGIN', 'username': username, 'password': '123' if username.startswith('player') else 'password'})
+        return conn
+
+    def replay(self, conn):
+        """Dựng lại sảnh chờ từ snapshot + delta giống client"""
+        players, rooms, version = {}, {}, -1
+        for message in conn.messages():
+            if message['type'] == 'LOBBY_SNAPSHOT':
+                players = {p['user_id']: p for p in message['players']}
+                rooms = {r['id']: r for r in message['rooms']}
+                version = message['version']
+            elif message['type'] == 'LOBBY_DELTA' and message['version'] > version:
+                self.assertEqual(message['base_version'], version)
+                for event in message['events']:
+                    if event['type'] in ('PLAYER_JOINED', 'PLAYER_UPDATED'):
+                        players[event['player']['user_id']] = event['player']
+                    elif event['type'] == 'PLAYER_LEFT':
+                        del players[event['user_id']]
+                    elif event['type'] in ('ROOM_ADDED', 'ROOM_CHANGED'):
+                        rooms[event['room']['id']] = event['room']
+                    elif event['type'] == 'ROOM_REMOVED':
+                        del rooms[event['id']]
+                version = message['version']
+        return players, rooms, version
+
+    def test_deltas_follow_churn(self):
+        watcher = self.connect_delta(1, 'player1')
+        legacy = self.connect(2, 'player2')
+        self.assertEqual(len(watcher.messages('LOBBY_SNAPSHOT')), 1)
+        self.assertEqual(watcher.messages('ONLINE_PLAYERS'), [])
+
+        self.connect(3, 'alice')
+        self.server.process_message(2, {'type': 'CREATE_ROOM'})
+        self.server.process_message(3, {'type': 'JOIN_ROOM', 'room_id': 'room_1'})
+        self.server.process_message(3, {'type': 'LEAVE_ROOM', 'room_id': 'room_1'})
+        self.server.process_message(2, {'type': 'LEAVE_ROOM', 'room_id': 'room_1'})
+        self.server.disconnect_client(3)
+
+        players, rooms, version = self.replay(watcher)
+        self.assertEqual(version, self.server.lobby.version)
+        self.assertEqual(sorted(p['username'] for p in players.values()), ['player1', 'player2'])
+        self.assertEqual(rooms, {})
+
+        event_types = [e['type'] for m in watcher.messages('LOBBY_DELTA') for e in m['events']]
+        for expected in ('PLAYER_JOINED', 'PLAYER_LEFT', 'ROOM_ADDED', 'ROOM_CHANGED', 'ROOM_REMOVED'):
+            self.assertIn(expected, event_types)
+
+        # Client cũ vẫn nhận danh sách đầy đủ
+        self.assertTrue(legacy.messages('ONLINE_PLAYERS'))
+
+    def test_registered_client_gets_deltas(self):
+        """Đăng ký (tự đăng nhập) cũng phải nghe LOBBY_TOPIC như LOGIN"""
+        newcomer = self.connect(1)
+        self.server.process_message(1, {'type': 'HELLO', 'framing': FRAMING_LENGTH, 'features': ['lobby_deltas']})
+        self.server.process_message(1, {'type': 'REGISTER', 'username': 'newcomer', 'password': 'pw',
+                                        'display_name': 'Newcomer'})
+        self.assertEqual(len(newcomer.messages('LOBBY_SNAPSHOT')), 1)
+
+        self.connect(2, 'player2')
+        self.server.process_message(2, {'type': 'CREATE_ROOM'})
+        players, rooms, _ = self.replay(newcomer)
+        self.assertIn('player2', [p['username'] for p in players.values()])
+        self.assertIn('room_1', rooms)
+
+    def test_snapshot_only_when_stale(self):
+        watcher = self.connect_delta(1, 'player1')
+        version = self.server.lobby.version
+        watcher.sent.clear()
+
+        self.server.process_message(1, {'type': 'GET_LOBBY_SNAPSHOT', 'version': version})
+        reply = watcher.messages()[-1]
+        self.assertEqual(reply['type'], 'LOBBY_DELTA')
+        self.assertEqual(reply['events'], [])
+
+        self.server.process_message(1, {'type': 'GET_LOBBY_SNAPSHOT', 'version': version - 1})
+        self.assertEqual(watcher.messages()[-1]['type'], 'LOBBY_SNAPSHOT')
+
+
+class TestBoardConfig(LobbyTestCase):
+    def test_large_board_end_to_end(self):
+        """Phòng 30x30 luật 6 quân: kích thước đi kèm message, nước đi ngoài 15x15 hợp lệ"""
+        scores = [self.server.db.get_user_by_username(name)['score'] for name in ('player1', 'player2')]
+        p1 = self.connect(1, 'player1')
+        p2 = self.connect(2, 'player2')
+        self.server.process_message(1, {'type': 'CREATE_ROOM', 'board_size': 30, 'win_length': 6})
+        self.assertEqual(p1.messages('ROOM_CREATED')[-1]['board_size'], 30)
+        self.assertEqual(p2.messages('ROOM_LIST')[-1]['rooms'][0]['win_length'], 6)
+
+        self.server.process_message(2, {'type': 'JOIN_ROOM', 'room_id': 'room_1'})
+        joined = p2.messages('ROOM_JOINED')[-1]
+        self.assertEqual((joined['board_size'], joined['win_length']), (30, 6))
+
+        for i in range(5):
+            self.server.process_message(1, {'type': 'MOVE', 'x': 20 + i, 'y': 29})
+            self.server.process_message(2, {'type': 'MOVE', 'x': 20 + i, 'y': 0})
+        self.assertEqual(p1.messages('GAME_OVER'), [])  # 5 quân chưa đủ
+        self.server.process_message(1, {'type': 'MOVE', 'x': 25, 'y': 29})
+        self.assertEqual(len(p1.messages('GAME_OVER')), 1)
+
+        # Khán giả nhận đúng các quân đã đánh
+        self.connect(3, 'alice')
+        self.server.process_message(3, {'type': 'VIEW_MATCH', 'room_id': 'room_1'})
+        moves = self.connections[3].messages('BOARD_STATE')[-1]['moves']
+        self.assertEqual(len(moves), 11)
+        self.assertIn({'x': 25, 'y': 29, 'val': 'X'}, moves)
+
+        # Ván được lưu (qua db_writer): đủ 11 nước, X thắng, điểm +10 / -5
+        self.server.db_writer.flush(2)
+        db = self.server.db
+        user1, user2 = db.get_user_by_username('player1'), db.get_user_by_username('player2')
+        with db.reader() as connection:
+            game = connection.execute('SELECT id, winner_id, board_size, total_moves FROM games').fetchone()
+        self.assertEqual(tuple(game)[1:], (user1['id'], 30, 11))
+        last_move = db.get_game_moves(game[0])[-1]
+        self.assertEqual((last_move['player_id'], last_move['x'], last_move['y']), (user1['id'], 25, 29))
+        self.assertEqual((user1['score'], user2['score']), (scores[0] + 10, max(scores[1] - 5, 0)))
+
+    def test_turn_timeout_fires_from_scheduler(self):
+        """Hết giờ lượt đi -> đối thủ thắng, không cần vòng quét phòng"""
+        p1 = self.connect(1, 'player1')
+        self.connect(2, 'player2')
+        self.server.process_message(1, {'type': 'CREATE_ROOM'})
+        self.server.process_message(2, {'type': 'JOIN_ROOM', 'room_id': 'room_1'})
+        room = self.server.rooms['room_1']
+        self.server.room_manager.set_turn_deadline(room, time.time() + 0.05)
+
+        deadline = time.time() + 2
+        while not p1.messages('GAME_OVER') and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(room.status, 'finished')
+        self.assertEqual(p1.messages('GAME_OVER')[-1]['winner'], 'player2')  # X hết giờ
+
+    def test_invalid_board_rejected(self):
+        p1 = self.connect(1, 'player1')
+        for config in ({'board_size': 100}, {'board_size': 10, 'win_length': 11}, {'board_size': '15'}):
+            self.server.process_message(1, {'type': 'CREATE_ROOM', **config})
+        self.assertEqual(len(p1.messages('ERROR')), 3)
+        self.assertEqual(self.server.rooms, {})
+
+
+class TestReconnectGrace(LobbyTestCase):
+    server_options = {'reconnect_grace_seconds': 0.1, 'max_grace_sessions': 1}
+
+    def start_game(self, first, second, room_id):
+        self.server.process_message(first, {'type': 'CREATE_ROOM'})
+        self.server.process_message(second, {'type': 'JOIN_ROOM', 'room_id': room_id})
+
+    def wait_for(self, condition, timeout=2):
+        deadline = time.time() + timeout
+        while not condition() and time.time() < deadline:
+            time.sleep(0.01)
+        return condition()
+
+    def test_resume_cancels_expiry(self):
+        self.server.reconnect_grace.grace_seconds = 5
+        self.connect(1, 'player1')
+        self.connect(2, 'player2')
+        self.start_game(1, 2, 'room_1')
+
+        self.server.disconnect_client(1)
+        self.assertTrue(self.server.rooms['room_1'].is_frozen)
+        new_conn = self.connect(3, 'player1')
+
+        self.assertEqual(new_conn.messages('RESUME_GAME')[-1]['room_id'], 'room_1')
+        self.assertEqual(self.server.rooms['room_1'].players, [3, 2])
+        stats = self.server.reconnect_grace.stats()
+        self.assertEqual((stats['active'], stats['resumed'], stats['expired']), (0, 1, 0))
+        self.assertIsNone(self.server.scheduler.deadline(('grace', self.server.clients[3].user_id)))
+
+    def test_expired_session_leaves_room(self):
+        self.connect(1, 'player1')
+        p2 = self.connect(2, 'player2')
+        self.start_game(1, 2, 'room_1')
+
+        self.server.disconnect_client(1)
+        self.assertTrue(self.wait_for(lambda: p2.messages('OPPONENT_LEFT')))
+        self.assertEqual(self.server.rooms['room_1'].players, [2])
+        self.assertEqual(self.server.reconnect_grace.stats()['expired'], 1)
+
+    def test_table_is_bounded(self):
+        self.server.reconnect_grace.grace_seconds = 5
+        for cid, name in enumerate(['player1', 'player2', 'alice', 'bob'], start=1):
+            self.connect(cid, name)
+        self.start_game(1, 2, 'room_1')
+        self.start_game(3, 4, 'room_2')
+
+        self.server.disconnect_client(1)
+        self.server.disconnect_client(3)  # Bảng đầy -> phiên của player1 hết hạn ngay
+        stats = self.server.reconnect_grace.stats()
+        self.assertEqual((stats['active'], stats['evicted']), (1, 1))
+        self.assertTrue(self.connections[2].messages('OPPONENT_LEFT'))
+        self.assertFalse(self.connections[4].messages('OPPONENT_LEFT'))
+
+    def test_stale_expiry_ignores_newer_session(self):
+        grace = self.server.reconnect_grace
+        grace.grace_seconds = 5
+        expired = []
+        first = grace.hold(7, {'room_id': 'room_9'}, 1, expired.append)
+        grace.resume(7)
+        grace.hold(7, {'room_id': 'room_9'}, 2, expired.append)
+        grace._expire(7, first)  # Hạn của phiên cũ tới muộn
+        self.assertEqual(expired, [])
+        self.assertTrue(grace.has_session(7))
+
+
+class TestBroadcastCoalescing(LobbyTestCase):
+    broadcast_interval = 0.2
+
+    def test_churn_is_coalesced(self):
+        """Nhiều lượt tạo/rời phòng trong một interval chỉ tạo ra ít lần broadcast"""
+        watcher = self.connect(1, 'player1')
+        self.connect(2, 'player2')
+        time.sleep(0.3)
+        watcher.sent.clear()
+        flushes = self.server.lobby_broadcaster.stats()['flushes']
+
+        for _ in range(20):
+            self.server.process_message(2, {'type': 'CREATE_ROOM'})
+            room_id = self.server.user_manager.get_client(2).room_id
+            self.server.process_message(2, {'type': 'LEAVE_ROOM', 'room_id': room_id})
+
+        deadline = time.time() + 2
+        while not watcher.messages('ROOM_LIST') and time.time() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.5)
+
+        stats = self.server.lobby_broadcaster.stats()
+        self.assertLessEqual(stats['flushes'] - flushes, 3)
+        self.assertLessEqual(len(watcher.messages('ROOM_LIST')), 3)
+        # Lần gửi cuối phản ánh trạng thái cuối cùng: không còn phòng nào
+        self.assertEqual(watcher.messages('ROOM_LIST')[-1]['rooms'], [])
+
+
+class TestRoomLocking(LobbyTestCase):
+    USERS = ['player1', 'player2', 'alice', 'bob', 'charlie', 'diana']
+    server_options = {'matchmaking_tick': None}  # QUICK_MATCH vào phòng chờ (không qua hàng đợi)
+
+    def run_threads(self, target, count):
+        errors = []
+
+        def worker(i):
+            try:
+                target(i)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(10)
+        self.assertFalse(any(t.is_alive() for t in threads), "deadlock")
+        self.assertEqual(errors, [])
+
+    def test_join_missing_room_does_not_deadlock(self):
+        """Trước đây send_room_list chạy khi đang giữ RoomManager.lock -> treo"""
+        p1 = self.connect(1, 'player1')
+        self.run_threads(lambda i: self.server.process_message(1, {'type': 'JOIN_ROOM', 'room_id': 'room_9'}), 1)
+        self.assertEqual(len(p1.messages('ERROR')), 1)
+        self.assertEqual(p1.messages('ROOM_LIST')[-1]['rooms'], [])
+
+    def test_room_list_follows_status(self):
+        self.connect(1, 'player1')
+        self.connect(2, 'player2')
+        self.server.process_message(1, {'type': 'CREATE_ROOM'})
+        self.assertEqual(self.server.room_manager.get_room_list(self.server)[0]['status'], 'waiting')
+        self.server.process_message(2, {'type': 'JOIN_ROOM', 'room_id': 'room_1'})
+        summary = self.server.room_manager.get_room_list(self.server)[0]
+        self.assertEqual((summary['status'], summary['players']), ('playing', ['player1', 'player2']))
+
+        self.server.process_message(2, {'type': 'SURRENDER'})
+        self.server.process_message(2, {'type': 'SURRENDER'})  # Ván đã xong: không tính điểm lần nữa
+        self.assertEqual(self.server.room_manager.get_room_list(self.server)[0]['status'], 'finished')
+        self.assertEqual(len(self.connections[1].messages('GAME_OVER')), 1)
+
+        self.server.process_message(1, {'type': 'LEAVE_ROOM', 'room_id': 'room_1'})
+        self.server.process_message(2, {'type': 'LEAVE_ROOM', 'room_id': 'room_1'})
+        self.assertEqual(self.server.room_manager.get_room_list(self.server), [])
+
+    def test_moves_in_different_rooms_run_concurrently(self):
+        for cid, name in enumerate(self.USERS, start=1):
+            self.connect(cid, name)
+        for first in (1, 3, 5):
+            self.server.process_message(first, {'type': 'CREATE_ROOM'})
+            room_id = self.server.user_manager.get_client(first).room_id
+            self.server.process_message(first + 1, {'type': 'JOIN_ROOM', 'room_id': room_id})
+
+        def play(i):
+            first = 2 * i + 1
+            for x in range(4):  # 4 quân mỗi bên: không ai thắng
+                self.server.process_message(first, {'type': 'MOVE', 'x': x, 'y': 0})
+                self.server.process_message(first + 1, {'type': 'MOVE', 'x': x, 'y': 1})
+
+        self.run_threads(play, 3)
+        for room in self.server.rooms.values():
+            self.assertEqual(len(room.board.moves_history), 8)
+
+    def test_quick_match_churn_keeps_registry_consistent(self):
+        for cid, name in enumerate(self.USERS, start=1):
+            self.connect(cid, name)
+
+        def churn(i):
+            client = self.server.user_manager.get_client(i + 1)
+            for _ in range(30):
+                self.server.process_message(i + 1, {'type': 'QUICK_MATCH'})
+                self.server.process_message(i + 1, {'type': 'LEAVE_ROOM', 'room_id': client.room_id})
+
+        self.run_threads(churn, len(self.USERS))
+        self.assertEqual(self.server.rooms, {})
+        self.assertEqual(self.server.room_manager.get_room_list(self.server), [])
+        self.assertEqual(self.server.room_manager.waiting_rooms, {})
+        self.assertIsNone(self.server.scheduler.deadline(('turn', 'room_1')))
+
+
+class TestQuickMatch(LobbyTestCase):
+    server_options = {'matchmaking_tick': None}
+
+    def test_oldest_open_room_first(self):
+        for cid, name in enumerate(TestRoomLocking.USERS, start=1):
+            self.connect(cid, name)
+        rooms = self.server.room_manager
+        self.server.process_message(1, {'type': 'CREATE_ROOM'})
+        self.server.process_message(2, {'type': 'CREATE_ROOM', 'password': 'pw'})  # Không vào hàng đợi
+        self.server.process_message(3, {'type': 'CREATE_ROOM'})
+        self.assertEqual(list(rooms.waiting_rooms), ['room_1', 'room_3'])
+
+        self.server.process_message(4, {'type': 'QUICK_MATCH'})
+        self.assertEqual(self.server.rooms['room_1'].players, [1, 4])
+        self.assertEqual(list(rooms.waiting_rooms), ['room_3'])
+
+        # Chủ phòng rời -> phòng mở lại, xếp sau các phòng đang chờ
+        self.server.process_message(1, {'type': 'LEAVE_ROOM', 'room_id': 'room_1'})
+        self.assertEqual(list(rooms.waiting_rooms), ['room_3', 'room_1'])
+
+        self.server.process_message(5, {'type': 'QUICK_MATCH'})
+        self.server.process_message(6, {'type': 'QUICK_MATCH'})
+        self.assertEqual(self.server.rooms['room_3'].players, [3, 5])
+        self.assertEqual(self.server.rooms['room_1'].players, [4, 6])
+        self.assertEqual(list(rooms.waiting_rooms), [])
+
+    def test_creates_room_when_none_open(self):
+        p1 = self.connect(1, 'player1')
+        self.server.process_message(1, {'type': 'QUICK_MATCH'})
+        self.assertTrue(p1.messages('ROOM_CREATED')[-1]['is_quick_match'])
+        # Không tự vào phòng của chính mình
+        self.server.process_message(1, {'type': 'QUICK_MATCH'})
+        self.assertEqual(len(p1.messages('ROOM_CREATED')), 2)
+        self.assertEqual(self.server.rooms['room_1'].players, [1])
+
+
+class TestMatchmaking(LobbyTestCase):
+    server_options = {'matchmaking_tick': 0.02}
+
+    def test_queued_players_get_a_room(self):
+        p1 = self.connect(1, 'player1')
+        p2 = self.connect(2, 'player2')
+        self.server.process_message(1, {'type': 'QUICK_MATCH'})
+        self.server.process_message(2, {'type': 'QUICK_MATCH'})
+
+        deadline = time.time() + 2
+        while not p2.messages('ROOM_JOINED') and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(p1.messages('ROOM_CREATED')[-1]['is_quick_match'])
+        self.assertEqual(p2.messages('ROOM_JOINED')[-1]['player_symbol'], 'O')
+        self.assertEqual(self.server.rooms['room_1'].players, [1, 2])
+        self.assertEqual(self.server.matchmaking.stats()['matches'], 1)
+
+    def test_cancel_and_disconnect_leave_queue(self):
+        self.connect(1, 'player1')
+        self.connect(2, 'player2')
+        self.server.process_message(1, {'type': 'QUICK_MATCH'})
+        self.server.process_message(1, {'type': 'CANCEL_MATCH'})
+        self.server.process_message(2, {'type': 'QUICK_MATCH'})
+        self.server.disconnect_client(2)
+        self.assertNotIn(1, self.server.matchmaking)
+        self.assertNotIn(2, self.server.matchmaking)
+        self.assertEqual(self.server.matchmaking.stats()['cancelled'], 2)
+
+    def test_gone_opponent_requeues_the_other(self):
+        self.connect(1, 'player1')
+        matchmaking = self.server.matchmaking
+        ticket = matchmaking.enqueue(1, 1000, enqueued_at=time.time() - 30)
+        gone = matchmaking.enqueue(99, 1000)
+        matchmaking.cancel(1)
+        matchmaking.cancel(99)
+        self.server.room_manager.start_match(ticket, gone)  # Client 99 không tồn tại
+        self.assertEqual(self.server.rooms, {})
+        self.assertIn(1, matchmaking)
+        self.assertEqual(matchmaking.queue[1].enqueued_at, ticket.enqueued_at)
+
+    def test_unmatched_player_joins_waiting_room(self):
+        """Phòng tạo bằng CREATE_ROOM vẫn nhận người QUICK_MATCH chờ lâu, nếu chủ phòng hợp điểm"""
+        owner = self.connect(1, 'player1')
+        seeker = self.connect(2, 'player2')
+        self.server.user_manager.get_client(1).rating = 1400
+        self.server.user_manager.get_client(2).rating = 1000
+        self.server.matchmaking.fallback_after = 0
+        self.server.process_message(1, {'type': 'CREATE_ROOM'})
+        self.server.process_message(2, {'type': 'QUICK_MATCH'})
+
+        time.sleep(0.2)  # Vài tick: chủ phòng lệch 400 điểm, ngoài cửa sổ
+        self.assertEqual(seeker.messages('ROOM_JOINED'), [])
+        self.assertIn(2, self.server.matchmaking)
+
+        self.server.user_manager.get_client(1).rating = 1040
+        deadline = time.time() + 2
+        while not seeker.messages('ROOM_JOINED') and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(seeker.messages('ROOM_JOINED')[-1]['room_id'], 'room_1')
+        self.assertTrue(owner.messages('ROOM_JOINED'))
+        self.assertEqual(self.server.rooms['room_1'].players, [1, 2])
+        self.assertNotIn(2, self.server.matchmaking)
+        self.assertEqual(self.server.matchmaking.stats()['fallbacks'], 1)
+
+    def test_rating_comes_from_session(self):
+        """QUICK_MATCH không đọc database: dùng điểm lúc đăng nhập, cập nhật sau mỗi ván"""
+        self.connect(1, 'player1')
+        client = self.server.user_manager.get_client(1)
+        login_score = self.server.db.get_user_info(client.user_id)['score']
+        self.assertEqual(client.rating, login_score)
+
+        def no_db(*args):
+            raise AssertionError("database read on QUICK_MATCH")
+        self.server.db.get_user_info = no_db
+        self.server.process_message(1, {'type': 'QUICK_MATCH'})
+        self.assertEqual(self.server.matchmaking.queue[1].rating, login_score)
+
+        self.connect(2)
+        self.server.process_message(2, {'type': 'REGISTER', 'username': 'newcomer', 'password': 'pw',
+                                        'display_name': 'Newcomer'})
+        self.assertEqual(self.server.user_manager.get_client(2).rating, 1000)
+
+
+class TestRoomTopics(LobbyTestCase):
+    server_options = {'matchmaking_tick': None}
+
+    def test_spectator_follows_room_topic(self):
+        self.connect(1, 'player1')
+        player2 = self.connect(2, 'player2')
+        spectator = self.connect(3, 'alice')
+        self.server.process_message(1, {'type': 'CREATE_ROOM'})
+        room_id = self.server.user_manager.get_client(1).room_id
+        self.server.process_message(2, {'type': 'JOIN_ROOM', 'room_id': room_id})
+        self.server.process_message(3, {'type': 'VIEW_MATCH', 'room_id': room_id})
+        self.assertEqual(self.server.bus.subscribers(room_topic(room_id)), {1, 2, 3})
+
+        self.server.process_message(1, {'type': 'MOVE', 'x': 7, 'y': 7})
+        self.server.process_message(1, {'type': 'CHAT', 'message': 'hi'})
+        for conn in (player2, spectator):
+            self.assertEqual([m['x'] for m in conn.messages('OPPONENT_MOVE')], [7])
+            self.assertEqual([m['message'] for m in conn.messages('CHAT')], ['hi'])
+        self.assertEqual(self.connections[1].messages('OPPONENT_MOVE'), [])
+
+        for cid in (3, 2, 1):
+            self.server.process_message(cid, {'type': 'LEAVE_ROOM', 'room_id': room_id})
+        self.assertEqual(self.server.bus.stats()['topics'], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+# tests/test_matchmaking.py - Hàng đợi tìm trận theo điểm
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.matchmaking import MatchmakingService
+
+
+class TestMatchmaking(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.matched = []
+        self.service = MatchmakingService(on_match=lambda a, b: self.matched.append((a.player_id, b.player_id)),
+                                          base_window=50, widen_rate=25, bucket_width=25,
+                                          clock=lambda: self.now)
+
+    def enqueue_at(self, now, player_id, rating):
+        self.now = now
+        self.service.enqueue(player_id, rating)
+
+    def test_pairs_close_ratings(self):
+        for player_id, rating in ((1, 1000), (2, 1500), (3, 1020), (4, 1490)):
+            self.enqueue_at(0.0, player_id, rating)
+        self.service.tick(now=0.0)
+        self.assertEqual(self.matched, [(1, 3), (2, 4)])
+        self.assertEqual(self.service.stats(now=1.0)['queued'], 0)
+
+    def test_window_widens_with_wait(self):
+        self.enqueue_at(0.0, 1, 1000)
+        self.enqueue_at(0.0, 2, 1200)
+        self.service.tick(now=1.0)   # Cửa sổ 75
+        self.assertEqual(self.matched, [])
+        self.service.tick(now=6.0)   # Cửa sổ 200
+        self.assertEqual(self.matched, [(1, 2)])
+        stats = self.service.stats(now=6.0)
+        self.assertEqual((stats['wait_p50'], stats['rating_gap_p95']), (6.0, 200))
+
+    def test_fractional_window_is_inclusive_bound(self):
+        self.enqueue_at(0.0, 1, 1000)
+        self.enqueue_at(0.0, 2, 1051)
+        self.service.tick(now=0.02)  # Cửa sổ 50.5: lệch 51 chưa được ghép
+        self.assertEqual(self.matched, [])
+        self.service.tick(now=0.04)  # Cửa sổ 51: đúng bằng -> ghép
+        self.assertEqual(self.matched, [(1, 2)])
+
+    def test_prefers_nearest_bucket_then_oldest(self):
+        self.enqueue_at(0.0, 1, 1000)
+        self.enqueue_at(1.0, 2, 1140)  # Xa hơn
+        self.enqueue_at(2.0, 3, 1010)
+        self.enqueue_at(3.0, 4, 1005)  # Cùng bucket, vào sau 3
+        self.service.tick(now=10.0)
+        self.assertEqual(self.matched[0], (1, 3))
+
+    def test_cancel_and_requeue(self):
+        self.enqueue_at(5.0, 1, 1000)
+        self.assertTrue(self.service.cancel(1))
+        self.assertFalse(self.service.cancel(1))
+        self.enqueue_at(6.0, 2, 1000)
+        self.service.enqueue(1, 1000, enqueued_at=5.0)  # Trả về đầu hàng
+        self.assertEqual(list(self.service.queue), [1, 2])
+        self.service.enqueue(1, 2000)  # Cập nhật điểm, giữ thời gian chờ
+        self.assertEqual(self.service.queue[1].enqueued_at, 5.0)
+        self.service.tick(now=6.0)
+        self.assertEqual(self.matched, [])
+        self.assertEqual(self.service.buckets.keys(), {40, 80})
+
+    def test_unmatched_tickets_can_be_placed_elsewhere(self):
+        """on_unmatched: người chờ lâu chưa có đối thủ được rút khỏi hàng (vào phòng đang chờ)"""
+        placed = []
+        self.service.on_unmatched = lambda t, window: placed.append((t.player_id, window)) if self.service.remove(t) else None
+        self.enqueue_at(0.0, 1, 1000)
+        self.enqueue_at(0.0, 2, 1010)
+        self.enqueue_at(0.0, 3, 1500)
+        self.service.tick(now=0.0)
+        self.assertEqual(self.matched, [(1, 2)])
+        self.assertEqual(placed, [])  # Chưa chờ đủ fallback_after: hàng đợi được thử trước
+        self.service.tick(now=10.0)
+        self.assertEqual(placed, [(3, 300)])
+        self.assertNotIn(3, self.service)
+        self.assertEqual(self.service.buckets, {})
+        stale = self.service.enqueue(4, 1000)
+        self.service.cancel(4)
+        self.assertFalse(self.service.remove(stale))
+        self.assertEqual(self.service.stats()['fallbacks'], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+# tests/test_models.py - Room / ClientSession dùng __slots__
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.models import Room, ClientSession
+from shared.board import CaroBoard
+from shared.protocol import FRAMING_JSON
+
+
+class TestModels(unittest.TestCase):
+    def test_room_defaults(self):
+        room = Room('room_1', 7, CaroBoard(19, 6), password='pw', time_limit=10)
+        self.assertEqual((room.players, room.owner, room.status), ([7], 7, 'waiting'))
+        self.assertEqual((room.board_size, room.win_length), (19, 6))
+        self.assertFalse(hasattr(room, '__dict__'))
+        with self.assertRaises(AttributeError):
+            room.typo = 1  # Không có __dict__: gõ sai tên thuộc tính báo lỗi ngay
+
+    def test_session_name_fallback(self):
+        session = ClientSession(object())
+        self.assertEqual(session.framing, FRAMING_JSON)
+        self.assertIsNone(session.name)
+        session.username = 'alice'
+        self.assertEqual(session.name, 'alice')
+        session.display_name = 'Alice'
+        self.assertEqual(session.name, 'Alice')
+
+    def test_snapshot_skips_connection(self):
+        session = ClientSession(object())
+        session.room_id = 'room_3'
+        data = session.snapshot()
+        self.assertNotIn('connection', data)
+        self.assertEqual(data['room_id'], 'room_3')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+# tests/test_protocol.py - TESTS CHO ĐỊNH DẠNG GÓI TIN
+import unittest
+import json
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.protocol import (MessageDecoder, ProtocolError, InvalidMessage, encode_message,
+                             FRAMING_JSON, FRAMING_LENGTH, HEADER)
+
+
+class TestMessageDecoder(unittest.TestCase):
+    def setUp(self):
+        self.messages = [
+            {'type': 'MOVE', 'x': 7, 'y': 8},
+            {'type': 'CHAT', 'message': 'gg } {{ "nice" \\ move'},
+            {'type': 'CHAT', 'message': 'Xin chào 👋 các bạn'},
+            {'type': 'ROOM_LIST', 'rooms': [{'id': 'room_1', 'players': ['a', 'b']}]},
+        ]
+
+    def decode_all(self, data, chunk_size=None):
+        decoder = MessageDecoder()
+        result = []
+        if chunk_size is None:
+            decoder.feed(data)
+            result.extend(decoder)
+        else:
+            for i in range(0, len(data), chunk_size):
+                decoder.feed(data[i:i + chunk_size])
+                result.extend(decoder)
+        return result, decoder
+
+    def test_legacy_braces_inside_strings(self):
+        """Dấu ngoặc trong chuỗi chat không được làm lệch ranh giới message"""
+        data = b''.join(encode_message(m, FRAMING_JSON) for m in self.messages)
+        result, decoder = self.decode_all(data)
+        self.assertEqual(result, self.messages)
+        self.assertEqual(decoder.pending(), 0)
+
+    def test_byte_by_byte_chunks(self):
+        """Ký tự UTF-8 nhiều byte và escape bị cắt giữa các lần recv"""
+        for framing in (FRAMING_JSON, FRAMING_LENGTH):
+            data = b''.join(encode_message(m, framing) for m in self.messages)
+            result, _ = self.decode_all(data, chunk_size=1)
+            self.assertEqual(result, self.messages, framing)
+
+    def test_mixed_framings(self):
+        """Hai kiểu framing có thể xen kẽ trên cùng một kết nối"""
+        data = (encode_message(self.messages[0], FRAMING_JSON) +
+                encode_message(self.messages[1], FRAMING_LENGTH) +
+                b'garbage' + encode_message(self.messages[2], FRAMING_JSON) +
+                encode_message(self.messages[3], FRAMING_LENGTH))
+        result, _ = self.decode_all(data, chunk_size=7)
+        self.assertEqual(result, self.messages)
+
+    def test_length_frame_header(self):
+        payload = json.dumps(self.messages[0]).encode('utf-8')
+        frame = encode_message(self.messages[0], FRAMING_LENGTH)
+        self.assertEqual(frame, HEADER.pack(len(payload)) + payload)
+
+    def test_recv_into_path(self):
+        """Đọc thẳng vào buffer của decoder (get_buffer/buffer_updated), buffer nhỏ phải trượt/nới"""
+        big = {'type': 'CHAT', 'message': 'x' * 20000}
+        messages = self.messages * 50 + [big] + self.messages
+        for framing in (FRAMING_JSON, FRAMING_LENGTH):
+            source = memoryview(b''.join(encode_message(m, framing) for m in messages))
+            decoder = MessageDecoder(capacity=1024)
+            result = []
+            pos = 0
+            while pos < len(source):
+                target = decoder.get_buffer()
+                n = min(len(target), 1500, len(source) - pos)
+                target[:n] = source[pos:pos + n]
+                decoder.buffer_updated(n)
+                pos += n
+                result.extend(decoder)
+            self.assertEqual(result, messages, framing)
+            self.assertEqual(len(decoder._buffer), 1024)  # Trả lại bộ nhớ sau frame lớn
+
+    def test_invalid_frame_is_skipped(self):
+        decoder = MessageDecoder()
+        decoder.feed(HEADER.pack(3) + b'[1]' + encode_message({'type': 'PING'}, FRAMING_LENGTH))
+        with self.assertRaises(InvalidMessage):
+            decoder.next_message()
+        self.assertEqual(decoder.next_message(), {'type': 'PING'})
+
+    def test_oversized_frame(self):
+        decoder = MessageDecoder(max_frame_size=100)
+        decoder.feed(HEADER.pack(101))
+        with self.assertRaises(ProtocolError):
+            decoder.next_message()
+
+
+if __name__ == "__main__":
+    unittest.main()
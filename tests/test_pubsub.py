@@ -0,0 +1,94 @@
+# tests/test_pubsub.py - TESTS CHO PUB/SUB (topic phòng + sảnh chờ, nhiều node)
+import unittest
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.pubsub import LocalBus, PipeBus, TopicHub, LOBBY_TOPIC, room_topic
+
+
+class Recorder:
+    """deliver() giả: ghi lại mỗi lần fan-out"""
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, client_ids, message):
+        self.calls.append((sorted(client_ids), message))
+
+
+class TestLocalBus(unittest.TestCase):
+    def setUp(self):
+        self.deliver = Recorder()
+        self.bus = LocalBus(self.deliver)
+
+    def test_publish_excludes_sender(self):
+        for cid in (1, 2, 3):
+            self.bus.subscribe(room_topic('room_1'), cid)
+        self.bus.subscribe(LOBBY_TOPIC, 4)
+        self.bus.publish(room_topic('room_1'), {'type': 'CHAT'}, exclude=(1,))
+        self.assertEqual(self.deliver.calls, [([2, 3], {'type': 'CHAT'})])
+
+    def test_unsubscribe_all_and_drop_topic(self):
+        self.bus.subscribe(room_topic('room_1'), 1)
+        self.bus.subscribe(LOBBY_TOPIC, 1)
+        self.bus.subscribe(room_topic('room_1'), 2)
+        self.bus.unsubscribe_all(1)
+        self.assertEqual(self.bus.subscribers(room_topic('room_1')), {2})
+        self.bus.drop_topic(room_topic('room_1'))
+        self.assertEqual(self.bus.stats()['topics'], 0)
+        self.assertEqual(self.bus.clients, {})
+
+
+class TestPipeBus(unittest.TestCase):
+    """Hai node nối qua TopicHub (đồng bộ, thay cho pipe)"""
+
+    def setUp(self):
+        self.hub = TopicHub()
+        self.deliveries = [Recorder(), Recorder()]
+        self.buses = [PipeBus(self.deliveries[n], self.Link(self, n), n) for n in range(2)]
+
+    class Link:
+        def __init__(self, test, node):
+            self.test, self.node = test, node
+
+        def send(self, command):
+            self.test.hub.handle(self.node, command, self.test.to_node)
+
+    def to_node(self, node, command):
+        if command[0] == 'publish':
+            self.buses[node].receive(*command[1:])
+        elif command[0] == 'topic_nodes':
+            self.buses[node].set_topic_nodes(*command[1:])
+
+    def test_fan_out_once_per_node(self):
+        topic = room_topic('room_1')
+        self.buses[0].subscribe(topic, 1)
+        self.buses[0].subscribe(topic, 2)
+        for cid in (3, 4, 5):
+            self.buses[1].subscribe(topic, cid)
+
+        self.buses[0].publish(topic, {'type': 'OPPONENT_MOVE'}, exclude=(1,))
+        self.assertEqual(self.deliveries[0].calls, [([2], {'type': 'OPPONENT_MOVE'})])
+        self.assertEqual(self.deliveries[1].calls, [([3, 4, 5], {'type': 'OPPONENT_MOVE'})])
+        self.assertEqual(self.buses[0].stats()['forwarded'], 1)
+
+    def test_local_topics_stay_on_node(self):
+        topic = room_topic('room_1')
+        self.buses[0].subscribe(topic, 1)
+        self.buses[0].publish(topic, {'type': 'CHAT'})
+        self.buses[1].subscribe(LOBBY_TOPIC, 2)
+        self.buses[0].subscribe(LOBBY_TOPIC, 3)
+        self.buses[0].publish(LOBBY_TOPIC, {'type': 'LOBBY_DELTA'}, remote=False)
+        self.assertEqual(self.buses[0].stats()['forwarded'], 0)
+        self.assertEqual(self.deliveries[1].calls, [])
+
+        # Node 1 rời topic -> node 0 thôi gửi qua hub
+        self.buses[1].subscribe(topic, 2)
+        self.buses[1].unsubscribe(topic, 2)
+        self.buses[0].publish(topic, {'type': 'CHAT'})
+        self.assertEqual(self.buses[0].stats()['forwarded'], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
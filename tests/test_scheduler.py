@@ -0,0 +1,65 @@
+# tests/test_scheduler.py - TESTS CHO DeadlineScheduler (hạn lượt đi, heartbeat, chờ kết nối lại)
+import unittest
+import threading
+import time
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.scheduler import DeadlineScheduler
+
+
+class TestDeadlineScheduler(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = DeadlineScheduler()
+        self.fired = []
+        self.done = threading.Event()
+
+    def tearDown(self):
+        self.scheduler.stop()
+
+    def record(self, name, last=False):
+        self.fired.append((name, time.time()))
+        if last:
+            self.done.set()
+
+    def test_fires_in_deadline_order(self):
+        now = time.time()
+        self.scheduler.schedule('c', now + 0.15, self.record, 'c', True)
+        self.scheduler.schedule('a', now + 0.05, self.record, 'a')
+        self.scheduler.schedule('b', now + 0.10, self.record, 'b')
+        self.assertTrue(self.done.wait(2))
+        self.assertEqual([name for name, _ in self.fired], ['a', 'b', 'c'])
+        # Gọi đúng hạn, không đợi tới "tick" tiếp theo
+        for (name, fired_at), offset in zip(self.fired, (0.05, 0.10, 0.15)):
+            self.assertGreaterEqual(fired_at, now + offset)
+            self.assertLess(fired_at, now + offset + 0.2)
+
+    def test_reschedule_replaces_and_cancel(self):
+        self.scheduler.schedule_in('turn', 0.05, self.record, 'old')
+        self.scheduler.schedule_in('turn', 0.10, self.record, 'new')
+        self.scheduler.schedule_in('grace', 0.05, self.record, 'cancelled')
+        self.assertTrue(self.scheduler.cancel('grace'))
+        self.assertFalse(self.scheduler.cancel('grace'))
+        self.scheduler.schedule_in('end', 0.2, self.record, 'end', True)
+
+        self.assertTrue(self.done.wait(2))
+        self.assertEqual([name for name, _ in self.fired], ['new', 'end'])
+        self.assertEqual(len(self.scheduler), 0)
+
+    def test_replaced_entries_are_compacted(self):
+        for i in range(1000):
+            self.scheduler.schedule_in('turn', 60 + i, self.record, 'never')
+        stats = self.scheduler.stats()
+        self.assertEqual(stats['pending'], 1)
+        self.assertLessEqual(stats['heap_size'], 130)
+
+    def test_callback_error_does_not_stop_scheduler(self):
+        self.scheduler.schedule_in('bad', 0.01, lambda: 1 / 0)
+        self.scheduler.schedule_in('good', 0.05, self.record, 'good', True)
+        self.assertTrue(self.done.wait(2))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,218 @@
+# tests/test_server.py - TESTS CHO SERVER (chạy server thật trên port ngẫu nhiên)
+import unittest
+import tempfile
+import threading
+import socket
+import json
+import ssl
+import time
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.async_server import AsyncCaroServer
+from server.sharding import ShardedCaroServer, shard_of_room
+from shared.protocol import MessageDecoder, encode_message, FRAMING_LENGTH
+
+CERT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "certs", "server.crt")
+
+
+def open_client(port):
+    """Kết nối giống NetworkClient (SSL nếu có chứng chỉ)"""
+    raw_socket = socket.create_connection(('127.0.0.1', port), timeout=5)
+    if os.path.exists(CERT_PATH):
+        context = ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
+        context.load_verify_locations(CERT_PATH)
+        context.check_hostname = False
+        return context.wrap_socket(raw_socket, server_hostname='127.0.0.1')
+    return raw_socket
+
+
+def read_until(sock, msg_type, timeout=5):
+    """Đọc từ socket cho tới khi gặp message có type mong muốn"""
+    decoder = getattr(sock, 'decoder', None)
+    if decoder is None:
+        decoder = sock.decoder = MessageDecoder()
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        for message in decoder:
+            if message.get('type') == msg_type:
+                return message
+        decoder.feed(sock.recv(4096))
+    raise AssertionError(f"Không nhận được {msg_type}")
+
+
+class TestAsyncServer(unittest.TestCase):
+    """Chế độ asyncio phải nói cùng giao thức với server thread"""
+
+    def setUp(self):
+        self.temp_db = tempfile.NamedTemporaryFile(delete=False, suffix='.db')
+        self.db_path = self.temp_db.name
+        self.temp_db.close()
+
+        self.server = AsyncCaroServer(port=0, db_path=self.db_path)
+        self.thread = threading.Thread(target=self.server.start, daemon=True)
+        self.thread.start()
+        self.assertTrue(self.server.started.wait(5))
+
+    def tearDown(self):
+        self.server.stop()
+        self.thread.join(5)
+        if os.path.exists(self.db_path):
+            try:
+                os.unlink(self.db_path)
+            except:
+                pass
+
+    def test_ping_pong(self):
+        """PING được dispatch qua process_message và trả về PONG"""
+        with open_client(self.server.port) as sock:
+            sock.sendall(json.dumps({'type': 'PING'}).encode('utf-8'))
+            self.assertEqual(read_until(sock, 'PONG')['type'], 'PONG')
+
+    def test_length_framing_negotiation(self):
+        """Sau HELLO_ACK server gửi frame có độ dài; chat chứa '}' không làm hỏng framing"""
+        with open_client(self.server.port) as sock:
+            sock.sendall(encode_message({'type': 'HELLO', 'framing': FRAMING_LENGTH}))
+            self.assertEqual(read_until(sock, 'HELLO_ACK')['framing'], FRAMING_LENGTH)
+
+            burst = b''.join(encode_message(m, FRAMING_LENGTH) for m in [
+                {'type': 'CHAT', 'message': 'hi } {{ "quoted" \\'},
+                {'type': 'PING'},
+            ])
+            sock.sendall(burst)
+            raw = sock.recv(4096)
+            self.assertEqual(raw[:1], b'\x00')  # Header độ dài, không còn là '{'
+            sock.decoder.feed(raw)
+            self.assertEqual(read_until(sock, 'PONG')['type'], 'PONG')
+
+    def test_slow_database_does_not_block_loop(self):
+        """LOGIN chạy trên thread pool: client khác vẫn được trả lời, thứ tự của client giữ nguyên"""
+        authenticate = self.server.db.authenticate_user
+        def slow_authenticate(*args, **kwargs):
+            time.sleep(0.5)
+            return authenticate(*args, **kwargs)
+        self.server.db.authenticate_user = slow_authenticate
+
+        with open_client(self.server.port) as slow, open_client(self.server.port) as other:
+            slow.sendall(json.dumps({'type': 'LOGIN', 'username': 'player1', 'password': '123'}).encode('utf-8')
+                         + json.dumps({'type': 'PING'}).encode('utf-8'))
+            time.sleep(0.05)
+            start = time.time()
+            other.sendall(json.dumps({'type': 'PING'}).encode('utf-8'))
+            read_until(other, 'PONG')
+            self.assertLess(time.time() - start, 0.3)
+
+            read_until(slow, 'LOGIN_SUCCESS')
+            read_until(slow, 'PONG')  # Trả lời PING sau LOGIN_SUCCESS, không vượt lên trước
+
+    def test_login_and_many_connections(self):
+        """Nhiều kết nối cùng lúc trên một event loop"""
+        clients = [open_client(self.server.port) for _ in range(20)]
+        try:
+            clients[0].sendall(json.dumps({'type': 'LOGIN', 'username': 'player1', 'password': '123'}).encode('utf-8'))
+            message = read_until(clients[0], 'LOGIN_SUCCESS')
+            self.assertIn('display_name', message)
+            deadline = time.time() + 5
+            while len(self.server.clients) < 20 and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(len(self.server.clients), 20)
+        finally:
+            for sock in clients:
+                sock.close()
+
+
+class TestShardedServer(unittest.TestCase):
+    """Hai worker: phòng ở shard khác vẫn thấy trên sảnh, vào phòng thì client được chuyển shard"""
+
+    def setUp(self):
+        self.temp_db = tempfile.NamedTemporaryFile(delete=False, suffix='.db')
+        self.db_path = self.temp_db.name
+        self.temp_db.close()
+
+        self.server = ShardedCaroServer(port=0, db_path=self.db_path, workers=2, matchmaking_tick=0.05)
+        self.thread = threading.Thread(target=self.server.start, daemon=True)
+        self.thread.start()
+        self.assertTrue(self.server.started.wait(30))
+
+    def tearDown(self):
+        self.server.stop()
+        self.thread.join(10)
+        if os.path.exists(self.db_path):
+            try:
+                os.unlink(self.db_path)
+            except:
+                pass
+
+    def login(self, username, password='password'):
+        sock = open_client(self.server.port)
+        sock.sendall(json.dumps({'type': 'LOGIN', 'username': username, 'password': password}).encode('utf-8'))
+        read_until(sock, 'LOGIN_SUCCESS', timeout=30)  # Worker spawn có thể chậm
+        return sock
+
+    def test_room_ids_map_to_shards(self):
+        self.assertEqual([shard_of_room(f"room_{n}", 2) for n in range(1, 5)], [0, 1, 0, 1])
+        self.assertIsNone(shard_of_room('lobby', 2))
+
+    def test_join_room_on_other_shard(self):
+        owner, guest = self.login('alice'), self.login('bob')  # client 1 -> shard 1, client 2 -> shard 0
+        try:
+            owner.sendall(json.dumps({'type': 'CREATE_ROOM'}).encode('utf-8'))
+            room_id = read_until(owner, 'ROOM_CREATED')['room_id']
+            self.assertEqual(shard_of_room(room_id, 2), 1)
+
+            # Danh sách phòng của shard 1 được gộp vào sảnh của shard 0
+            deadline = time.time() + 5
+            while True:
+                guest.sendall(json.dumps({'type': 'GET_ROOMS'}).encode('utf-8'))
+                rooms = read_until(guest, 'ROOM_LIST')['rooms']
+                if any(r['id'] == room_id for r in rooms) or time.time() > deadline:
+                    break
+                time.sleep(0.05)
+            self.assertIn(room_id, [r['id'] for r in rooms])
+
+            guest.sendall(json.dumps({'type': 'JOIN_ROOM', 'room_id': room_id}).encode('utf-8'))
+            self.assertEqual(read_until(guest, 'ROOM_JOINED')['room_id'], room_id)
+            self.assertEqual(self.server.migrations, 1)
+
+            owner.sendall(json.dumps({'type': 'MOVE', 'x': 7, 'y': 7}).encode('utf-8'))
+            self.assertEqual(read_until(guest, 'OPPONENT_MOVE')['x'], 7)
+        finally:
+            owner.close()
+            guest.close()
+
+    def test_migrated_client_gets_fresh_lobby_snapshot(self):
+        """Version sảnh chờ là của từng shard: shard mới gửi snapshot khi nhận client"""
+        owner = self.login('alice')
+        guest = open_client(self.server.port)
+        try:
+            guest.sendall(encode_message({'type': 'HELLO', 'framing': FRAMING_LENGTH, 'features': ['lobby_deltas']}))
+            read_until(guest, 'HELLO_ACK', timeout=30)
+            guest.sendall(encode_message({'type': 'LOGIN', 'username': 'bob', 'password': 'password'}, FRAMING_LENGTH))
+            read_until(guest, 'LOBBY_SNAPSHOT')
+
+            owner.sendall(json.dumps({'type': 'CREATE_ROOM'}).encode('utf-8'))
+            room_id = read_until(owner, 'ROOM_CREATED')['room_id']
+            guest.sendall(encode_message({'type': 'JOIN_ROOM', 'room_id': room_id}, FRAMING_LENGTH))
+            snapshot = read_until(guest, 'LOBBY_SNAPSHOT')
+            self.assertIn(room_id, [r['id'] for r in snapshot['rooms']])
+            self.assertEqual(read_until(guest, 'ROOM_JOINED')['room_id'], room_id)
+        finally:
+            owner.close()
+            guest.close()
+
+    def test_quick_match_across_shards(self):
+        first, second = self.login('alice'), self.login('bob')
+        try:
+            for sock in (first, second):
+                sock.sendall(json.dumps({'type': 'QUICK_MATCH'}).encode('utf-8'))
+            joined = [read_until(sock, 'ROOM_JOINED') for sock in (first, second)]
+            self.assertEqual(joined[0]['room_id'], joined[1]['room_id'])
+        finally:
+            first.close()
+            second.close()
+
+
+if __name__ == "__main__":
+    unittest.main()